@@ -1,14 +1,50 @@
 from __future__ import print_function 
+import argparse
 import os
 import os.path
 import shutil
 import subprocess
 import sys
-import hashlib
+import json
 import time
 
+try:
+    from urllib2 import urlopen
+except ImportError:
+    from urllib.request import urlopen
+
+sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(__file__)), 'scripts'))
+from fingerprint import HashCache, combine, input_digests
+from repodata import parse_repomd
+from repos import DEFAULT_REPOS_CONFIG, load_repos, repos_config_path
+
 
 DIR_HERE = os.path.abspath(os.path.dirname(__file__))
+DOCKER_SNAPSHOT_DIR = '/root/centos7build/snapshot'
+DOCKER_REPOS_CONFIG = '/root/centos7build/repos.cfg'
+PROFILE_FILE_NAME = 'build-profile.json'
+# what the CentOS 7 kernel can mount
+SQUASHFS_COMPRESSIONS = ['xz', 'gzip', 'lzo']
+SQUASHFS_BLOCK_SIZES = [4, 8, 16, 32, 64, 128, 256, 512, 1024]
+
+# Named volumes outlive the '--rm' container, so the package store and livecd-creator's
+# cache are reused by the next build. Sizes are kept in check by scripts/cachectl.py.
+CACHE_VOLUMES = {
+    'yumdata': ('centos7iso-cache-yumdata', '/root/centos7build/output/yumdata'),
+    'isodb': ('centos7iso-cache-isodb', '/root/centos7build/output/isodb'),
+}
+DEFAULT_CACHE_LIMITS_MB = {'yumdata': 6144, 'isodb': 4096}
+
+# Finished ISOs are kept under the fingerprint of everything that goes into them: the
+# Dockerfile, scripts/ (packages.lock included), install/, the repo revisions and the
+# options that change the image. A build with the same fingerprint just takes the ISO.
+ISO_FILE_NAME = 'centos7.iso'
+ISO_CACHE_DIR = os.path.join(DIR_HERE, 'iso-cache')
+ISO_CACHE_KEEP = 3
+ISO_CACHE_DIGESTS = os.path.join(ISO_CACHE_DIR, 'digests.json')
+# hashed raw, the ISO carries some of these files as they are
+FINGERPRINT_INPUTS = ['Dockerfile', 'scripts', 'install']
+PACKAGES_LOCK_FILE = os.path.join(DIR_HERE, 'scripts', 'packages.lock')
 
 
 def cleanup_dir(dir_name):
@@ -24,22 +60,96 @@ def cleanup_dir(dir_name):
         os.makedirs(dir_name)
 
 
-def sha1_of_file(path):
-    state = hashlib.sha1()
-    with open(path, mode='rt') as _fh:
-        for ln in [ ln.rstrip('\r\n') for ln in _fh.readlines() ]:
-            payload = ln.strip()
-            if payload and not payload.startswith('#'):
-                state.update(payload)
-    return state.hexdigest()
+def docker_template_digest(path):
+    # comments and blank lines of the Dockerfile do not make a new image
+    return HashCache().digest(path)
+
+
+def repo_revisions(snapshot_mode, snapshot_dir, repos_config):
+    # livecd-creator resolves the live rootfs against the repos as they are at build time,
+    # so their revisions are inputs too; a snapshot bundle pins them
+    if snapshot_mode == 'import':
+        with open(os.path.join(snapshot_dir, 'index.json'), mode='rt') as fh:
+            index = json.load(fh)
+        return dict([ (repo_id, entry['revision']) for repo_id, entry in index['repos'].items() ])
+    revisions = {}
+    for repo in load_repos(repos_config):
+        fh = urlopen(repo.baseurl.rstrip('/') + '/repodata/repomd.xml', timeout=30)
+        try:
+            revisions[repo.id] = parse_repomd(fh).revision
+        finally:
+            fh.close()
+    return revisions
+
+
+def build_fingerprint(revisions, options, snapshot_dir=None, repos_config=None):
+    cache = HashCache(ISO_CACHE_DIGESTS)
+    digests = input_digests(cache, [], [ os.path.join(DIR_HERE, name) for name in FINGERPRINT_INPUTS ], root=DIR_HERE)
+    values = dict([ ('repo.{}'.format(repo_id), revision) for repo_id, revision in revisions.items() ])
+    values.update([ ('option.{}'.format(name), json.dumps(value)) for name, value in options.items() ])
+    if snapshot_dir:
+        values['snapshot'] = cache.digest(os.path.join(snapshot_dir, 'index.json'), raw=True)
+    # the mirrors, also when REPOS_CONFIG points outside of scripts/
+    if repos_config:
+        values['repos_config'] = cache.digest(repos_config, raw=True)
+    cache.save()
+    return combine(digests, values)
+
+
+def source_date_epoch(revisions, fingerprint):
+    # the newest repo revision (a unix time on CentOS mirrors) keeps the image dates
+    # meaningful and the yumdata and golden stages unchanged while only scripts or install/
+    # change; create-iso.sh adds an offset taken from the fingerprint for the ISO itself
+    numeric = [ int(r) for r in revisions.values() if r and r.isdigit() ]
+    return max(numeric) if numeric else int(fingerprint[:8], 16)
+
+
+def link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except (AttributeError, OSError):
+        shutil.copy2(src, dst)
+
 
+def restore_cached_iso(fingerprint, output_dir):
+    cached = os.path.join(ISO_CACHE_DIR, fingerprint, ISO_FILE_NAME)
+    if not os.path.isfile(cached):
+        return False
+    link_or_copy(cached, os.path.join(output_dir, ISO_FILE_NAME))
+    os.utime(os.path.dirname(cached), None)
+    return True
 
-def build():
+
+def store_cached_iso(fingerprint, output_dir):
+    entry_dir = os.path.join(ISO_CACHE_DIR, fingerprint)
+    tmp_dir = entry_dir + '.tmp'
+    if os.path.isdir(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+    link_or_copy(os.path.join(output_dir, ISO_FILE_NAME), os.path.join(tmp_dir, ISO_FILE_NAME))
+    if os.path.isdir(entry_dir):
+        shutil.rmtree(entry_dir)
+    os.rename(tmp_dir, entry_dir)
+    print("ISO cache: stored as '{}'".format(fingerprint))
+    # the least recently built or used entries go first
+    entries = sorted([ os.path.join(ISO_CACHE_DIR, name) for name in os.listdir(ISO_CACHE_DIR)
+        if os.path.isdir(os.path.join(ISO_CACHE_DIR, name)) and not name.endswith('.tmp') ], key=os.path.getmtime, reverse=True)
+    for path in entries[ISO_CACHE_KEEP:]:
+        print("ISO cache: evicting '{}'".format(os.path.basename(path)))
+        shutil.rmtree(path)
+
+
+def drop_cache_volumes():
+    for name, _ in CACHE_VOLUMES.values():
+        print("Docker: removing cache volume '{}'".format(name))
+        subprocess.call(['docker', 'volume', 'rm', '-f', name])
+
+
+def build(snapshot_mode=None, snapshot_dir=None, cache_limits_mb=DEFAULT_CACHE_LIMITS_MB, cold=False, jobs=4, compression='xz', block_size=None, iso_cache=True, golden_image=True, refresh_lock=False):
     docker_instance_name = 'centos7iso-{}'.format(int(time.time()))
 
     docker_makefile = os.path.join(DIR_HERE, 'Dockerfile')
-    docker_makefile_sha1 = sha1_of_file(docker_makefile)
-    docker_template_name = 'centos7iso-{}'.format(docker_makefile_sha1)
+    docker_template_name = 'centos7iso-{}'.format(docker_template_digest(docker_makefile)[:40])
 
     output_dir = os.path.join(DIR_HERE, 'build')
     cleanup_dir(output_dir)
@@ -53,16 +163,64 @@ def build():
         install_dir_in_docker_format = install_dir_in_docker_format.replace('\\','/')
         output_dir_in_docker_format = output_dir_in_docker_format.replace('\\','/')
 
+    # REPOS_CONFIG points the build at other mirrors, as it does for make in the container;
+    # an imported snapshot brings its own
+    repos_config = None if snapshot_mode == 'import' else os.path.abspath(repos_config_path())
+    repos_config_args = ''
+    if repos_config and repos_config != DEFAULT_REPOS_CONFIG:
+        repos_config_args = '-v {}:{}:ro -e REPOS_CONFIG={}'.format(
+            repos_config.replace('\\','/') if sys.platform == 'win32' else repos_config, DOCKER_REPOS_CONFIG, DOCKER_REPOS_CONFIG)
+
+    snapshot_args = ''
+    if snapshot_mode:
+        snapshot_dir = os.path.abspath(snapshot_dir)
+        if snapshot_mode == 'export' and not os.path.isdir(snapshot_dir):
+            os.makedirs(snapshot_dir)
+        if not os.path.isdir(snapshot_dir):
+            raise Exception("Snapshot directory not found: '{}'".format(snapshot_dir))
+        snapshot_dir_in_docker_format = snapshot_dir.replace('\\','/') if sys.platform == 'win32' else snapshot_dir
+        snapshot_args = '-v {}:{} -e SNAPSHOT_MODE={} -e SNAPSHOT_DIR={}'.format(
+            snapshot_dir_in_docker_format, DOCKER_SNAPSHOT_DIR, snapshot_mode, DOCKER_SNAPSHOT_DIR)
+
+    # an export has to run the build to write the bundle, it never comes from the cache
+    lock_existed = os.path.isfile(PACKAGES_LOCK_FILE)
+    fingerprint = None
+    revisions = {}
+    options = {'compression': compression, 'block_size': block_size, 'snapshot': snapshot_mode == 'import', 'golden_image': golden_image}
+    if snapshot_mode != 'export':
+        try:
+            revisions = repo_revisions(snapshot_mode, snapshot_dir, repos_config)
+            fingerprint = build_fingerprint(revisions, options, snapshot_dir if snapshot_mode == 'import' else None, repos_config)
+        except Exception as exc:
+            print("ISO cache: can't read the repo revisions, the build is not reproducible: {}".format(exc))
+    if fingerprint:
+        print("Build fingerprint: '{}'".format(fingerprint))
+        if iso_cache and not cold and not refresh_lock and restore_cached_iso(fingerprint, output_dir):
+            print("ISO cache: hit, '{}' is up to date".format(os.path.join(output_dir, ISO_FILE_NAME)))
+            return
+
+    if cold:
+        drop_cache_volumes()
+    cache_args = ' '.join([ '-v {}:{} -e CACHE_{}_LIMIT_MB={}'.format(name, mountpoint, cache_id.upper(), cache_limits_mb[cache_id])
+        for cache_id, (name, mountpoint) in sorted(CACHE_VOLUMES.items()) ])
+
     docker_version = subprocess.check_output(['docker', '--version'], cwd=DIR_HERE).split('\n')[0]
     print(docker_version)
     print("Docker: instance name: '{}'".format(docker_instance_name))
     print("Docker: template name: '{}'".format(docker_template_name))
     print("Docker: scripts directory: '{}'".format(scripts_dir_in_docker_format))
     print("Docker: output directory: '{}'".format(output_dir_in_docker_format))
+    print("Docker: cache volumes: {}".format(', '.join([ name for name, _ in sorted(CACHE_VOLUMES.values()) ])))
+    if repos_config_args:
+        print("Docker: repos config: '{}'".format(repos_config))
+    if snapshot_mode:
+        print("Docker: snapshot {}: '{}'".format(snapshot_mode, snapshot_dir))
 
     build_docker_image_cmd = ['docker', 'build', '-t', docker_template_name, '.']
     print("EXEC: {}".format(' '.join(build_docker_image_cmd)))
+    docker_build_started = time.time()
     subprocess.check_call(build_docker_image_cmd, shell=False, cwd=DIR_HERE)
+    docker_build_time = time.time() - docker_build_started
 
     build_in_docker_cmd = """
         docker run
@@ -71,6 +229,15 @@ def build():
         -v {scripts_dir_in_docker_format}:/root/centos7build/scripts
         -v {install_dir_in_docker_format}:/root/centos7build/install
         -v {output_dir_in_docker_format}:/root/centos7build/docker_output
+        -e BUILD_JOBS={jobs}
+        -e ISO_COMPRESSION={compression}
+        -e GOLDEN_IMAGE={golden_image}
+        -e YUMDATA_REFRESH_LOCK={refresh_lock}
+        {block_size_args}
+        {epoch_args}
+        {cache_args}
+        {repos_config_args}
+        {snapshot_args}
         -w /root/centos7build/scripts
         {docker_template_name} bash -e build-iso.sh
     """.format(**{
@@ -79,13 +246,73 @@ def build():
         'scripts_dir_in_docker_format': scripts_dir_in_docker_format,
         'install_dir_in_docker_format': install_dir_in_docker_format,
         'output_dir_in_docker_format': output_dir_in_docker_format,
+        'jobs': jobs,
+        'compression': compression,
+        'golden_image': 1 if golden_image else 0,
+        'refresh_lock': 1 if refresh_lock else 0,
+        'block_size_args': '-e ISO_BLOCK_SIZE={}'.format(block_size) if block_size else '',
+        'epoch_args': '-e SOURCE_DATE_EPOCH={} -e BUILD_FINGERPRINT={}'.format(source_date_epoch(revisions, fingerprint), fingerprint) if fingerprint else '',
+        'cache_args': cache_args,
+        'repos_config_args': repos_config_args,
+        'snapshot_args': snapshot_args,
     }).split()
 
     print("EXEC: {}".format(' '.join(build_in_docker_cmd)))
-    subprocess.check_call(build_in_docker_cmd, shell=False)
+    docker_run_started = time.time()
+    try:
+        subprocess.check_call(build_in_docker_cmd, shell=False)
+    finally:
+        add_docker_timings(os.path.join(output_dir, PROFILE_FILE_NAME), docker_build_time, time.time() - docker_run_started)
+
+    if fingerprint and iso_cache:
+        # a refresh rewrote packages.lock, or the first build of a fresh checkout wrote
+        # it: the ISO is stored under the fingerprint the next build will see
+        if refresh_lock or not lock_existed:
+            fingerprint = build_fingerprint(revisions, options, snapshot_dir if snapshot_mode == 'import' else None, repos_config)
+        store_cached_iso(fingerprint, output_dir)
+
+
+def add_docker_timings(profile_file, docker_build_time, docker_run_time):
+    # the stages inside the container are profiled by scripts/stage.py,
+    # what only the host can see is added to the same file
+    profile = {}
+    if os.path.isfile(profile_file):
+        with open(profile_file, mode='rt') as fh:
+            profile = json.load(fh)
+    profile['docker_build'] = docker_build_time
+    profile['docker_run'] = docker_run_time
+    with open(profile_file, mode='wt') as fh:
+        json.dump(profile, fh, indent=2, sort_keys=True)
+    print('')
+    print('{:<24}{:>9.1f}s'.format('docker build', docker_build_time))
+    print('{:<24}{:>9.1f}s'.format('docker run', docker_run_time))
+    if 'wall' in profile:
+        print('{:<24}{:>9.1f}s'.format('  stages', profile['wall']))
+        print('{:<24}{:>9.1f}s'.format('  container overhead', docker_run_time - profile['wall']))
+    print("Build profile: '{}'".format(profile_file))
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--snapshot', metavar='DIR', help='build offline from a snapshot bundle exported earlier')
+    group.add_argument('--snapshot-export', metavar='DIR', help='export a snapshot bundle of everything the build downloads')
+    parser.add_argument('--cold', action='store_true', help='drop the cache volumes and build from scratch')
+    parser.add_argument('--cache-limit-yumdata', type=int, default=DEFAULT_CACHE_LIMITS_MB['yumdata'], metavar='MB')
+    parser.add_argument('--cache-limit-isodb', type=int, default=DEFAULT_CACHE_LIMITS_MB['isodb'], metavar='MB')
+    parser.add_argument('--jobs', type=int, default=4, help='build stages run in parallel (make -j)')
+    parser.add_argument('--compression', default='xz', choices=SQUASHFS_COMPRESSIONS, help='squashfs compression of the live rootfs')
+    parser.add_argument('--block-size', type=int, choices=SQUASHFS_BLOCK_SIZES, metavar='KB', help='squashfs block size of the live rootfs in KiB')
+    parser.add_argument('--no-iso-cache', action='store_true', help='build even when an ISO for the same inputs is cached')
+    parser.add_argument('--no-golden-image', action='store_true', help='leave out the golden image, nodes install the packages with anaconda')
+    parser.add_argument('--refresh-lock', action='store_true', help='resolve scripts/packages.lock again against the current repos')
+    args = parser.parse_args()
+    cache_limits_mb = {'yumdata': args.cache_limit_yumdata, 'isodb': args.cache_limit_isodb}
     print('Build is started ...')
-    build()
+    if args.snapshot:
+        build('import', args.snapshot, cache_limits_mb, args.cold, args.jobs, args.compression, args.block_size, not args.no_iso_cache, not args.no_golden_image, args.refresh_lock)
+    elif args.snapshot_export:
+        build('export', args.snapshot_export, cache_limits_mb, args.cold, args.jobs, args.compression, args.block_size, golden_image=not args.no_golden_image, refresh_lock=args.refresh_lock)
+    else:
+        build(cache_limits_mb=cache_limits_mb, cold=args.cold, jobs=args.jobs, compression=args.compression, block_size=args.block_size, iso_cache=not args.no_iso_cache, golden_image=not args.no_golden_image, refresh_lock=args.refresh_lock)
     print('Build finished.')
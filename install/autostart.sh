@@ -3,9 +3,9 @@ set -e
 
 DIR_HERE=$(cd $(dirname $0) && pwd)
 
-python "$DIR_HERE/os-bootstrap.py" --install
-python "$DIR_HERE/os-config-tui.py"
-python "$DIR_HERE/os-install-tui.py" "$DIR_HERE/os-logwrap.py"
+# bootstrap, config and install run as phases of one interpreter
+export OS_STARTUP_T0="${OS_STARTUP_T0:-$(date +%s.%N)}"
+python "$DIR_HERE/os-frontend.py"
 
 if [ -f '/tmp/os-install.ok' ]; then
     echo "Installation has been completed successfully."
@@ -2,11 +2,64 @@ from __future__ import print_function
 import ConfigParser
 import os
 import os.path
+import re
 import struct
 import sys
+from os_netinfo import NetInventory
 
 
 APP_CONFIG_FILE = '/tmp/os-config.ini'
+APP_CONFIG_FILE_TMP = '/tmp/os-config.tmp'
+HASHED_ROOT_PASSWORD_FILE = '/root/os-config.shadow'
+HASHED_ROOT_PASSWORD_FILE_TMP = '/root/os-config.shadow.tmp'
+# configured when no NIC is found
+DEFAULT_NIC = 'eth0'
+
+# Zero-touch installs: the host name and network settings of a node come from the kernel
+# command line, or from the entry of one of its MAC addresses in the node inventory on
+# the ISO (install/os-inventory.ini). A node that is found this way skips the config TUI
+# and its countdown and goes straight to the installation.
+#
+#   os.hostname=web01
+#   os.net=<nic>:dhcp                                        repeated for more NICs,
+#   os.net=<nic>:<ip>:<netmask>:<gateway>[:<dns>[,<dns>]]    <nic> is a name or a MAC
+#   os.inventory=<path>                                      another node inventory
+#   os.unattended=0|1                                        0 keeps the TUI, 1 skips it
+#                                                            even without settings
+#
+# An inventory entry is a section named by the MAC address: 'hostname', 'rootpw_hash'
+# and the NIC options (bootproto, ip, netmask, gateway, nameserver, onboot) for the NIC
+# with that MAC, '<nic>.<option>' for the other NICs. The command line wins over the entry.
+KERNEL_CMDLINE_FILE = '/proc/cmdline'
+NODE_INVENTORY_FILE = '/run/initramfs/live/os-inventory.ini'
+NIC_OPTIONS = ('bootproto', 'ip', 'netmask', 'gateway', 'nameserver', 'onboot')
+STATIC_OPTIONS = ('ip', 'netmask', 'gateway', 'nameserver')
+_RE_HOSTNAME = re.compile(r'^[0-9A-Za-z\-\.]+$')
+_RE_MAC = re.compile(r'^[0-9a-fA-F]{2}([:-][0-9a-fA-F]{2}){5}$')
+
+
+class NodeConfigError(Exception):
+    def __init__(self, text):
+        Exception.__init__(self, text)
+
+
+class NodeConfig:
+    def __init__(self):
+        self.source = []
+        self.hostname = None
+        self.rootpw_hash = None
+        self.nics = {} # NIC name -> {option: value}
+        self.nic_order = []
+        self.unattended = None
+
+    def nic(self, name):
+        if name not in self.nics:
+            self.nics[name] = {}
+            self.nic_order.append(name)
+        return self.nics[name]
+
+    def is_given(self):
+        return self.hostname is not None or bool(self.nics)
 
 
 def generate_app_config():
@@ -20,17 +73,196 @@ def generate_app_config():
     config.add_section('main')
     config.set('main', 'hostname', hostname)
 
-    config.add_section('eth0')
-    config.set('eth0', 'bootproto', 'dhcp')
+    # a section per NIC, DHCP everywhere; only the first NIC with a link comes up on boot
+    inventory = NetInventory()
+    names = inventory.names() or [ DEFAULT_NIC ]
+    linked = [ nic.name for nic in inventory.interfaces if nic.has_link() ]
+    primary = linked[0] if linked else names[0]
+    for name in names:
+        config.add_section(name)
+        config.set(name, 'bootproto', 'dhcp')
+        config.set(name, 'onboot', 'yes' if name == primary else 'no')
 
     with open(APP_CONFIG_FILE, 'wb') as configfile:
         config.write(configfile)
 
 
+def normalize_mac(mac):
+    return mac.strip().lower().replace('-', ':')
+
+
+def parse_kernel_cmdline(text):
+    # 'os.*' parameters; all values of a repeated parameter are kept in order
+    params = {}
+    for token in text.split():
+        name, sep, value = token.partition('=')
+        if name.startswith('os.') and sep:
+            params.setdefault(name, []).append(value)
+    return params
+
+
+def load_node_inventory(path):
+    # normalized MAC -> {option: value}, read once so a lookup is a dict access
+    entries = {}
+    if not os.path.isfile(path):
+        return entries
+    config = ConfigParser.RawConfigParser()
+    config.optionxform=str
+    config.read(path)
+    for section in config.sections():
+        if not _RE_MAC.match(section.strip()):
+            raise NodeConfigError("Node inventory '{}': section '{}' is not a MAC address.".format(path, section))
+        entries[normalize_mac(section)] = dict([ (k, v.strip()) for k, v in config.items(section) ])
+    return entries
+
+
+def resolve_nic_name(ref, inventory):
+    # a NIC given by name or by MAC address
+    if not _RE_MAC.match(ref):
+        return ref
+    for nic in inventory.interfaces:
+        if nic.mac and normalize_mac(nic.mac) == normalize_mac(ref):
+            return nic.name
+    raise NodeConfigError("No NIC with MAC address '{}'.".format(ref))
+
+
+def parse_net_spec(spec, inventory):
+    # a MAC address as <nic> is written with '-', the fields are separated by ':'
+    bits = spec.split(':')
+    name = resolve_nic_name(bits[0], inventory)
+    if bits[1:] == ['dhcp']:
+        return name, {'bootproto': 'dhcp'}
+    if len(bits) not in (4, 5):
+        raise NodeConfigError("Invalid 'os.net={}', expected <nic>:dhcp or <nic>:<ip>:<netmask>:<gateway>[:<dns>].".format(spec))
+    options = {'bootproto': 'static', 'ip': bits[1], 'netmask': bits[2], 'gateway': bits[3]}
+    if len(bits) == 5 and bits[4]:
+        options['nameserver'] = bits[4]
+    return name, options
+
+
+def apply_inventory_entry(node, entry, nic_name):
+    for option, value in entry.items():
+        if option == 'hostname':
+            node.hostname = value
+        elif option == 'rootpw_hash':
+            node.rootpw_hash = value
+        elif option in NIC_OPTIONS:
+            node.nic(nic_name)[option] = value
+        elif '.' in option and option.split('.', 1)[1] in NIC_OPTIONS:
+            name, nic_option = option.split('.', 1)
+            node.nic(name)[nic_option] = value
+        else:
+            raise NodeConfigError("Unknown option '{}' in the node inventory.".format(option))
+
+
+def resolve_node_config(cmdline_params, node_inventory, inventory):
+    node = NodeConfig()
+    for nic in inventory.interfaces:
+        entry = node_inventory.get(normalize_mac(nic.mac)) if nic.mac else None
+        if entry is not None:
+            node.source.append('inventory entry {}'.format(nic.display_mac()))
+            apply_inventory_entry(node, entry, nic.name)
+            break
+    if 'os.hostname' in cmdline_params or 'os.net' in cmdline_params:
+        node.source.append('kernel command line')
+    if 'os.hostname' in cmdline_params:
+        node.hostname = cmdline_params['os.hostname'][-1]
+    for spec in cmdline_params.get('os.net', []):
+        name, options = parse_net_spec(spec, inventory)
+        node.nic(name).clear()
+        node.nic(name).update(options)
+    if 'os.unattended' in cmdline_params:
+        node.unattended = cmdline_params['os.unattended'][-1] not in ('0', 'no', 'off')
+    return node
+
+
+def is_valid_ip_v4(ip):
+    if ip.count('.') != 3:
+        return False
+    return all([ v.isdigit() and int(v) < 256 for v in ip.split('.') ])
+
+
+def is_valid_host_name(hostname):
+    if len(hostname) > 253 or hostname.startswith('.') or hostname.startswith('-'):
+        return False
+    if not _RE_HOSTNAME.match(hostname):
+        return False
+    return all([ v and len(v) <= 63 for v in hostname.split('.') ])
+
+
+def validate_node_config(node):
+    if node.hostname is not None and not is_valid_host_name(node.hostname):
+        raise NodeConfigError("Invalid host name '{}'.".format(node.hostname))
+    for name in node.nic_order:
+        options = node.nics[name]
+        bootproto = options.get('bootproto', 'dhcp')
+        if bootproto not in ('dhcp', 'static'):
+            raise NodeConfigError("NIC {}: invalid bootproto '{}'.".format(name, bootproto))
+        if options.get('onboot', 'yes') not in ('yes', 'no'):
+            raise NodeConfigError("NIC {}: onboot must be 'yes' or 'no'.".format(name))
+        if bootproto == 'static':
+            for option in ('ip', 'netmask', 'gateway'):
+                if not is_valid_ip_v4(options.get(option, '')):
+                    raise NodeConfigError("NIC {}: invalid {} '{}'.".format(name, option, options.get(option, '')))
+            for nameserver in options.get('nameserver', '').replace(',', ' ').split():
+                if not is_valid_ip_v4(nameserver):
+                    raise NodeConfigError("NIC {}: invalid nameserver '{}'.".format(name, nameserver))
+
+
+def write_node_config(node):
+    config = ConfigParser.RawConfigParser()
+    config.optionxform=str
+    config.read(APP_CONFIG_FILE)
+    if node.hostname is not None:
+        config.set('main', 'hostname', node.hostname)
+    for name in node.nic_order:
+        options = node.nics[name]
+        if not config.has_section(name):
+            config.add_section(name)
+        bootproto = options.get('bootproto', 'dhcp')
+        config.set(name, 'bootproto', bootproto)
+        config.set(name, 'onboot', options.get('onboot', 'yes'))
+        for option in STATIC_OPTIONS:
+            if bootproto == 'static' and option in options:
+                config.set(name, option, ','.join(options[option].replace(',', ' ').split()))
+            else:
+                config.remove_option(name, option)
+    with open(APP_CONFIG_FILE_TMP, 'wb') as configfile:
+        config.write(configfile)
+    os.rename(APP_CONFIG_FILE_TMP, APP_CONFIG_FILE)
+    if node.rootpw_hash:
+        with open(HASHED_ROOT_PASSWORD_FILE_TMP, 'wt') as fh:
+            print(node.rootpw_hash, end='', file=fh)
+        os.rename(HASHED_ROOT_PASSWORD_FILE_TMP, HASHED_ROOT_PASSWORD_FILE)
+
+
+def apply_node_config():
+    # True when the node is to be installed unattended, with the settings written to
+    # APP_CONFIG_FILE. Settings that cannot be used are reported and leave it to the TUI.
+    try:
+        with open(KERNEL_CMDLINE_FILE, mode='rt') as fh:
+            params = parse_kernel_cmdline(fh.read())
+    except IOError:
+        params = {}
+    try:
+        inventory_file = params.get('os.inventory', [NODE_INVENTORY_FILE])[-1]
+        node = resolve_node_config(params, load_node_inventory(inventory_file), NetInventory())
+        validate_node_config(node)
+    except (NodeConfigError, ConfigParser.Error) as ex:
+        print('[bootstrap] no unattended install: {}'.format(ex))
+        return False
+    if node.is_given() or node.rootpw_hash:
+        write_node_config(node)
+        print('[bootstrap] node settings from {}'.format(', '.join(node.source)))
+    return node.unattended if node.unattended is not None else node.is_given()
+
+
 def main():
     install = True if '--install' in sys.argv else None
     if install:
         generate_app_config()
+        if apply_node_config():
+            print('[bootstrap] unattended install')
     else:
         print('os-bootstrap.py - invalid call')
         exit(1)
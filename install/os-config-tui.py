@@ -1,18 +1,20 @@
 from __future__ import print_function
 import atexit
 import base64
-import fcntl
+import ctypes
+import ctypes.util
+import errno
 import os
 import os.path
 import re
 import signal
-import socket
 import struct
 import sys
+import time
 import traceback
 import urwid
 import ConfigParser
-import subprocess
+from os_netinfo import NetInventory, start_link_watcher
 
 
 AUTOMATIC_INSTALL_TIMEOUT = 15 # seconds
@@ -21,6 +23,9 @@ APP_CONFIG_FILE_TMP = '/tmp/os-config.tmp'
 HASHED_ROOT_PASSWORD_FILE = '/root/os-config.shadow'
 HASHED_ROOT_PASSWORD_FILE_TMP = '/root/os-config.shadow.tmp'
 APP_NO_TIMER_STAMP_FILE = '/tmp/os-notimer.hook'
+# scripts/bench-startup.py: the time from OS_STARTUP_T0 to the first frame is appended
+# to this file, then the TUI quits
+STARTUP_BENCHMARK_FILE = os.environ.get('OS_STARTUP_BENCHMARK')
 EXIT_CODE = 1
 SIG_ARG_SEPARATOR = '&'
 SIG_ARG_DATA_SEPARATOR = '#'
@@ -45,13 +50,16 @@ TEXT_AUTOMATIC_INSTALL = 'The installation will start in {} seconds. Press any k
 TEXT_AUTOMATIC_INSTALL_CANCELLED = 'Automatic installation has been cancelled.'
 TEXT_ELEMENT_HOSTNAME = 'Host name'
 TEXT_ELEMENT_ROOTPASSWORD = 'Password for user "root"'
-TEXT_ELEMENT_ETH0 = 'Network settings (NIC eth0)'
-TEXT_ELEMENT_ETH0_MAC = 'Network settings (NIC eth0,\nMAC {})'
+TEXT_ELEMENT_NETWORK = 'Network settings'
+TEXT_ELEMENT_NIC = 'Network settings (NIC {})'
+TEXT_ELEMENT_NIC_MAC = 'Network settings (NIC {},\nMAC {})'
 TEXT_ELEMENT_TARGET_DEVICE = 'Install to: /dev/sda'
 TEXT_ELEMENT_TARGET_DEVICE_WARNING = 'All data on /dev/sda will be LOST.'
 TEXT_ELEMENT_VALUE_NOT_GIVEN = '<Not specified>'
 TEXT_ELEMENT_VALUE_USE_DHCP = 'Use DHCP'
 TEXT_ELEMENT_VALUE_STATIC_IP = 'Set static IP address'
+TEXT_ELEMENT_VALUE_DISABLED = 'Do not activate on boot'
+TEXT_ELEMENT_VALUE_NIC_NOT_FOUND = 'Not found on this machine'
 TEXT_ELEMENT_IP_ADDRESS = 'IP address'
 TEXT_ELEMENT_SUBNET_MASK = 'Subnet mask'
 TEXT_ELEMENT_DEFAULT_GATEWAY = 'Default gateway'
@@ -63,8 +71,9 @@ TEXT_HOSTNAME_DIALOG_CAPTION = 'Specify the host name'
 TEXT_PASSWD_DIALOG_CAPTION = 'Change the password for user "root"'
 TEXT_PASSWD_DIALOG_PASSWD1 = 'New password'
 TEXT_PASSWD_DIALOG_PASSWD2 = 'Confirm password'
-TEXT_ETH0_DIALOG_CAPTION = 'Change network settings for NIC eth0'
-TEXT_ETH0_STATIC_DIALOG_CAPTION = 'Set a static IP address for NIC eth0'
+TEXT_NICS_DIALOG_CAPTION = 'Select the NIC to configure'
+TEXT_NIC_DIALOG_CAPTION = 'Change network settings for NIC {}'
+TEXT_NIC_STATIC_DIALOG_CAPTION = 'Set a static IP address for NIC {}'
 TEXT_BUTTON_APPLY = 'Apply'
 TEXT_BUTTON_CANCEL = 'Cancel'
 TEXT_ELEMENT_ESC_TO_EXIT = 'Press <ESC> to exit'
@@ -154,62 +163,112 @@ class StaticNetworkConfig:
         self.nameserver = None
 
 
+class NicConfig:
+    def __init__(self, name):
+        self.name = name
+        self.use_dhcp = None
+        self.onboot = True
+        self.static = StaticNetworkConfig()
+
+
 class AppConfig:
     def __init__(self):
         self.error_text = None
         self.hostname = None
         self.hostname_overlay = None
-        self.eth0_mac_address = None
-        self.eth0_use_dhcp = None
-        self.eth0_static = StaticNetworkConfig()
-        self.eth0_static_overlay = StaticNetworkConfig()
-        self.eth0_static_overlay_last_error = None
+        self.inventory = None
+        self.nics = []
+        self.nic_selected = None
+        self.nic_static_overlay = StaticNetworkConfig()
+        self.nic_static_overlay_last_error = None
         self.iso_version = None
         self.target_version = None
 
-    def eth0_describe(self):
-        if self.eth0_use_dhcp is not None:
-            details = [TEXT_ELEMENT_VALUE_USE_DHCP if self.eth0_use_dhcp else TEXT_ELEMENT_VALUE_STATIC_IP]
-            if not self.eth0_use_dhcp:
+    def get_nic(self, name=None):
+        # the NIC the network dialogs edit when no name is given
+        if name is None:
+            name = self.nic_selected
+        for nic in self.nics:
+            if nic.name == name:
+                return nic
+        return None
+
+    def add_inventory_nics(self):
+        # NICs that showed up after os-bootstrap.py wrote the config are not activated on boot
+        added = False
+        for name in self.inventory.names():
+            if self.get_nic(name) is None:
+                nic = NicConfig(name)
+                nic.use_dhcp = True
+                nic.onboot = False
+                self.nics.append(nic)
+                added = True
+        return added
+
+    def refresh_inventory(self, names):
+        # 'names' as LinkWatcher.read_changes() gives them; True if anything shown changed
+        changed = self.inventory.refresh(names)
+        return self.add_inventory_nics() or changed
+
+    def nic_caption(self, nic):
+        info = self.inventory.get(nic.name) if self.inventory is not None else None
+        if info is None or info.display_mac() is None:
+            return TEXT_ELEMENT_NIC.format(nic.name)
+        return TEXT_ELEMENT_NIC_MAC.format(nic.name, info.display_mac())
+
+    def nic_link_describe(self, nic):
+        info = self.inventory.get(nic.name) if self.inventory is not None else None
+        if info is None:
+            return TEXT_ELEMENT_VALUE_NIC_NOT_FOUND
+        return info.describe_link()
+
+    def nic_describe(self, nic):
+        if nic.use_dhcp is not None:
+            details = [self.nic_link_describe(nic)]
+            if not nic.onboot:
+                details += [TEXT_ELEMENT_VALUE_DISABLED]
+                return '\n'.join(details)
+            details += [TEXT_ELEMENT_VALUE_USE_DHCP if nic.use_dhcp else TEXT_ELEMENT_VALUE_STATIC_IP]
+            if not nic.use_dhcp:
                 align = 2 + max([len(TEXT_ELEMENT_IP_ADDRESS), len(TEXT_ELEMENT_SUBNET_MASK), len(TEXT_ELEMENT_DEFAULT_GATEWAY), len(TEXT_ELEMENT_DNS_SERVERS)])
                 # ip address
-                details += [ '{}{}'.format(''.join([TEXT_ELEMENT_IP_ADDRESS, ':']).ljust(align), self.eth0_static.ip if self.eth0_static.ip is not None else TEXT_ELEMENT_VALUE_NOT_GIVEN) ]
+                details += [ '{}{}'.format(''.join([TEXT_ELEMENT_IP_ADDRESS, ':']).ljust(align), nic.static.ip if nic.static.ip is not None else TEXT_ELEMENT_VALUE_NOT_GIVEN) ]
                 # netmask
-                details += [ '{}{}'.format(''.join([TEXT_ELEMENT_SUBNET_MASK, ':']).ljust(align), self.eth0_static.netmask if self.eth0_static.netmask is not None else TEXT_ELEMENT_VALUE_NOT_GIVEN) ]
+                details += [ '{}{}'.format(''.join([TEXT_ELEMENT_SUBNET_MASK, ':']).ljust(align), nic.static.netmask if nic.static.netmask is not None else TEXT_ELEMENT_VALUE_NOT_GIVEN) ]
                 # gateway
-                details += [ '{}{}'.format(''.join([TEXT_ELEMENT_DEFAULT_GATEWAY, ':']).ljust(align), self.eth0_static.gateway if self.eth0_static.gateway is not None else TEXT_ELEMENT_VALUE_NOT_GIVEN) ]
+                details += [ '{}{}'.format(''.join([TEXT_ELEMENT_DEFAULT_GATEWAY, ':']).ljust(align), nic.static.gateway if nic.static.gateway is not None else TEXT_ELEMENT_VALUE_NOT_GIVEN) ]
                 # nameservers
-                details += [ '{}{}'.format(''.join([TEXT_ELEMENT_DNS_SERVERS, ':']).ljust(align), self.eth0_static.nameserver if self.eth0_static.nameserver is not None else TEXT_ELEMENT_VALUE_NOT_GIVEN) ]
+                details += [ '{}{}'.format(''.join([TEXT_ELEMENT_DNS_SERVERS, ':']).ljust(align), nic.static.nameserver if nic.static.nameserver is not None else TEXT_ELEMENT_VALUE_NOT_GIVEN) ]
         else:
             details = ['<unknown>']
         return '\n'.join(details)
 
-    def get_eth0_static_ip_to_edit(self):
-        if self.eth0_static_overlay.ip is not None:
-            return self.eth0_static_overlay.ip
-        if self.eth0_static.ip is not None:
-            return self.eth0_static.ip
+    def get_nic_static_ip_to_edit(self):
+        if self.nic_static_overlay.ip is not None:
+            return self.nic_static_overlay.ip
+        if self.get_nic().static.ip is not None:
+            return self.get_nic().static.ip
         return ''
 
-    def get_eth0_static_netmask_to_edit(self):
-        if self.eth0_static_overlay.netmask is not None:
-            return self.eth0_static_overlay.netmask
-        if self.eth0_static.netmask is not None:
-            return self.eth0_static.netmask
+    def get_nic_static_netmask_to_edit(self):
+        if self.nic_static_overlay.netmask is not None:
+            return self.nic_static_overlay.netmask
+        if self.get_nic().static.netmask is not None:
+            return self.get_nic().static.netmask
         return ''
 
-    def get_eth0_static_gateway_to_edit(self):
-        if self.eth0_static_overlay.gateway is not None:
-            return self.eth0_static_overlay.gateway
-        if self.eth0_static.gateway is not None:
-            return self.eth0_static.gateway
+    def get_nic_static_gateway_to_edit(self):
+        if self.nic_static_overlay.gateway is not None:
+            return self.nic_static_overlay.gateway
+        if self.get_nic().static.gateway is not None:
+            return self.get_nic().static.gateway
         return ''
 
-    def get_eth0_static_nameserver_to_edit(self):
-        if self.eth0_static_overlay.nameserver is not None:
-            return self.eth0_static_overlay.nameserver
-        if self.eth0_static.nameserver is not None:
-            return self.eth0_static.nameserver
+    def get_nic_static_nameserver_to_edit(self):
+        if self.nic_static_overlay.nameserver is not None:
+            return self.nic_static_overlay.nameserver
+        if self.get_nic().static.nameserver is not None:
+            return self.get_nic().static.nameserver
         return ''
 
     def _strip_str_value(self, value):
@@ -219,41 +278,42 @@ class AppConfig:
             return None
         return s
 
-    def _eth0_static_validate(self):
-        ipaddr = self._strip_str_value(self.eth0_static_overlay.ip)
+    def _nic_static_validate(self):
+        caption = TEXT_ELEMENT_NIC.format(self.nic_selected)
+        ipaddr = self._strip_str_value(self.nic_static_overlay.ip)
         if ipaddr is None:
-            self.eth0_static_overlay_last_error = 'ip'
-            raise AppInputError('{}:\n{}: {}'.format(TEXT_ELEMENT_ETH0, TEXT_ELEMENT_IP_ADDRESS, TEXT_ERROR_NOT_SPECIFIED))
+            self.nic_static_overlay_last_error = 'ip'
+            raise AppInputError('{}:\n{}: {}'.format(caption, TEXT_ELEMENT_IP_ADDRESS, TEXT_ERROR_NOT_SPECIFIED))
         if not is_valid_ip_v4(ipaddr):
-            self.eth0_static_overlay_last_error = 'ip'
-            raise AppInputError('{}:\n{}: {}'.format(TEXT_ELEMENT_ETH0, TEXT_ELEMENT_IP_ADDRESS, TEXT_ERROR_INVALID_IP.format(ipaddr)))
+            self.nic_static_overlay_last_error = 'ip'
+            raise AppInputError('{}:\n{}: {}'.format(caption, TEXT_ELEMENT_IP_ADDRESS, TEXT_ERROR_INVALID_IP.format(ipaddr)))
 
-        netmask = self._strip_str_value(self.eth0_static_overlay.netmask)
+        netmask = self._strip_str_value(self.nic_static_overlay.netmask)
         if netmask is None:
-            self.eth0_static_overlay_last_error = 'netmask'
-            raise AppInputError('{}:\n{}: {}'.format(TEXT_ELEMENT_ETH0, TEXT_ELEMENT_SUBNET_MASK, TEXT_ERROR_NOT_SPECIFIED))
+            self.nic_static_overlay_last_error = 'netmask'
+            raise AppInputError('{}:\n{}: {}'.format(caption, TEXT_ELEMENT_SUBNET_MASK, TEXT_ERROR_NOT_SPECIFIED))
         if not is_valid_ip_v4(netmask):
-            self.eth0_static_overlay_last_error = 'netmask'
-            raise AppInputError('{}:\n{}: {}'.format(TEXT_ELEMENT_ETH0, TEXT_ELEMENT_SUBNET_MASK, TEXT_ERROR_INVALID_IP.format(netmask)))
+            self.nic_static_overlay_last_error = 'netmask'
+            raise AppInputError('{}:\n{}: {}'.format(caption, TEXT_ELEMENT_SUBNET_MASK, TEXT_ERROR_INVALID_IP.format(netmask)))
 
-        gateway = self._strip_str_value(self.eth0_static_overlay.gateway)
+        gateway = self._strip_str_value(self.nic_static_overlay.gateway)
         if gateway is None:
-            self.eth0_static_overlay_last_error = 'gateway'
-            raise AppInputError('{}:\n{}: {}'.format(TEXT_ELEMENT_ETH0, TEXT_ELEMENT_DEFAULT_GATEWAY, TEXT_ERROR_NOT_SPECIFIED))
+            self.nic_static_overlay_last_error = 'gateway'
+            raise AppInputError('{}:\n{}: {}'.format(caption, TEXT_ELEMENT_DEFAULT_GATEWAY, TEXT_ERROR_NOT_SPECIFIED))
         if not is_valid_ip_v4(gateway):
-            self.eth0_static_overlay_last_error = 'gateway'
-            raise AppInputError('{}:\n{}: {}'.format(TEXT_ELEMENT_ETH0, TEXT_ELEMENT_DEFAULT_GATEWAY, TEXT_ERROR_INVALID_IP.format(gateway)))
+            self.nic_static_overlay_last_error = 'gateway'
+            raise AppInputError('{}:\n{}: {}'.format(caption, TEXT_ELEMENT_DEFAULT_GATEWAY, TEXT_ERROR_INVALID_IP.format(gateway)))
 
         ns_list = []
-        nameserver = self._strip_str_value(self.eth0_static_overlay.nameserver)
+        nameserver = self._strip_str_value(self.nic_static_overlay.nameserver)
         if nameserver is not None:
             bits = nameserver.replace(',', ' ').split()
             for v in bits:
                 ns_value = v.strip()
                 if ns_value:
                     if not is_valid_ip_v4(ns_value):
-                        self.eth0_static_overlay_last_error = 'nameserver'
-                        raise AppInputError('{}:\n{}: {}'.format(TEXT_ELEMENT_ETH0, TEXT_ELEMENT_DNS_SERVERS, TEXT_ERROR_INVALID_IP.format(ns_value)))
+                        self.nic_static_overlay_last_error = 'nameserver'
+                        raise AppInputError('{}:\n{}: {}'.format(caption, TEXT_ELEMENT_DNS_SERVERS, TEXT_ERROR_INVALID_IP.format(ns_value)))
                     else:
                         ns_list.append(ns_value)
         if ns_list:
@@ -289,14 +349,22 @@ class AppConfig:
             raise AppInputError(TEXT_ERROR_INVALID_HOSTNAME.format(hostname if hostname is not None else ''))
         return hostname
 
-    def eth0_dhcp_apply(self):
-        self.eth0_use_dhcp = True
+    def nic_dhcp_apply(self):
+        nic = self.get_nic()
+        nic.use_dhcp = True
+        nic.onboot = True
         self.persist_changes()
 
-    def eth0_static_apply(self):
-        self.eth0_static = self._eth0_static_validate()
-        self.eth0_use_dhcp = False
-        self.eth0_static_overlay = StaticNetworkConfig()
+    def nic_static_apply(self):
+        nic = self.get_nic()
+        nic.static = self._nic_static_validate()
+        nic.use_dhcp = False
+        nic.onboot = True
+        self.nic_static_overlay = StaticNetworkConfig()
+        self.persist_changes()
+
+    def nic_disable_apply(self):
+        self.get_nic().onboot = False
         self.persist_changes()
 
     def hostname_apply(self):
@@ -309,41 +377,22 @@ class AppConfig:
         if not config.has_section('main'):
             config.add_section('main')
         config.set('main', 'hostname', self.hostname)
-        if not config.has_section('eth0'):
-            config.add_section('eth0')
-        config.set('eth0', 'bootproto', 'dhcp' if self.eth0_use_dhcp else 'static')
-        if self.eth0_static.ip is not None:
-            config.set('eth0', 'ip', self.eth0_static.ip)
-        else:
-            config.remove_option('eth0', 'ip')
-        if self.eth0_static.netmask is not None:
-            config.set('eth0', 'netmask', self.eth0_static.netmask)
-        else:
-            config.remove_option('eth0', 'netmask')
-        if self.eth0_static.gateway is not None:
-            config.set('eth0', 'gateway', self.eth0_static.gateway)
-        else:
-            config.remove_option('eth0', 'gateway')
-        if self.eth0_static.nameserver is not None:
-            config.set('eth0', 'nameserver', self.eth0_static.nameserver)
-        else:
-            config.remove_option('eth0', 'nameserver')
+        for nic in self.nics:
+            if not config.has_section(nic.name):
+                config.add_section(nic.name)
+            config.set(nic.name, 'bootproto', 'dhcp' if nic.use_dhcp else 'static')
+            config.set(nic.name, 'onboot', 'yes' if nic.onboot else 'no')
+            for option in ('ip', 'netmask', 'gateway', 'nameserver'):
+                value = getattr(nic.static, option)
+                if value is not None:
+                    config.set(nic.name, option, value)
+                else:
+                    config.remove_option(nic.name, option)
         with open(APP_CONFIG_FILE_TMP, 'wb') as configfile:
             config.write(configfile)
         os.rename(APP_CONFIG_FILE_TMP, APP_CONFIG_FILE)
 
 
-def get_mac_address(ifname):
-    try:
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        info = fcntl.ioctl(s.fileno(), 0x8927, struct.pack('256s', ifname[:15]))
-        return '-'.join(['%02X' % ord(char) for char in info[18:24]])
-    except IOError as exc:
-        if exc.errno == 19: # no such device
-            return None
-        raise
-
-
 def load_version_info(version_file, default=None):
     version_info = default
     if not os.path.exists(version_file) and default is not None:
@@ -356,23 +405,29 @@ def load_version_info(version_file, default=None):
     return version_info
 
 
+def get_ini_interfaces(config):
+    # every section with a 'bootproto' is a NIC, in the order of the file
+    return [ section for section in config.sections() if config.has_option(section, 'bootproto') ]
+
+
 def init_app_config(app_config):
     config = load_ini_config(APP_CONFIG_FILE)
 
-    hostname = get_ini_conf_string1(config, 'main', 'hostname')
-    bootproto = get_ini_conf_string1(config, 'eth0', 'bootproto')
-    ip = get_ini_conf_string0(config, 'eth0', 'ip')
-    netmask = get_ini_conf_string0(config, 'eth0', 'netmask')
-    gateway = get_ini_conf_string0(config, 'eth0', 'gateway')
-    nameserver = get_ini_conf_string0(config, 'eth0', 'nameserver')
+    app_config.hostname = get_ini_conf_string1(config, 'main', 'hostname')
+    for name in get_ini_interfaces(config):
+        nic = NicConfig(name)
+        nic.use_dhcp = True if get_ini_conf_string1(config, name, 'bootproto') == 'dhcp' else False
+        nic.onboot = get_ini_conf_string0(config, name, 'onboot', 'yes') != 'no'
+        nic.static.ip = get_ini_conf_string0(config, name, 'ip')
+        nic.static.netmask = get_ini_conf_string0(config, name, 'netmask')
+        nic.static.gateway = get_ini_conf_string0(config, name, 'gateway')
+        nic.static.nameserver = get_ini_conf_string0(config, name, 'nameserver')
+        app_config.nics.append(nic)
 
-    app_config.eth0_mac_address = get_mac_address('eth0')
-    app_config.hostname = hostname
-    app_config.eth0_use_dhcp = True if bootproto == 'dhcp' else False
-    app_config.eth0_static.ip = ip
-    app_config.eth0_static.netmask = netmask
-    app_config.eth0_static.gateway = gateway
-    app_config.eth0_static.nameserver = nameserver
+    app_config.inventory = NetInventory()
+    app_config.add_inventory_nics()
+    if app_config.nics:
+        app_config.nic_selected = app_config.nics[0].name
 
 
 class AppHostNameEditDisplay(urwid.WidgetWrap):
@@ -463,14 +518,14 @@ class AppRootPasswordEditDisplay(urwid.WidgetWrap):
 
 
 class AppStaticNeworkDisplay(urwid.WidgetWrap):
-    signals = ['sig.eth0.static']
+    signals = ['sig.nic.static']
 
     def __init__(self, app_config):
         self.app_config = app_config
-        self.ipaddr_bar = urwid.Edit(edit_text=app_config.get_eth0_static_ip_to_edit())
-        self.netmask_bar = urwid.Edit(edit_text=app_config.get_eth0_static_netmask_to_edit())
-        self.gateway_bar = urwid.Edit(edit_text=app_config.get_eth0_static_gateway_to_edit())
-        self.nameserver_bar = urwid.Edit(edit_text=app_config.get_eth0_static_nameserver_to_edit())
+        self.ipaddr_bar = urwid.Edit(edit_text=app_config.get_nic_static_ip_to_edit())
+        self.netmask_bar = urwid.Edit(edit_text=app_config.get_nic_static_netmask_to_edit())
+        self.gateway_bar = urwid.Edit(edit_text=app_config.get_nic_static_gateway_to_edit())
+        self.nameserver_bar = urwid.Edit(edit_text=app_config.get_nic_static_nameserver_to_edit())
         focus_map = {'ip': 1, 'netmask': 3, 'gateway': 5, 'nameserver': 7}
         content = [
             urwid.Text(TEXT_ELEMENT_IP_ADDRESS + ':'),
@@ -491,24 +546,24 @@ class AppStaticNeworkDisplay(urwid.WidgetWrap):
         ]
         walker = urwid.SimpleListWalker(content)
         focus_idx = None
-        if app_config.eth0_static_overlay_last_error is not None:
-            focus_idx = focus_map.get(app_config.eth0_static_overlay_last_error)
-            app_config.eth0_static_overlay_last_error = None
+        if app_config.nic_static_overlay_last_error is not None:
+            focus_idx = focus_map.get(app_config.nic_static_overlay_last_error)
+            app_config.nic_static_overlay_last_error = None
         if focus_idx is not None:
             walker.set_focus(focus_idx)
         self.footer = urwid.Pile([urwid.Text(TEXT_ELEMENT_KEYBOARD_DLG_HINT), urwid.Text(TEXT_ELEMENT_KEYBOARD_HINT)])
-        self.view = urwid.AttrMap(urwid.LineBox(urwid.Frame(urwid.ListBox(walker), footer=self.footer), title=TEXT_ETH0_STATIC_DIALOG_CAPTION), 'app.dialog')
+        self.view = urwid.AttrMap(urwid.LineBox(urwid.Frame(urwid.ListBox(walker), footer=self.footer), title=TEXT_NIC_STATIC_DIALOG_CAPTION.format(app_config.nic_selected)), 'app.dialog')
         urwid.WidgetWrap.__init__(self, self.view)
 
     def on_apply(self, *args):
-        self.app_config.eth0_static_overlay.ip = self.ipaddr_bar.get_edit_text()
-        self.app_config.eth0_static_overlay.netmask = self.netmask_bar.get_edit_text()
-        self.app_config.eth0_static_overlay.gateway = self.gateway_bar.get_edit_text()
-        self.app_config.eth0_static_overlay.nameserver = self.nameserver_bar.get_edit_text()
+        self.app_config.nic_static_overlay.ip = self.ipaddr_bar.get_edit_text()
+        self.app_config.nic_static_overlay.netmask = self.netmask_bar.get_edit_text()
+        self.app_config.nic_static_overlay.gateway = self.gateway_bar.get_edit_text()
+        self.app_config.nic_static_overlay.nameserver = self.nameserver_bar.get_edit_text()
         self._emit(self.signals[0], SIG_ARG_SEPARATOR.join(['.quit', '.apply']))
 
     def do_cancel(self):
-        self.app_config.eth0_static_overlay = StaticNetworkConfig()
+        self.app_config.nic_static_overlay = StaticNetworkConfig()
         self._emit(self.signals[0], '.quit')
 
     def on_cancel(self, *args):
@@ -521,19 +576,58 @@ class AppStaticNeworkDisplay(urwid.WidgetWrap):
             return self.__super.keypress(size, key)
 
 
+class AppNicSelectDisplay(urwid.WidgetWrap):
+    signals = ['sig.nics']
+
+    def __init__(self, app_config):
+        self.names = [ nic.name for nic in app_config.nics ]
+        width = max([ len(name) for name in self.names ]) + 2
+        items = []
+        for nic in app_config.nics:
+            info = app_config.inventory.get(nic.name) if app_config.inventory is not None else None
+            mac = info.display_mac() if info is not None else None
+            items.append('{}{}\n{}{}'.format(nic.name.ljust(width), mac or '', ' ' * width, app_config.nic_link_describe(nic)))
+        walker = urwid.SimpleListWalker([urwid.AttrMap(urwid.Text(t), None, 'app.focus') for t in items])
+        if app_config.nic_selected in self.names:
+            walker.set_focus(self.names.index(app_config.nic_selected))
+        self.listbox = urwid.ListBox(walker)
+        self.footer = urwid.Pile([urwid.Text(TEXT_ELEMENT_KEYBOARD_DLG_HINT), urwid.Text(TEXT_ELEMENT_KEYBOARD_HINT)])
+        self.view = urwid.AttrMap(urwid.LineBox(urwid.Frame(self.listbox, footer=self.footer), title=TEXT_NICS_DIALOG_CAPTION), 'app.dialog')
+        urwid.WidgetWrap.__init__(self, self.view)
+
+    def keypress(self, size, key):
+        if key == 'up':
+            _, idx = self.listbox.get_focus()
+            if idx > 0:
+                idx -= 1
+                self.listbox.set_focus(idx)
+        elif key == 'down':
+            _, idx = self.listbox.get_focus()
+            if idx + 1 < len(self.names):
+                idx += 1
+                self.listbox.set_focus(idx)
+        elif key == 'enter':
+            _, idx = self.listbox.get_focus()
+            self._emit(self.signals[0], SIG_ARG_SEPARATOR.join(['.quit', SIG_ARG_DATA_SEPARATOR.join(['.select', base64.b64encode(self.names[idx])])]))
+        elif key == 'esc':
+            self._emit(self.signals[0], '.quit')
+
+
 class AppNeworkCustomizeDisplay(urwid.WidgetWrap):
-    signals = ['sig.eth0']
+    signals = ['sig.nic']
 
     def __init__(self, app_config):
-        h1 = '*' if app_config.eth0_use_dhcp else ' '
-        h2 = '*' if not app_config.eth0_use_dhcp else ' '
-        focus_idx = 0 if app_config.eth0_use_dhcp else 1
-        self.actions = [(' '.join([h1, TEXT_ELEMENT_VALUE_USE_DHCP]), '.dhcp'), (' '.join([h2, TEXT_ELEMENT_VALUE_STATIC_IP]), '.static')]
+        nic = app_config.get_nic()
+        h1 = '*' if nic.onboot and nic.use_dhcp else ' '
+        h2 = '*' if nic.onboot and not nic.use_dhcp else ' '
+        h3 = '*' if not nic.onboot else ' '
+        focus_idx = 2 if not nic.onboot else (0 if nic.use_dhcp else 1)
+        self.actions = [(' '.join([h1, TEXT_ELEMENT_VALUE_USE_DHCP]), '.dhcp'), (' '.join([h2, TEXT_ELEMENT_VALUE_STATIC_IP]), '.static'), (' '.join([h3, TEXT_ELEMENT_VALUE_DISABLED]), '.disable')]
         walker = urwid.SimpleListWalker([urwid.AttrMap(urwid.Text(a[0]), None, 'app.focus') for a in self.actions])
         walker.set_focus(focus_idx)
         self.listbox = urwid.ListBox(walker)
         self.footer = urwid.Pile([urwid.Text(TEXT_ELEMENT_KEYBOARD_DLG_HINT), urwid.Text(TEXT_ELEMENT_KEYBOARD_HINT)])
-        self.view = urwid.AttrMap(urwid.LineBox(urwid.Frame(self.listbox, footer=self.footer), title=TEXT_ETH0_DIALOG_CAPTION), 'app.dialog')
+        self.view = urwid.AttrMap(urwid.LineBox(urwid.Frame(self.listbox, footer=self.footer), title=TEXT_NIC_DIALOG_CAPTION.format(nic.name)), 'app.dialog')
         urwid.WidgetWrap.__init__(self, self.view)
 
     def keypress(self, size, key):
@@ -561,7 +655,7 @@ class AppCustomizeDisplay(urwid.WidgetWrap):
         self.actions = [
             ('.hostname', TEXT_ELEMENT_HOSTNAME),
             ('.rootpw', TEXT_ELEMENT_ROOTPASSWORD),
-            ('.network', TEXT_ELEMENT_ETH0.format(app_config.eth0_mac_address))]
+            ('.network', TEXT_ELEMENT_NIC.format(app_config.nics[0].name) if len(app_config.nics) == 1 else TEXT_ELEMENT_NETWORK)]
 
         self.listbox = urwid.ListBox(urwid.SimpleListWalker([urwid.AttrMap(urwid.Text(a[1]), None, 'app.focus') for a in self.actions]))
         self.footer = urwid.Pile([urwid.Text(TEXT_ELEMENT_KEYBOARD_DLG_HINT), urwid.Text(TEXT_ELEMENT_KEYBOARD_HINT)])
@@ -618,6 +712,78 @@ def format_automatic_install_message(elapsed_time):
     return TEXT_AUTOMATIC_INSTALL.format(remaining_time)
 
 
+class InotifyWatcher:
+    # Watches the directories of the given files, since they are created, removed and
+    # renamed over rather than written in place; fileno() is polled by the urwid loop.
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_CLOEXEC = 0o2000000
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, paths):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1() failed')
+        self.paths = set([ os.path.abspath(p) for p in paths ])
+        self.watches = {}
+        mask = self.IN_ATTRIB | self.IN_CLOSE_WRITE | self.IN_MOVED_FROM | self.IN_MOVED_TO | self.IN_CREATE | self.IN_DELETE
+        for dir_name in sorted(set([ os.path.dirname(p) for p in self.paths ])):
+            wd = libc.inotify_add_watch(self.fd, dir_name.encode('utf-8'), mask)
+            if wd < 0:
+                err = ctypes.get_errno()
+                os.close(self.fd)
+                raise OSError(err, "inotify_add_watch() failed for '{}'".format(dir_name))
+            self.watches[wd] = dir_name
+
+    def fileno(self):
+        return self.fd
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def read_changes(self):
+        # the watched files touched since the last call
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 4096)
+            except OSError as ex:
+                if ex.errno in (errno.EAGAIN, errno.EINTR):
+                    break
+                raise
+            offset = 0
+            while offset + self.EVENT_HEADER.size <= len(data):
+                wd, _, _, name_len = self.EVENT_HEADER.unpack_from(data, offset)
+                offset += self.EVENT_HEADER.size
+                name = data[offset:offset + name_len].rstrip(b'\0').decode('utf-8', 'replace')
+                offset += name_len
+                path = os.path.join(self.watches.get(wd, ''), name)
+                if path in self.paths:
+                    changed.add(path)
+        return changed
+
+
+def start_file_watcher(paths):
+    # None where inotify is not available, the caller falls back to polling
+    try:
+        return InotifyWatcher(paths)
+    except (AttributeError, OSError):
+        return None
+
+
+def set_text_if_changed(widget, text):
+    # set_text() invalidates the widget and makes urwid redraw it even for the same text
+    if widget.get_text()[0] != text:
+        widget.set_text(text)
+
+
 class TimerState:
     def __init__(self):
         self._is_timer_in_progress = not os.path.exists(APP_NO_TIMER_STAMP_FILE)
@@ -664,7 +830,8 @@ class AppMainDisplay(urwid.WidgetWrap):
         self.app_config = app_config
         self.timer_config = timer_config
         self.hostname_text_bar = urwid.Text(app_config.hostname_describe())
-        self.eth0_text_bar = urwid.Text(app_config.eth0_describe())
+        self.nic_bars = {}
+        self.network_bar = urwid.Pile(self.network_widgets())
         self.rootpw_text_bar = None
 
         self.actions = [
@@ -680,8 +847,6 @@ class AppMainDisplay(urwid.WidgetWrap):
             urwid.BoxAdapter(self.listbox, 2*len(self.actions))
         ])
 
-        network_caption = TEXT_ELEMENT_ETH0 if app_config.eth0_mac_address is None else TEXT_ELEMENT_ETH0_MAC.format(app_config.eth0_mac_address)
-
         self.rootpw_text_bar = urwid.Text(rootpw_describe())
 
         self.current_settings_bar = urwid.Pile([
@@ -695,9 +860,7 @@ class AppMainDisplay(urwid.WidgetWrap):
             urwid.Divider(),
             urwid.AttrMap(urwid.Text(TEXT_ELEMENT_ROOTPASSWORD + ':'), 'app.title'),
             self.rootpw_text_bar,
-            urwid.Divider(),
-            urwid.AttrMap(urwid.Text(network_caption + ':'), 'app.title'),
-            self.eth0_text_bar
+            self.network_bar
         ])
 
         status_text = TEXT_ACTION_ELEMENT_INSTALL_HINT if not self.timer_config.is_timer_in_progress() else format_automatic_install_message(0)
@@ -708,11 +871,27 @@ class AppMainDisplay(urwid.WidgetWrap):
 
         urwid.WidgetWrap.__init__(self, self.view)
 
+    def network_widgets(self):
+        # a caption and the settings per NIC; the texts are kept in 'nic_bars' to be updated in place
+        widgets = []
+        self.nic_bars = {}
+        for nic in self.app_config.nics:
+            caption_bar = urwid.Text(self.app_config.nic_caption(nic) + ':')
+            details_bar = urwid.Text(self.app_config.nic_describe(nic))
+            self.nic_bars[nic.name] = (caption_bar, details_bar)
+            widgets += [urwid.Divider(), urwid.AttrMap(caption_bar, 'app.title'), details_bar]
+        return widgets
+
     def on_app_reconf(self):
-        self.hostname_text_bar.set_text(self.app_config.hostname_describe())
-        self.eth0_text_bar.set_text(self.app_config.eth0_describe())
+        set_text_if_changed(self.hostname_text_bar, self.app_config.hostname_describe())
+        if sorted(self.nic_bars) != sorted([ nic.name for nic in self.app_config.nics ]):
+            self.network_bar.contents[:] = [ (w, self.network_bar.options()) for w in self.network_widgets() ]
+        for nic in self.app_config.nics:
+            caption_bar, details_bar = self.nic_bars[nic.name]
+            set_text_if_changed(caption_bar, self.app_config.nic_caption(nic) + ':')
+            set_text_if_changed(details_bar, self.app_config.nic_describe(nic))
         if self.rootpw_text_bar is not None:
-            self.rootpw_text_bar.set_text(rootpw_describe())
+            set_text_if_changed(self.rootpw_text_bar, rootpw_describe())
 
     def keypress(self, size, key):
         if self.timer_config is not None:
@@ -766,6 +945,8 @@ class MainApp(urwid.WidgetPlaceholder):
         self.debug = debug
         self.timer_config = None
         self.elapsed_time = 0
+        self.watcher = None
+        self.link_watcher = None
         if app_config.error_text is None:
             self.timer_config = TimerState()
             self.view = AppMainDisplay(app_config, self.timer_config)
@@ -926,11 +1107,30 @@ class MainApp(urwid.WidgetPlaceholder):
             align='center', width=('relative', overlay_box_size),
             valign='middle', height=('relative', overlay_box_size))
 
-    def on_sig_eth0_dhcp(self, *args):
+    def on_sig_nics_select(self, name, *args):
+        self.app_config.nic_selected = name
+        self.show_nic_dialog()
+
+    def show_nic_dialog(self):
+        overlay_box_size = OVERLAY_BOX_SIZE_REDUCED
+        w = AppNeworkCustomizeDisplay(self.app_config)
+        self.sig_subscribe(w)
+        self.original_widget = urwid.Overlay(w,
+            self.view,
+            align='center', width=('relative', overlay_box_size),
+            valign='middle', height=('relative', overlay_box_size))
+
+    def on_sig_nic_dhcp(self, *args):
+        self.do_nic_apply(self.app_config.nic_dhcp_apply)
+
+    def on_sig_nic_disable(self, *args):
+        self.do_nic_apply(self.app_config.nic_disable_apply)
+
+    def do_nic_apply(self, apply_func):
         overlay_box_size = OVERLAY_BOX_SIZE_DEFAULT
         error_text = None
         try:
-            self.app_config.eth0_dhcp_apply()
+            apply_func()
         except AppInputError as ex:
             overlay_box_size = OVERLAY_BOX_SIZE_REDUCED
             error_text = str(ex)
@@ -947,7 +1147,7 @@ class MainApp(urwid.WidgetPlaceholder):
         else:
             self.view.on_app_reconf()
 
-    def on_sig_eth0_static(self, *args):
+    def on_sig_nic_static(self, *args):
         overlay_box_size = OVERLAY_BOX_SIZE_REDUCED
         w = AppStaticNeworkDisplay(self.app_config)
         self.sig_subscribe(w)
@@ -956,11 +1156,11 @@ class MainApp(urwid.WidgetPlaceholder):
             align='center', width=('relative', overlay_box_size),
             valign='middle', height=('relative', overlay_box_size))
 
-    def on_sig_eth0_static_apply(self, *args):
+    def on_sig_nic_static_apply(self, *args):
         overlay_box_size = OVERLAY_BOX_SIZE_DEFAULT
         error_text = None
         try:
-            self.app_config.eth0_static_apply()
+            self.app_config.nic_static_apply()
         except AppInputError as ex:
             overlay_box_size = OVERLAY_BOX_SIZE_REDUCED
             error_text = str(ex)
@@ -968,7 +1168,7 @@ class MainApp(urwid.WidgetPlaceholder):
             etype, evalue, tb = sys.exc_info()
             error_text = ''.join(traceback.format_tb(tb) + traceback.format_exception_only(etype, evalue))
         if error_text is not None:
-            w = AppErrorDisplay(error_text=error_text, post_call='sig.eth0.static')
+            w = AppErrorDisplay(error_text=error_text, post_call='sig.nic.static')
             self.sig_subscribe(w)
             self.original_widget = urwid.Overlay(w,
                 self.view,
@@ -1023,8 +1223,12 @@ class MainApp(urwid.WidgetPlaceholder):
             self.view.on_app_reconf()
 
     def on_sig_customize_network(self, *args):
+        if len(self.app_config.nics) == 1:
+            self.app_config.nic_selected = self.app_config.nics[0].name
+            self.show_nic_dialog()
+            return
         overlay_box_size = OVERLAY_BOX_SIZE_REDUCED
-        w = AppNeworkCustomizeDisplay(self.app_config)
+        w = AppNicSelectDisplay(self.app_config)
         self.sig_subscribe(w)
         self.original_widget = urwid.Overlay(w,
             self.view,
@@ -1058,7 +1262,12 @@ class MainApp(urwid.WidgetPlaceholder):
         else:
             self.on_sig_main_install()
 
-    def on_app_idle(self, loop, user_data):
+    def on_startup_benchmark(self, loop, user_data):
+        with open(STARTUP_BENCHMARK_FILE, 'at') as fh:
+            print('first_frame {:.3f}'.format(time.time() - float(os.environ.get('OS_STARTUP_T0', '0'))), file=fh)
+        raise urwid.ExitMainLoop()
+
+    def check_timer_stamp(self, loop):
         need_timer_restart, need_timer_cancel = self.timer_config.on_idle()
         if need_timer_restart:
             self.timer_config.on_timer_start()
@@ -1066,6 +1275,23 @@ class MainApp(urwid.WidgetPlaceholder):
             loop.set_alarm_in(1, self.on_app_timeout)
         elif need_timer_cancel:
             self.do_cancel_timer()
+
+    def on_files_changed(self, loop):
+        changed = self.watcher.read_changes()
+        if APP_NO_TIMER_STAMP_FILE in changed:
+            self.check_timer_stamp(loop)
+        if changed:
+            self.view.on_app_reconf()
+
+    def on_links_changed(self, loop):
+        names = self.link_watcher.read_changes()
+        if names is None or names:
+            if self.app_config.refresh_inventory(names):
+                self.view.on_app_reconf()
+
+    def on_app_idle(self, loop, user_data):
+        # polling, for when inotify is not available
+        self.check_timer_stamp(loop)
         self.view.on_app_reconf()
         loop.set_alarm_in(1, self.on_app_idle)
 
@@ -1100,11 +1326,31 @@ class MainApp(urwid.WidgetPlaceholder):
         ]
 
         loop = urwid.MainLoop(self, palette)
+        if STARTUP_BENCHMARK_FILE:
+            # alarms that are not due yet wait until the loop went idle and drew the frame
+            loop.set_alarm_in(0.01, self.on_startup_benchmark)
         if not self.error_mode:
-            loop.set_alarm_in(1, self.on_app_idle)
+            # between key presses and changes of these files the loop has nothing to do
+            self.watcher = start_file_watcher([APP_NO_TIMER_STAMP_FILE, APP_CONFIG_FILE, HASHED_ROOT_PASSWORD_FILE])
+            if self.watcher is not None:
+                self.check_timer_stamp(loop)
+                loop.watch_file(self.watcher.fileno(), lambda: self.on_files_changed(loop))
+            else:
+                loop.set_alarm_in(1, self.on_app_idle)
+            # link state, speed and NICs as they come and go
+            self.link_watcher = start_link_watcher()
+            if self.link_watcher is not None:
+                loop.watch_file(self.link_watcher.fileno(), lambda: self.on_links_changed(loop))
             if self.timer_config.is_timer_in_progress():
                 loop.set_alarm_in(1, self.on_app_timeout)
-        loop.run()
+        try:
+            loop.run()
+        finally:
+            # os-frontend.py goes on to the install phase in this process
+            if self.watcher is not None:
+                self.watcher.close()
+            if self.link_watcher is not None:
+                self.link_watcher.close()
 
 
 def clear_screen():
@@ -0,0 +1,37 @@
+from __future__ import print_function
+import imp
+import os.path
+
+
+# The installer frontend in one interpreter: bootstrap, the config TUI and the install TUI
+# run as phases of this process instead of one interpreter each. A phase's module, and with
+# it whatever it imports, is loaded only when the phase starts. create-iso.sh puts the
+# compiled bytecode next to every module, so nothing is compiled on the live system.
+
+DIR_HERE = os.path.normpath(os.path.abspath(os.path.dirname(__file__)))
+LOGWRAP_SCRIPT = os.path.join(DIR_HERE, 'os-logwrap.py')
+
+
+def load_phase(script_name):
+    # imp.load_source() takes '<script>c' when it is up to date
+    return imp.load_source(script_name[:-len('.py')].replace('-', '_'), os.path.join(DIR_HERE, script_name))
+
+
+def main():
+    bootstrap = load_phase('os-bootstrap.py')
+    bootstrap.generate_app_config()
+
+    # a node found on the kernel command line or in the node inventory skips the config TUI
+    if not bootstrap.apply_node_config():
+        config_tui = load_phase('os-config-tui.py')
+        config_tui.main()
+        if config_tui.EXIT_CODE != 0:
+            return config_tui.EXIT_CODE
+
+    install_tui = load_phase('os-install-tui.py')
+    install_tui.main(LOGWRAP_SCRIPT)
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
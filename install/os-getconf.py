@@ -1,10 +1,22 @@
 from __future__ import print_function
 import ConfigParser
+import os
 import os.path
+import re
 import sys
+from pipes import quote as shell_quote
+from os_netinfo import NetInventory
 
 
 HASHED_ROOT_PASSWORD_FILE = '/root/os-config.shadow'
+RE_PLACEHOLDER = re.compile(r'@([A-Z][A-Z0-9_]*)@')
+# kickstart template placeholder -> shell variable holding its value
+KICKSTART_PLACEHOLDERS = {
+    'NETWORK': 'NETWORK_CONFIG',
+    'ROOTPASSWORD': 'ROOTPW_CONFIG',
+}
+# values made of several kickstart commands, one per line
+MULTILINE_VALUES = ('NETWORK_CONFIG',)
 
 
 def load_ini_config(fname):
@@ -26,21 +38,72 @@ def get_ini_conf_string0(config, section, option, default=None):
     return get_ini_conf_string1(config, section, option)
 
 
-def eval_network_config(config):
-    bootproto = get_ini_conf_string1(config, 'eth0', 'bootproto')
+def get_ini_interfaces(config):
+    # every section with a 'bootproto' is a NIC, in the order of the file
+    return [ section for section in config.sections() if config.has_option(section, 'bootproto') ]
+
+
+def eval_interface_config(config, name):
+    bootproto = get_ini_conf_string1(config, name, 'bootproto')
+    onboot = get_ini_conf_string0(config, name, 'onboot', 'yes')
     if bootproto == 'dhcp':
-        return 'network --device=eth0 --bootproto=dhcp'
-
-    static_ip = get_ini_conf_string0(config, 'eth0', 'ip')
-    static_netmask = get_ini_conf_string1(config, 'eth0', 'netmask')
-    static_gateway = get_ini_conf_string1(config, 'eth0', 'gateway')
-    static_nameserver = get_ini_conf_string0(config, 'eth0', 'nameserver')
-    value = 'network --device=eth0 --bootproto=static --ip={} --netmask={} --gateway={}'.format(static_ip, static_netmask, static_gateway)
-    if static_nameserver is not None:
-        value = value + ' --nameserver={}'.format(static_nameserver)
+        value = 'network --device={} --bootproto=dhcp'.format(name)
+    else:
+        static_ip = get_ini_conf_string0(config, name, 'ip')
+        static_netmask = get_ini_conf_string1(config, name, 'netmask')
+        static_gateway = get_ini_conf_string1(config, name, 'gateway')
+        static_nameserver = get_ini_conf_string0(config, name, 'nameserver')
+        value = 'network --device={} --bootproto=static --ip={} --netmask={} --gateway={}'.format(name, static_ip, static_netmask, static_gateway)
+        if static_nameserver is not None:
+            value = value + ' --nameserver={}'.format(static_nameserver)
+    if onboot == 'no':
+        value = value + ' --onboot=no'
     return value
 
 
+def get_present_interfaces(config, inventory=None):
+    # configured NICs this machine has; anaconda stops at a device it cannot find
+    names = get_ini_interfaces(config)
+    present = (inventory if inventory is not None else NetInventory()).names()
+    if present:
+        names = [ name for name in names if name in present ]
+    return names
+
+
+def eval_network_config(config, inventory=None):
+    # a 'network' line per configured NIC
+    return '\n'.join([ eval_interface_config(config, name) for name in get_present_interfaces(config, inventory) ])
+
+
+def eval_interface_ifcfg(config, name):
+    # what anaconda writes for the 'network' line of eval_interface_config()
+    bootproto = get_ini_conf_string1(config, name, 'bootproto')
+    onboot = get_ini_conf_string0(config, name, 'onboot', 'yes')
+    lines = [ 'TYPE=Ethernet', 'NAME={}'.format(name), 'DEVICE={}'.format(name), 'ONBOOT={}'.format(onboot),
+        'IPV6INIT=yes', 'IPV6_AUTOCONF=yes' ]
+    if bootproto == 'dhcp':
+        lines.append('BOOTPROTO=dhcp')
+    else:
+        lines.append('BOOTPROTO=none')
+        lines.append('IPADDR={}'.format(get_ini_conf_string1(config, name, 'ip')))
+        lines.append('NETMASK={}'.format(get_ini_conf_string1(config, name, 'netmask')))
+        lines.append('GATEWAY={}'.format(get_ini_conf_string1(config, name, 'gateway')))
+        nameservers = get_ini_conf_string0(config, name, 'nameserver', '').replace(',', ' ').split()
+        for idx, nameserver in enumerate(nameservers):
+            lines.append('DNS{}={}'.format(idx + 1, nameserver))
+    return '\n'.join(lines) + '\n'
+
+
+def write_ifcfg_files(ini_file, output_dir, inventory=None):
+    # an ifcfg file per configured NIC the machine has, for the image-based install
+    config = load_ini_config(ini_file)
+    names = get_present_interfaces(config, inventory)
+    for name in names:
+        with open(os.path.join(output_dir, 'ifcfg-{}'.format(name)), mode='wt') as fh:
+            fh.write(eval_interface_ifcfg(config, name))
+    return names
+
+
 def eval_rootpw_config():
     rootpw_hash = ''
     if os.path.exists(HASHED_ROOT_PASSWORD_FILE):
@@ -51,13 +114,58 @@ def eval_rootpw_config():
                     break
         if not rootpw_hash:
             raise Exception("os-getconf.py - got broken password hash.")
-        rootpw_hash = rootpw_hash.replace('\\','\\\\').replace('/','\\/') # escaping for sed
         return 'rootpw --iscrypted {}'.format(rootpw_hash)
     else:
         return 'rootpw --lock'
 
 
+def eval_install_config(config):
+    return {
+        'HOST_NAME': get_ini_conf_string1(config, 'main', 'hostname'),
+        'NETWORK_CONFIG': eval_network_config(config),
+        'ROOTPW_CONFIG': eval_rootpw_config(),
+    }
+
+
+def render_template(text, values):
+    # one pass over the template, values are inserted as they are
+    def replace(match):
+        name = match.group(1)
+        if name not in values:
+            raise Exception("os-getconf.py - unknown placeholder '@{}@'.".format(name))
+        return values[name]
+    return RE_PLACEHOLDER.sub(replace, text)
+
+
+def render_kickstart(ini_file, template_file, output_file):
+    values = eval_install_config(load_ini_config(ini_file))
+    for name, value in values.items():
+        if '\r' in value or ('\n' in value and name not in MULTILINE_VALUES):
+            raise Exception("os-getconf.py - line break in '{}'.".format(name))
+    with open(template_file, mode='rt') as fh:
+        text = fh.read()
+    text = render_template(text, dict([ (placeholder, values[name]) for placeholder, name in KICKSTART_PLACEHOLDERS.items() ]))
+    tmp_file = output_file + '.tmp'
+    with open(tmp_file, mode='wt') as fh:
+        fh.write(text)
+    os.chmod(tmp_file, 0o644)
+    os.rename(tmp_file, output_file)
+    return values
+
+
+def format_shell_assignments(values):
+    return '\n'.join([ '{}={}'.format(name, shell_quote(values[name])) for name in sorted(values) ])
+
+
 if __name__ == '__main__':
+    if sys.argv[1] == '--render':
+        # renders the kickstart and prints every value os-install.sh needs as shell
+        # assignments, for a single 'eval'
+        print(format_shell_assignments(render_kickstart(sys.argv[2], sys.argv[3], sys.argv[4])))
+        sys.exit(0)
+    if sys.argv[1] == '--ifcfg':
+        write_ifcfg_files(sys.argv[2], sys.argv[3])
+        sys.exit(0)
     if sys.argv[1] == '@rootpw':
         value = eval_rootpw_config()
     else:
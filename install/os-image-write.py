@@ -0,0 +1,87 @@
+from __future__ import print_function
+import argparse
+import os
+import sys
+import time
+
+
+# Writes the unpacked golden image from stdin onto a block device in large sequential
+# writes, and prints 'Writing image <n>/<m> MiB' as it goes for os_progress.py. Reads
+# from the pipe are collected into whole blocks first, so the device never sees the
+# small writes a pipe hands out.
+#
+#   gzip -dc rootfs.img.gz | python os-image-write.py --size 1610612736 /dev/sda2
+
+BLOCK_SIZE = 4 * 1024 * 1024
+MIB = 1024 * 1024
+
+
+class ImageWriteError(Exception):
+    def __init__(self, text):
+        Exception.__init__(self, text)
+
+
+def read_block(fd, size):
+    # up to 'size' bytes, less only at the end of the stream
+    chunks = []
+    missing = size
+    while missing > 0:
+        data = os.read(fd, missing)
+        if not data:
+            break
+        chunks.append(data)
+        missing -= len(data)
+    return b''.join(chunks)
+
+
+def write_all(fd, data):
+    while data:
+        written = os.write(fd, data)
+        data = data[written:]
+
+
+def write_image(in_fd, device, total_size, block_size=BLOCK_SIZE):
+    out_fd = os.open(device, os.O_WRONLY)
+    try:
+        total_mb = (total_size + MIB - 1) // MIB
+        step_mb = max(total_mb // 100, 1)
+        written = 0
+        reported_mb = -step_mb
+        while True:
+            block = read_block(in_fd, block_size)
+            if not block:
+                break
+            if written + len(block) > total_size:
+                raise ImageWriteError("The image is larger than {} bytes.".format(total_size))
+            write_all(out_fd, block)
+            written += len(block)
+            if written // MIB - reported_mb >= step_mb:
+                reported_mb = written // MIB
+                print('Writing image {}/{} MiB'.format(reported_mb, total_mb))
+                sys.stdout.flush()
+        os.fsync(out_fd)
+    finally:
+        os.close(out_fd)
+    if written != total_size:
+        raise ImageWriteError("The image has {} bytes, {} expected.".format(written, total_size))
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, required=True, help='size of the unpacked image in bytes')
+    parser.add_argument('--block-size', type=int, default=BLOCK_SIZE // MIB, metavar='MB')
+    parser.add_argument('device')
+    args = parser.parse_args()
+    started = time.time()
+    try:
+        written = write_image(sys.stdin.fileno(), args.device, args.size, args.block_size * MIB)
+    except (ImageWriteError, OSError) as ex:
+        print('ERROR: {}'.format(ex))
+        exit(1)
+    elapsed = max(time.time() - started, 0.001)
+    print('Image written: {} MiB in {:.1f}s ({:.1f} MiB/s)'.format(written // MIB, elapsed, written / float(MIB) / elapsed))
+
+
+if __name__ == '__main__':
+    main()
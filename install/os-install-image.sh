@@ -0,0 +1,130 @@
+#!/bin/bash
+set -e
+set -o pipefail
+
+# Image-based install: the disk is partitioned, the golden root file system from the ISO
+# is streamed onto it and grown to the partition, and only what differs between nodes is
+# written afterwards: fstab, network, machine-id, root password and the boot loader.
+# The root file system is left mounted on the sysroot, as anaconda leaves it; the host
+# name and the tty1 password prompt are done by os-install.sh for both install modes.
+# SSH host keys are generated on first boot by sshd-keygen.
+#
+#   os-install-image.sh <rootfs.info> <os-config.ini> <sysroot>
+
+DIR_ISO_ROOT='/run/initramfs/live'
+HASHED_ROOT_PASSWORD_FILE='/root/os-config.shadow'
+# the disk os-template.cfg installs to
+TARGET_DISK="${OS_TARGET_DISK:-/dev/sda}"
+ESP_SIZE_MB=200
+
+IMAGE_INFO_FILE="$1"
+INI_CONFIG_INSTALL="$2"
+DIR_SYSROOT="$3"
+
+if [ ! -f "$IMAGE_INFO_FILE" ] || [ ! -f "$INI_CONFIG_INSTALL" ] || [ -z "$DIR_SYSROOT" ]; then
+    echo "ERROR: os-install-image.sh - invalid command-line."
+    exit 1
+fi
+
+IMAGE_FILE=$(sed -n 's/^IMAGE_FILE=//p' "$IMAGE_INFO_FILE")
+IMAGE_SIZE=$(sed -n 's/^IMAGE_SIZE=//p' "$IMAGE_INFO_FILE")
+IMAGE_PATH="$(dirname "$IMAGE_INFO_FILE")/$IMAGE_FILE"
+case "$IMAGE_FILE" in
+    *.gz) IMAGE_UNPACK='gzip -dc' ;;
+    *.xz) IMAGE_UNPACK='xz -dc' ;;
+    *)    IMAGE_UNPACK='cat' ;;
+esac
+if [ ! -f "$IMAGE_PATH" ] || [ -z "$IMAGE_SIZE" ]; then
+    echo "ERROR: Golden image not found: '$IMAGE_PATH'"
+    exit 1
+fi
+
+IS_EFI='n'
+if [ -e /sys/firmware/efi ]; then
+    IS_EFI='y'
+fi
+
+
+echo "Partitioning disk $TARGET_DISK"
+vgchange -an > /dev/null 2>&1 || true
+wipefs -a "$TARGET_DISK"
+if [ "$IS_EFI" = 'y' ]; then
+    parted -s -a optimal "$TARGET_DISK" mklabel gpt \
+        mkpart ESP fat32 1MiB "$((ESP_SIZE_MB + 1))MiB" set 1 boot on \
+        mkpart root xfs "$((ESP_SIZE_MB + 1))MiB" 100%
+    ESP_PART="${TARGET_DISK}1"
+    ROOT_PART="${TARGET_DISK}2"
+else
+    parted -s -a optimal "$TARGET_DISK" mklabel msdos \
+        mkpart primary xfs 1MiB 100% set 1 boot on
+    ROOT_PART="${TARGET_DISK}1"
+fi
+partprobe "$TARGET_DISK" || true
+udevadm settle
+
+PART_SIZE=$(blockdev --getsize64 "$ROOT_PART")
+if [ "$PART_SIZE" -lt "$IMAGE_SIZE" ]; then
+    echo "ERROR: The image takes $IMAGE_SIZE bytes, '$ROOT_PART' has $PART_SIZE."
+    exit 1
+fi
+
+echo "Writing image '$IMAGE_PATH' to $ROOT_PART"
+$IMAGE_UNPACK "$IMAGE_PATH" | python "$DIR_ISO_ROOT/os-image-write.py" --size "$IMAGE_SIZE" "$ROOT_PART"
+
+echo "Growing the root file system"
+# every node gets a file system UUID of its own
+xfs_admin -U generate "$ROOT_PART"
+mkdir -p "$DIR_SYSROOT"
+mount "$ROOT_PART" "$DIR_SYSROOT"
+xfs_growfs "$DIR_SYSROOT"
+
+if [ "$IS_EFI" = 'y' ]; then
+    # the EFI files of the image go onto the ESP, which is then mounted over them
+    mkfs.vfat -F 32 -n EFI "$ESP_PART"
+    DIR_ESP_TMP=$(mktemp -d)
+    mount "$ESP_PART" "$DIR_ESP_TMP"
+    cp -r "$DIR_SYSROOT/boot/efi/." "$DIR_ESP_TMP/"
+    umount "$DIR_ESP_TMP"
+    rmdir "$DIR_ESP_TMP"
+    rm -rf "$DIR_SYSROOT"/boot/efi/*
+    mount "$ESP_PART" "$DIR_SYSROOT/boot/efi"
+fi
+
+
+echo "Applying host settings"
+{
+    echo "UUID=$(blkid -s UUID -o value "$ROOT_PART") / xfs defaults 0 0"
+    if [ "$IS_EFI" = 'y' ]; then
+        echo "UUID=$(blkid -s UUID -o value "$ESP_PART") /boot/efi vfat umask=0077,shortname=winnt 0 0"
+    fi
+} > "$DIR_SYSROOT/etc/fstab"
+
+python "$DIR_ISO_ROOT/os-getconf.py" --ifcfg "$INI_CONFIG_INSTALL" "$DIR_SYSROOT/etc/sysconfig/network-scripts"
+
+mount --bind /dev "$DIR_SYSROOT/dev"
+mount -t proc proc "$DIR_SYSROOT/proc"
+mount --rbind /sys "$DIR_SYSROOT/sys"
+
+chroot "$DIR_SYSROOT" systemd-machine-id-setup
+if [ -f "$HASHED_ROOT_PASSWORD_FILE" ]; then
+    chroot "$DIR_SYSROOT" usermod -p "$(head -n 1 "$HASHED_ROOT_PASSWORD_FILE")" root
+else
+    chroot "$DIR_SYSROOT" passwd -l root
+fi
+
+
+echo "Installing boot loader"
+if [ "$IS_EFI" = 'y' ]; then
+    chroot "$DIR_SYSROOT" grub2-mkconfig -o /boot/efi/EFI/centos/grub.cfg
+    chroot "$DIR_SYSROOT" efibootmgr -c -d "$TARGET_DISK" -p 1 -L 'CentOS Linux' -l '\EFI\centos\shimx64.efi'
+else
+    chroot "$DIR_SYSROOT" grub2-install --target=i386-pc "$TARGET_DISK"
+    chroot "$DIR_SYSROOT" grub2-mkconfig -o /boot/grub2/grub.cfg
+fi
+
+umount -l "$DIR_SYSROOT/sys"
+umount "$DIR_SYSROOT/proc"
+umount "$DIR_SYSROOT/dev"
+sync
+
+echo "Installation complete"
@@ -1,35 +1,89 @@
 from __future__ import print_function
 import atexit
 import urwid
+import os
 import os.path
 import signal
-import subprocess
 import sys
 
+from os_progress import InstallProgress
+
 
 TEXT_MAIN_CAPTION = 'CentOS-7 initial setup'
 TEXT_OPERATION_IS_PROGRESS = 'Please wait, operation is in progress ...'
 TEXT_OPERATION_DONE = "Done, press 'ESC' to exit"
+PROGRESS_READ_SIZE = 64 * 1024
 
 
 class AppDisplay(urwid.WidgetPlaceholder):
-    def __init__(self, py_script):
+    def __init__(self, py_script, debug=False):
         title = TEXT_MAIN_CAPTION
         self.done = False
-        self.term = urwid.Terminal([sys.executable, '-u', py_script])
+        self.loop = None
+        # os-logwrap.py copies the installer output into this pipe as well, it is parsed
+        # for the progress bar while the terminal shows it as it is
+        self.progress = InstallProgress()
+        self.progress_fd, progress_wfd = os.pipe()
+        if hasattr(os, 'set_inheritable'):
+            os.set_inheritable(progress_wfd, True)
+        args = [sys.executable, '-u', py_script, '--progress-fd', str(progress_wfd)] + (['--debug'] if debug else [])
+        self.progress_wfd = progress_wfd
+        self.term = urwid.Terminal(args)
         self.status_bar = urwid.Text(TEXT_OPERATION_IS_PROGRESS)
-        self.view = urwid.LineBox(urwid.Frame(self.term, footer=self.status_bar), title=title)
+        self.progress_bar = urwid.ProgressBar('app.progress', 'app.progress.done', 0, 100)
+        footer = urwid.Columns([self.status_bar, self.progress_bar], dividechars=1)
+        self.view = urwid.LineBox(urwid.Frame(self.term, footer=footer), title=title)
 
         urwid.WidgetPlaceholder.__init__(self, self.view)
 
     def on_done(self, *args):
         self.done = True
+        self.stop_progress()
         self.status_bar.set_text(TEXT_OPERATION_DONE)
 
+    def stop_progress(self):
+        if self.progress_fd is None:
+            return
+        self.loop.remove_watch_file(self.progress_fd)
+        os.close(self.progress_fd)
+        os.close(self.progress_wfd)
+        self.progress_fd = None
+
+    def update_progress(self):
+        self.progress_bar.set_completion(int(self.progress.fraction * 100))
+        text = self.progress.status_text()
+        self.status_bar.set_text(text if text else TEXT_OPERATION_IS_PROGRESS)
+
+    def on_progress_data(self):
+        try:
+            data = os.read(self.progress_fd, PROGRESS_READ_SIZE)
+        except OSError:
+            data = b''
+        if not data:
+            self.stop_progress()
+            return
+        if self.progress.feed(data):
+            self.update_progress()
+
+    def on_clock(self, loop, user_data):
+        # the ETA counts down between package lines too
+        if self.done:
+            return
+        if self.progress.phase is not None:
+            self.update_progress()
+        loop.set_alarm_in(1, self.on_clock)
+
     def main(self):
-        loop = urwid.MainLoop(self)
+        palette = [
+            ('app.progress', 'light gray', 'dark blue'),
+            ('app.progress.done', 'white', 'dark cyan'),
+        ]
+        loop = urwid.MainLoop(self, palette)
+        self.loop = loop
         self.term.main_loop = loop
         urwid.connect_signal(self.term, 'closed', self.on_done)
+        loop.watch_file(self.progress_fd, self.on_progress_data)
+        loop.set_alarm_in(1, self.on_clock)
         loop.run()
 
     def keypress(self, size, key):
@@ -46,10 +100,11 @@ def clear_screen():
 
 def main(py_script):
     signal.signal(signal.SIGINT, signal.SIG_IGN)
-    if not '--debug' in sys.argv:
+    debug = '--debug' in sys.argv
+    if not debug:
         atexit.register(clear_screen)
     try:
-        AppDisplay(py_script).main()
+        AppDisplay(py_script, debug).main()
     except KeyboardInterrupt:
         pass
 
@@ -9,8 +9,15 @@ KICKSTART_TEMPLATE_FILE="$DIR_ISO_ROOT/os-template.cfg"
 KICKSTART_CONFIG_FILE='/tmp/os-install.cfg'
 
 INI_CONFIG_INSTALL="/tmp/os-config.ini"
+# written by os-logwrap.py from this script's output
+INSTALL_LOG_FILE='/tmp/os-install.log'
 HASHED_ROOT_PASSWORD_FILE='/root/os-config.shadow'
 
+# With a golden image on the ISO (scripts/create-golden.sh) it is written to the disk
+# instead of installing the packages with anaconda; 'os.install=anaconda' on the kernel
+# command line installs with anaconda all the same.
+IMAGE_INFO_FILE="$DIR_ISO_ROOT/golden/rootfs.info"
+
 
 safe_copy_file() {
     local SRC_FILE="$1"
@@ -45,14 +52,21 @@ if [ ! -f "$KICKSTART_TEMPLATE_FILE" ]; then
    exit 1
 fi
 
-set +e
-HOST_NAME=$(python "$DIR_ISO_ROOT/os-getconf.py" '/tmp/os-config.ini' 'main' 'hostname')
-set -e
-if [ -n "$HOST_NAME" ]; then
-    echo "Host name to be used: '$HOST_NAME'"
-else
-    echo "ERROR: Got empty host name for target."
-    exit 1
+INSTALL_MODE='anaconda'
+if [ -f "$IMAGE_INFO_FILE" ]; then
+    INSTALL_MODE='image'
+fi
+CMDLINE_INSTALL_MODE=$(tr ' ' '\n' < /proc/cmdline | sed -n 's/^os\.install=//p' | tail -n 1)
+if [ -n "$CMDLINE_INSTALL_MODE" ]; then
+    INSTALL_MODE="$CMDLINE_INSTALL_MODE"
+fi
+if [ "$INSTALL_MODE" != 'anaconda' ] && [ "$INSTALL_MODE" != 'image' ]; then
+   echo "ERROR: Unknown install mode 'os.install=$INSTALL_MODE', expected 'anaconda' or 'image'."
+   exit 1
+fi
+if [ "$INSTALL_MODE" = 'image' ] && [ ! -f "$IMAGE_INFO_FILE" ]; then
+   echo "ERROR: File not found: '$IMAGE_INFO_FILE'"
+   exit 1
 fi
 
 HAVE_ROOT_PASSWORD_HASH_FILE='n'
@@ -60,17 +74,33 @@ if [ -f "$HASHED_ROOT_PASSWORD_FILE" ]; then
     chattr +i "$HASHED_ROOT_PASSWORD_FILE"
     HAVE_ROOT_PASSWORD_HASH_FILE='y'
 fi
+
+# one interpreter renders the kickstart and hands back HOST_NAME, ROOTPW_CONFIG and NETWORK_CONFIG
+echo -n "Rendering '$KICKSTART_TEMPLATE_FILE' as '$KICKSTART_CONFIG_FILE' ... "
 set +e
-ROOTPW_CONFIG=$(python "$DIR_ISO_ROOT/os-getconf.py" @rootpw)
+INSTALL_CONFIG=$(python "$DIR_ISO_ROOT/os-getconf.py" --render "$INI_CONFIG_INSTALL" "$KICKSTART_TEMPLATE_FILE" "$KICKSTART_CONFIG_FILE")
+RENDER_STATUS=$?
 set -e
+if [ "$RENDER_STATUS" != "0" ]; then
+    echo "failed"
+    echo "ERROR: Can't render the kickstart configuration."
+    exit 1
+fi
+echo "done"
+eval "$INSTALL_CONFIG"
+
+if [ -n "$HOST_NAME" ]; then
+    echo "Host name to be used: '$HOST_NAME'"
+else
+    echo "ERROR: Got empty host name for target."
+    exit 1
+fi
+
 if [ -z "$ROOTPW_CONFIG" ]; then
     echo "ERROR: Got a broken 'rootpw' configuration."
     exit 1
 fi
 
-set +e
-NETWORK_CONFIG=$(python "$DIR_ISO_ROOT/os-getconf.py" $INI_CONFIG_INSTALL @network)
-set -e
 if [ -n "$NETWORK_CONFIG" ]; then
     echo "Network configuration to be used: '$NETWORK_CONFIG'"
 else
@@ -78,19 +108,31 @@ else
     exit 1
 fi
 
-safe_copy_file "$KICKSTART_TEMPLATE_FILE" "$KICKSTART_CONFIG_FILE"
-sed -i "s/@NETWORK@/$NETWORK_CONFIG/" "$KICKSTART_CONFIG_FILE"
-sed -i "s/@ROOTPASSWORD@/$ROOTPW_CONFIG/" "$KICKSTART_CONFIG_FILE"
-
 if [ ! -f "$KICKSTART_CONFIG_FILE" ]; then
    echo "ERROR: File not found: '$KICKSTART_CONFIG_FILE'"
    exit 1
 fi
-echo "Anaconda initial setup ..."
-anaconda -C --kickstart "$KICKSTART_CONFIG_FILE"
-if [ ! -f "$DIR_SYSROOT/root/anaconda-ks.cfg" ]; then
-   echo "Operating system installation has failed. Please examine logs."
-   exit 1
+if [ "$INSTALL_MODE" = 'image' ]; then
+    echo "Image-based setup ..."
+    if ! bash "$DIR_ISO_ROOT/os-install-image.sh" "$IMAGE_INFO_FILE" "$INI_CONFIG_INSTALL" "$DIR_SYSROOT"; then
+       echo "Operating system installation has failed. Please examine logs."
+       exit 1
+    fi
+else
+    # packages are read into memory ahead of rpm, in the order it installs them
+    python "$DIR_ISO_ROOT/os-prefetch.py" --log "$INSTALL_LOG_FILE" --pid $$ &
+    PREFETCH_PID=$!
+    echo "Anaconda initial setup ..."
+    set +e
+    anaconda -C --kickstart "$KICKSTART_CONFIG_FILE"
+    ANACONDA_STATUS=$?
+    set -e
+    kill "$PREFETCH_PID" 2> /dev/null || true
+    wait "$PREFETCH_PID" || true
+    if [ "$ANACONDA_STATUS" != "0" ] || [ ! -f "$DIR_SYSROOT/root/anaconda-ks.cfg" ]; then
+       echo "Operating system installation has failed. Please examine logs."
+       exit 1
+    fi
 fi
 if [ "$HAVE_ROOT_PASSWORD_HASH_FILE" != 'y' ]; then
     safe_copy_file_in_dir "$DIR_ISO_ROOT/os-unseal-tty1.sh" "$DIR_SYSROOT/tmp"
@@ -1,39 +1,148 @@
 from __future__ import print_function
+import errno
+import fcntl
 import os
 import os.path
+import select
 import signal
 import subprocess
+import sys
 import time
 
 
 DIR_HERE = os.path.normpath(os.path.abspath(os.path.dirname(__file__)))
 INSTALL_SCRIPT = os.path.join(DIR_HERE, 'os-install.sh')
+LOG_FILE = '/tmp/os-install.log'
+# at most this much is read off the pipe and written out in one go
+CHUNK_SIZE = 64 * 1024
+
 
 def preexec(): # Don't forward signals.
     os.setpgrp()
 
 
-def main():
-    ret_code = None
-    output_file = '/tmp/os-install.log'
-    with open(os.devnull, 'rw') as dev_null:
-        with open(output_file, mode='wt') as ofh:
-            with open(output_file, mode='rt') as ifh:
-                p = subprocess.Popen(['/bin/bash', INSTALL_SCRIPT],
-                    stdin=dev_null, stdout=ofh, stderr=subprocess.STDOUT, preexec_fn = preexec)
-                while True:
-                    line = ifh.readline()
-                    if not line:
-                        ret_code = p.poll()
-                        if ret_code is not None:
-                            p.wait()
-                            break
-                        time.sleep(0.1)
-                        continue
-                    print(line, end='')
+def set_nonblocking(fd):
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+
+def write_all(fd, data):
+    while data:
+        written = os.write(fd, data)
+        data = data[written:]
+
+
+class TeeStats:
+    # throughput and the time from the pipe becoming readable to the data being written out
+    def __init__(self):
+        self.started = time.time()
+        self.nbytes = 0
+        self.reads = 0
+        self.wakeups = 0
+        self.max_chunk = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def add(self, nbytes, latency):
+        self.nbytes += nbytes
+        self.reads += 1
+        self.max_chunk = max(self.max_chunk, nbytes)
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+
+    def report(self):
+        elapsed = max(time.time() - self.started, 0.001)
+        return '[logwrap] {} bytes in {:.1f}s ({:.1f} KiB/s), {} wakeups, {} reads, {:.0f} bytes/read, max {} bytes, latency avg {:.3f}ms max {:.3f}ms'.format(
+            self.nbytes, elapsed, self.nbytes / 1024.0 / elapsed, self.wakeups, self.reads,
+            float(self.nbytes) / max(self.reads, 1), self.max_chunk,
+            self.latency_total * 1000.0 / max(self.reads, 1), self.latency_max * 1000.0)
+
+
+def drain(src_fd, dst_fds, stats, ready):
+    # copies whatever the pipe holds; False at end of file. A destination whose reader
+    # has gone away is dropped, the installation goes on without it.
+    while True:
+        try:
+            data = os.read(src_fd, CHUNK_SIZE)
+        except OSError as exc:
+            if exc.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return True
+            raise
+        if not data:
+            return False
+        for fd in list(dst_fds):
+            try:
+                write_all(fd, data)
+            except OSError as exc:
+                if exc.errno not in (errno.EPIPE, errno.EIO):
+                    raise
+                dst_fds.remove(fd)
+        stats.add(len(data), time.time() - ready)
+        ready = time.time()
+
+
+def tee(src_fd, dst_fds, stats, child):
+    # Sleeps in poll() until the child writes something, then drains the pipe and writes
+    # every chunk to all destinations at once. Returns at end of file, or once the child
+    # has exited and its output is read, even if a process it left behind holds the pipe:
+    # SIGCHLD wakes poll() up through the wakeup fd.
+    wake_r, wake_w = os.pipe()
+    set_nonblocking(wake_r)
+    set_nonblocking(wake_w)
+    set_nonblocking(src_fd)
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+    signal.set_wakeup_fd(wake_w)
+    poller = select.poll()
+    poller.register(src_fd, select.POLLIN | select.POLLPRI)
+    poller.register(wake_r, select.POLLIN)
+    try:
+        while True:
+            if child.poll() is not None:
+                drain(src_fd, dst_fds, stats, time.time())
+                return
+            try:
+                events = poller.poll()
+            except (select.error, OSError) as exc:
+                if exc.args[0] == errno.EINTR:
+                    continue
+                raise
+            ready = time.time()
+            stats.wakeups += 1
+            for fd, event in events:
+                if fd == wake_r:
+                    try:
+                        os.read(wake_r, 512)
+                    except OSError:
+                        pass
+                elif event & select.POLLNVAL or not drain(src_fd, dst_fds, stats, ready):
+                    return
+    finally:
+        signal.set_wakeup_fd(-1)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        os.close(wake_r)
+        os.close(wake_w)
+
+
+def main(debug=False, progress_fd=None):
+    # 'progress_fd' gets a copy of the output for os-install-tui.py's progress bar
+    stats = TeeStats()
+    with open(os.devnull, 'rb') as dev_null:
+        with open(LOG_FILE, mode='wb') as ofh:
+            p = subprocess.Popen(['/bin/bash', INSTALL_SCRIPT],
+                stdin=dev_null, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, close_fds=True, preexec_fn = preexec)
+            sys.stdout.flush()
+            dst_fds = [ofh.fileno(), sys.stdout.fileno()] + ([progress_fd] if progress_fd is not None else [])
+            tee(p.stdout.fileno(), dst_fds, stats, p)
+            p.stdout.close()
+            ret_code = p.wait()
+    if progress_fd is not None:
+        os.close(progress_fd)
+    if debug:
+        print(stats.report())
     return ret_code
 
 
 if __name__ == '__main__':
     signal.signal(signal.SIGINT, signal.SIG_IGN)
-    exit(main())
+    progress_fd = int(sys.argv[sys.argv.index('--progress-fd') + 1]) if '--progress-fd' in sys.argv else None
+    exit(main('--debug' in sys.argv, progress_fd))
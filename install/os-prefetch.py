@@ -0,0 +1,325 @@
+from __future__ import print_function
+import argparse
+import glob
+import gzip
+import os
+import os.path
+import signal
+import sys
+import time
+import xml.etree.ElementTree as ET
+from os_progress import RE_PACKAGE
+
+
+# Reads the packages of the install media repo into the page cache ahead of rpm, in the
+# order the transaction installs them, so anaconda finds them in memory instead of
+# seeking over a virtual CD or a slow USB stick between squashfs reads. The order is the
+# one yum gave the kickstart's transaction when the build ordered it (install-order.lst
+# next to packages/); without it the repo is put in dependency order from its primary
+# data, every package after what it requires, as rpm orders a transaction. The
+# 'Installing <package> (<n>/<m>)' lines of the install log tell how far rpm has got:
+# packages read ahead of it never take more than a share of the available memory, and a
+# package rpm opens before it was read counts as a stall.
+#
+#   python os-prefetch.py --log /tmp/os-install.log --pid <anaconda's parent>
+
+DIR_ISO_ROOT = '/run/initramfs/live'
+PACKAGES_DIR = os.path.join(DIR_ISO_ROOT, 'packages')
+ORDER_FILE = os.path.join(DIR_ISO_ROOT, 'install-order.lst')
+NS_COMMON = '{http://linux.duke.edu/metadata/common}'
+NS_RPM = '{http://linux.duke.edu/metadata/rpm}'
+MEMINFO_FILE = '/proc/meminfo'
+# read-ahead window: this share of MemAvailable, read again as the install goes on
+MEMORY_SHARE = 0.25
+MIN_WINDOW = 16 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+IDLE_SECONDS = 0.1
+
+
+class PrefetchEntry:
+    def __init__(self, index, path, size):
+        self.index = index
+        self.path = path
+        self.size = size
+        self.read = 0
+        self.installed = False
+
+    def is_read(self):
+        return self.read >= self.size
+
+
+class PrefetchStats:
+    def __init__(self):
+        self.started = time.time()
+        self.hits = 0
+        self.late = 0
+        self.misses = 0
+        self.unknown = 0
+        self.nbytes = 0
+        self.window_max = 0
+        self.ahead_max = 0
+
+    def report(self):
+        elapsed = max(time.time() - self.started, 0.001)
+        return '[prefetch] {} hits, {} late, {} stalls, {} not on the media; {} MiB read in {:.1f}s ({:.1f} MiB/s), up to {} MiB ahead, window up to {} MiB'.format(
+            self.hits, self.late, self.misses, self.unknown, self.nbytes // (1024 * 1024), elapsed,
+            self.nbytes / 1048576.0 / elapsed, self.ahead_max // (1024 * 1024), self.window_max // (1024 * 1024))
+
+
+def read_mem_available(path=MEMINFO_FILE):
+    try:
+        with open(path, mode='rt') as fh:
+            for ln in fh:
+                if ln.startswith('MemAvailable:'):
+                    return int(ln.split()[1]) * 1024
+    except (IOError, OSError, ValueError):
+        pass
+    return None
+
+
+def read_window(share=MEMORY_SHARE):
+    available = read_mem_available()
+    if available is None:
+        return MIN_WINDOW
+    return max(int(available * share), MIN_WINDOW)
+
+
+def package_keys(file_name):
+    # 'bash-4.2.46-34.el7.x86_64.rpm' -> the ways the install log may name the package
+    stem = file_name[:-len('.rpm')] if file_name.endswith('.rpm') else file_name
+    nvr, _, arch = stem.rpartition('.')
+    name = nvr.rsplit('-', 2)[0]
+    return [ stem, '{}.{}'.format(name, arch), name ]
+
+
+def load_primary(packages_dir):
+    # package file name -> (provided, required) capabilities from the repo's primary data,
+    # None without it
+    paths = glob.glob(os.path.join(packages_dir, 'repodata', '*primary.xml.gz'))
+    if not paths:
+        return None
+    packages = {}
+    fh = gzip.open(paths[0], mode='rb')
+    try:
+        for _, elem in ET.iterparse(fh):
+            if elem.tag != NS_COMMON + 'package':
+                continue
+            fmt = elem.find(NS_COMMON + 'format')
+            provides = [ elem.findtext(NS_COMMON + 'name') ]
+            provides += [ e.get('name') for e in fmt.findall(NS_RPM + 'provides/' + NS_RPM + 'entry') ]
+            provides += [ f.text for f in fmt.findall(NS_COMMON + 'file') ]
+            requires = [ e.get('name') for e in fmt.findall(NS_RPM + 'requires/' + NS_RPM + 'entry') if not e.get('name').startswith('rpmlib(') ]
+            packages[os.path.basename(elem.find(NS_COMMON + 'location').get('href'))] = (provides, requires)
+            elem.clear()
+    finally:
+        fh.close()
+    return packages
+
+
+def dependency_order(files, primary):
+    # every package after the packages it requires, depth first over the requirements;
+    # a dependency cycle is cut where it is found, rpm breaks them up as well
+    providers = {}
+    for name in files:
+        for capability in primary.get(name, ([], []))[0]:
+            providers.setdefault(capability, name)
+    ordered = []
+    visited = set()
+    for root in files:
+        if root in visited:
+            continue
+        visited.add(root)
+        stack = [ (root, iter(primary.get(root, ([], []))[1])) ]
+        while stack:
+            name, requires = stack[-1]
+            for capability in requires:
+                provider = providers.get(capability)
+                if provider is not None and provider not in visited:
+                    visited.add(provider)
+                    stack.append((provider, iter(primary.get(provider, ([], []))[1])))
+                    break
+            else:
+                stack.pop()
+                ordered.append(name)
+    return ordered
+
+
+def load_order(packages_dir, order_file):
+    # the recorded order, then whatever it does not list; without it the dependency order
+    # of the repo, and the media order as the last resort. Returns where the order came from.
+    files = sorted([ name for name in os.listdir(packages_dir) if name.endswith('.rpm') ])
+    source = 'media'
+    if order_file and os.path.isfile(order_file):
+        ordered = []
+        present = set(files)
+        with open(order_file, mode='rt') as fh:
+            for ln in [ ln.strip() for ln in fh ]:
+                if ln and not ln.startswith('#') and ln in present:
+                    ordered.append(ln)
+                    present.discard(ln)
+        files = ordered + [ name for name in files if name in present ]
+        source = order_file
+    else:
+        primary = load_primary(packages_dir)
+        if primary is not None:
+            files = dependency_order(files, primary)
+            source = 'dependencies'
+    entries = [ PrefetchEntry(idx, os.path.join(packages_dir, name), os.path.getsize(os.path.join(packages_dir, name))) for idx, name in enumerate(files) ]
+    return entries, source
+
+
+class Prefetcher:
+    def __init__(self, entries, stats):
+        self.entries = entries
+        self.stats = stats
+        self.by_key = {}
+        for entry in entries:
+            for key in package_keys(os.path.basename(entry.path)):
+                self.by_key.setdefault(key, []).append(entry)
+        self.next_index = 0
+        # past the furthest package rpm has opened; what is before it and was not opened
+        # is not part of the transaction
+        self.position = 0
+        self.fh = None
+
+    def on_install(self, package):
+        entry = None
+        for candidate in self.by_key.get(package, []):
+            if not candidate.installed:
+                entry = candidate
+                break
+        if entry is None:
+            self.stats.unknown += 1
+            return
+        entry.installed = True
+        self.position = max(self.position, entry.index + 1)
+        if entry.is_read():
+            self.stats.hits += 1
+        elif entry.read > 0:
+            self.stats.late += 1
+        else:
+            self.stats.misses += 1
+
+    def bytes_ahead(self):
+        # read and still waiting for rpm
+        return sum([ entry.read for entry in self.entries[self.position:self.next_index + 1] if not entry.installed ])
+
+    def current(self):
+        # the next package to read; the ones rpm already got to are skipped
+        self.next_index = max(self.next_index, self.position)
+        while self.next_index < len(self.entries):
+            entry = self.entries[self.next_index]
+            if not entry.installed and not entry.is_read():
+                return entry
+            self.close()
+            self.next_index += 1
+        return None
+
+    def step(self, window):
+        # reads one chunk; False when there is nothing to read or the window is full
+        entry = self.current()
+        if entry is None:
+            return False
+        ahead = self.bytes_ahead()
+        self.stats.ahead_max = max(self.stats.ahead_max, ahead)
+        if ahead + CHUNK_SIZE > window:
+            return False
+        if self.fh is None:
+            self.fh = open(entry.path, mode='rb')
+        data = self.fh.read(CHUNK_SIZE)
+        if not data:
+            entry.read = entry.size
+        else:
+            entry.read += len(data)
+            self.stats.nbytes += len(data)
+        return True
+
+    def is_done(self):
+        return self.current() is None
+
+    def close(self):
+        if self.fh is not None:
+            self.fh.close()
+            self.fh = None
+
+
+class LogFollower:
+    # the lines appended to the install log since the last call; read with os.read(),
+    # a file object stays at end of file once it got there
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+        self._partial = ''
+
+    def read_lines(self):
+        if self.fd is None:
+            if not os.path.isfile(self.path):
+                return []
+            self.fd = os.open(self.path, os.O_RDONLY)
+        chunks = []
+        while True:
+            data = os.read(self.fd, 65536)
+            if not data:
+                break
+            chunks.append(data)
+        data = b''.join(chunks)
+        if not data:
+            return []
+        lines = (self._partial + data.decode('utf-8', 'replace')).split('\n')
+        self._partial = lines.pop()
+        return lines
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+def run(prefetcher, follower, stats, pid=None):
+    # until the install is complete or 'pid' is gone; with everything read, only the log
+    # is followed, for the statistics
+    window_checked = None
+    while pid is None or is_alive(pid):
+        if window_checked is None or time.time() - window_checked >= 1.0:
+            window = read_window()
+            window_checked = time.time()
+            stats.window_max = max(stats.window_max, window)
+        for ln in follower.read_lines():
+            match = RE_PACKAGE.match(ln.strip('\r').strip())
+            if match:
+                prefetcher.on_install(match.group(1))
+            elif ln.strip().startswith('Installation complete'):
+                return
+        if not prefetcher.step(window):
+            time.sleep(IDLE_SECONDS)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--log', required=True, help='install log to follow')
+    parser.add_argument('--packages', default=PACKAGES_DIR)
+    parser.add_argument('--order', default=ORDER_FILE, help='package files in install order')
+    parser.add_argument('--pid', type=int, help='stop when this process is gone')
+    args = parser.parse_args()
+
+    stats = PrefetchStats()
+    # stopped with SIGTERM by os-install.sh once anaconda is done, the report is printed all the same
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    entries, source = load_order(args.packages, args.order)
+    prefetcher = Prefetcher(entries, stats)
+    print('[prefetch] {} packages, {} MiB, order: {}'.format(len(prefetcher.entries),
+        sum([ entry.size for entry in prefetcher.entries ]) // (1024 * 1024), source))
+    sys.stdout.flush()
+    try:
+        run(prefetcher, LogFollower(args.log), stats, args.pid)
+    finally:
+        prefetcher.close()
+        print(stats.report())
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+from __future__ import print_function
+import errno
+import os
+import os.path
+import re
+import socket
+import struct
+import sys
+
+
+# Inventory of the network interfaces, read from sysfs in one pass: name, MAC address,
+# driver, link state and speed of every interface backed by a device, so loopback,
+# bridges, tunnels and other virtual interfaces are left out. NetInventory keeps the
+# result; LinkWatcher listens to the kernel's link notifications over netlink and tells
+# which interfaces to read again, so nothing is probed one interface at a time.
+
+SYS_CLASS_NET = '/sys/class/net'
+ARPHRD_ETHER = 1
+NETLINK_ROUTE = 0
+RTMGRP_LINK = 1
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+IFLA_IFNAME = 3
+NLMSG_HEADER = struct.Struct('=IHHII')
+IFINFO_HEADER = struct.Struct('=BxHiII')
+RTA_HEADER = struct.Struct('=HH')
+_RE_DIGITS = re.compile(r'(\d+)')
+
+
+class NetInterface:
+    def __init__(self, name):
+        self.name = name
+        self.mac = None
+        self.driver = None
+        self.operstate = None
+        self.carrier = None
+        self.speed = None # Mb/s, None while the link is down or the driver does not tell
+
+    def has_link(self):
+        return bool(self.carrier)
+
+    def display_mac(self):
+        # '52-54-00-12-34-56', the way the installer has always shown MAC addresses
+        return self.mac.upper().replace(':', '-') if self.mac else None
+
+    def describe_link(self):
+        if not self.has_link():
+            state = 'No link'
+        elif self.speed:
+            state = 'Link up, {} Mb/s'.format(self.speed)
+        else:
+            state = 'Link up'
+        return '{} ({})'.format(state, self.driver) if self.driver else state
+
+
+def read_sysfs_value(path):
+    # None for attributes that are missing or cannot be read in the current state,
+    # e.g. 'speed' of an interface that is down
+    try:
+        with open(path, mode='rt') as fh:
+            return fh.read().strip()
+    except (IOError, OSError):
+        return None
+
+
+def read_sysfs_int(path):
+    value = read_sysfs_value(path)
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def read_interface(name, sys_dir=SYS_CLASS_NET):
+    # None for virtual interfaces and for interfaces that are gone
+    if_dir = os.path.join(sys_dir, name)
+    if not os.path.exists(os.path.join(if_dir, 'device')):
+        return None
+    if read_sysfs_int(os.path.join(if_dir, 'type')) != ARPHRD_ETHER:
+        return None
+    nic = NetInterface(name)
+    nic.mac = read_sysfs_value(os.path.join(if_dir, 'address'))
+    driver_link = os.path.join(if_dir, 'device', 'driver')
+    if os.path.islink(driver_link):
+        nic.driver = os.path.basename(os.readlink(driver_link))
+    nic.operstate = read_sysfs_value(os.path.join(if_dir, 'operstate'))
+    nic.carrier = read_sysfs_int(os.path.join(if_dir, 'carrier'))
+    speed = read_sysfs_int(os.path.join(if_dir, 'speed'))
+    nic.speed = speed if speed is not None and speed > 0 else None
+    return nic
+
+
+def natural_key(name):
+    # 'eth2' before 'eth10'
+    return [ int(v) if v.isdigit() else v for v in _RE_DIGITS.split(name) ]
+
+
+def scan_interfaces(sys_dir=SYS_CLASS_NET):
+    if not os.path.isdir(sys_dir):
+        return []
+    interfaces = []
+    for name in sorted(os.listdir(sys_dir), key=natural_key):
+        nic = read_interface(name, sys_dir)
+        if nic is not None:
+            interfaces.append(nic)
+    return interfaces
+
+
+class NetInventory:
+    def __init__(self, sys_dir=None):
+        self.sys_dir = sys_dir if sys_dir is not None else SYS_CLASS_NET
+        self.interfaces = scan_interfaces(self.sys_dir)
+
+    def names(self):
+        return [ nic.name for nic in self.interfaces ]
+
+    def get(self, name):
+        for nic in self.interfaces:
+            if nic.name == name:
+                return nic
+        return None
+
+    def refresh(self, names=None):
+        # reads the given interfaces again, all of them without 'names'; True if anything changed
+        if names is None:
+            before = [ vars(nic) for nic in self.interfaces ]
+            self.interfaces = scan_interfaces(self.sys_dir)
+            return before != [ vars(nic) for nic in self.interfaces ]
+        changed = False
+        for name in names:
+            old = self.get(name)
+            nic = read_interface(name, self.sys_dir)
+            if old is not None:
+                self.interfaces.remove(old)
+            if nic is not None:
+                self.interfaces.append(nic)
+            if (vars(old) if old is not None else None) != (vars(nic) if nic is not None else None):
+                changed = True
+        self.interfaces.sort(key=lambda nic: natural_key(nic.name))
+        return changed
+
+
+class LinkWatcher:
+    # RTM_NEWLINK/RTM_DELLINK notifications: carrier changes, renames, hotplug
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+        try:
+            self.sock.bind((0, RTMGRP_LINK))
+            self.sock.setblocking(False)
+        except Exception:
+            self.sock.close()
+            raise
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        self.sock.close()
+
+    def read_changes(self):
+        # names of the interfaces with news since the last call; None when notifications
+        # were lost and everything has to be read again
+        names = set()
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except socket.error as ex:
+                if ex.errno in (errno.EAGAIN, errno.EINTR):
+                    break
+                if ex.errno == errno.ENOBUFS:
+                    return None
+                raise
+            names.update(parse_link_messages(data))
+        return names
+
+
+def parse_link_messages(data):
+    names = []
+    offset = 0
+    while offset + NLMSG_HEADER.size <= len(data):
+        msg_len, msg_type, _, _, _ = NLMSG_HEADER.unpack_from(data, offset)
+        if msg_len < NLMSG_HEADER.size:
+            break
+        if msg_type in (RTM_NEWLINK, RTM_DELLINK):
+            attr_offset = offset + NLMSG_HEADER.size + IFINFO_HEADER.size
+            end = offset + msg_len
+            while attr_offset + RTA_HEADER.size <= end:
+                attr_len, attr_type = RTA_HEADER.unpack_from(data, attr_offset)
+                if attr_len < RTA_HEADER.size:
+                    break
+                if attr_type == IFLA_IFNAME:
+                    value = data[attr_offset + RTA_HEADER.size:attr_offset + attr_len]
+                    names.append(value.split(b'\0', 1)[0].decode('utf-8', 'replace'))
+                attr_offset += (attr_len + 3) & ~3
+        offset += (msg_len + 3) & ~3
+    return names
+
+
+def start_link_watcher():
+    # None where netlink is not available, the inventory then stays as it was read
+    try:
+        return LinkWatcher()
+    except (AttributeError, socket.error, OSError):
+        return None
+
+
+def main():
+    # prints the inventory, e.g. 'python os_netinfo.py'
+    for nic in NetInventory(sys.argv[1] if len(sys.argv) > 1 else None).interfaces:
+        print('{:<12}{:<20}{:<10}{}'.format(nic.name, nic.display_mac() or '-', nic.operstate or '-', nic.describe_link()))
+
+
+if __name__ == '__main__':
+    main()
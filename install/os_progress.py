@@ -0,0 +1,161 @@
+from __future__ import print_function
+import re
+import sys
+import time
+
+
+# Follows the output of 'anaconda -C' and tells how far the installation has got. Phase
+# messages move the progress to fixed points, the 'Installing <package> (<n>/<m>)' lines
+# move it through the package range in between. The ETA of the package phase comes from
+# the measured time per package so far. The image-based install (os-install-image.sh)
+# is followed the same way, its 'Writing image <n>/<m> MiB' lines take the place of the
+# package lines.
+
+RE_PACKAGE = re.compile(r'^Installing (\S+) \((\d+)/(\d+)\)')
+RE_IMAGE = re.compile(r'^Writing image (\d+)/(\d+) MiB')
+# pattern, phase title, progress when the phase starts
+PHASES = [
+    (re.compile(r'^Partitioning disk'), 'Partitioning', 0.01),
+    (re.compile(r'^Growing the root file system'), 'Growing the root file system', 0.86),
+    (re.compile(r'^Applying host settings'), 'Applying host settings', 0.88),
+    (re.compile(r'^Setting up the installation environment'), 'Setting up', 0.01),
+    (re.compile(r'^Creating \S+ on /dev/'), 'Creating file systems', 0.02),
+    (re.compile(r'^Running pre-installation scripts'), 'Pre-installation scripts', 0.04),
+    (re.compile(r'^Starting package installation process'), 'Preparing packages', 0.05),
+    (re.compile(r'^Preparing transaction from installation source'), 'Preparing transaction', 0.07),
+    (re.compile(r'^Performing post-installation setup tasks'), 'Post-installation setup', 0.86),
+    (re.compile(r'^Installing boot ?loader'), 'Installing boot loader', 0.92),
+    (re.compile(r'^Running post-installation scripts'), 'Post-installation scripts', 0.95),
+    (re.compile(r'^Installation complete'), 'Complete', 1.0),
+]
+PHASE_PACKAGES = 'Installing packages'
+PACKAGES_RANGE = (0.10, 0.85)
+PHASE_IMAGE = 'Writing image'
+IMAGE_RANGE = (0.03, 0.85)
+
+
+class InstallProgress:
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.phase = None
+        self.fraction = 0.0
+        self.package = None
+        self.package_index = 0
+        self.package_count = 0
+        self.packages_started = None
+        self.package_latest = None
+        self.image_mb = 0
+        self.image_total_mb = 0
+        self.image_started = None
+        self.image_started_mb = 0
+        self.image_latest = None
+        self._partial = ''
+
+    def feed(self, data):
+        # 'data' may end in the middle of a line, the rest is kept for the next call;
+        # True if any line changed the progress
+        if isinstance(data, bytes):
+            data = data.decode('utf-8', 'replace')
+        lines = (self._partial + data).split('\n')
+        self._partial = lines.pop()
+        changed = False
+        for ln in lines:
+            changed = self.feed_line(ln) or changed
+        return changed
+
+    def feed_line(self, line):
+        line = line.strip('\r').strip()
+        match = RE_PACKAGE.match(line)
+        if match:
+            now = self.clock()
+            if self.packages_started is None:
+                self.packages_started = now
+            self.phase = PHASE_PACKAGES
+            self.package = match.group(1)
+            self.package_index = int(match.group(2))
+            self.package_count = int(match.group(3))
+            self.package_latest = now
+            start, end = PACKAGES_RANGE
+            self.fraction = start + (end - start) * (self.package_index - 1) / float(max(self.package_count, 1))
+            return True
+        match = RE_IMAGE.match(line)
+        if match:
+            now = self.clock()
+            self.phase = PHASE_IMAGE
+            self.image_mb = int(match.group(1))
+            if self.image_started is None:
+                self.image_started = now
+                self.image_started_mb = self.image_mb
+            self.image_total_mb = int(match.group(2))
+            self.image_latest = now
+            start, end = IMAGE_RANGE
+            self.fraction = start + (end - start) * self.image_mb / float(max(self.image_total_mb, 1))
+            return True
+        for pattern, phase, fraction in PHASES:
+            if pattern.match(line):
+                self.phase = phase
+                self.fraction = max(self.fraction, fraction)
+                return True
+        return False
+
+    def seconds_per_package(self):
+        # the n-th line is printed when the n-th package starts, n - 1 are done by then
+        done = self.package_index - 1
+        if self.packages_started is None or done < 1:
+            return None
+        return (self.package_latest - self.packages_started) / float(done)
+
+    def seconds_per_mb(self):
+        # measured from the first line on, what came before it was not timed
+        done = self.image_mb - self.image_started_mb
+        if self.image_started is None or done < 1:
+            return None
+        return (self.image_latest - self.image_started) / float(done)
+
+    def eta(self):
+        # seconds until the last package is installed or the image is written, None
+        # outside of these phases
+        if self.phase == PHASE_IMAGE:
+            per_mb = self.seconds_per_mb()
+            if per_mb is None:
+                return None
+            remaining = self.image_total_mb - self.image_mb
+            return max(per_mb * remaining - (self.clock() - self.image_latest), 0.0)
+        per_package = self.seconds_per_package()
+        if self.phase != PHASE_PACKAGES or per_package is None:
+            return None
+        remaining = self.package_count - self.package_index + 1
+        return max(per_package * remaining - (self.clock() - self.package_latest), 0.0)
+
+    def status_text(self):
+        if self.phase is None:
+            return ''
+        if self.phase == PHASE_IMAGE:
+            text = '{} {}/{} MiB'.format(self.phase, self.image_mb, self.image_total_mb)
+        elif self.phase == PHASE_PACKAGES:
+            text = '{} {}/{}'.format(self.phase, self.package_index, self.package_count)
+        else:
+            return self.phase
+        eta = self.eta()
+        if eta is not None:
+            text += ', ETA {}'.format(format_duration(eta))
+        return text
+
+
+def format_duration(seconds):
+    seconds = int(seconds + 0.5)
+    if seconds >= 3600:
+        return '{}:{:02d}:{:02d}'.format(seconds // 3600, seconds // 60 % 60, seconds % 60)
+    return '{}:{:02d}'.format(seconds // 60, seconds % 60)
+
+
+def main():
+    # prints the progress of an install log, e.g. 'python os_progress.py < /tmp/os-install.log'
+    progress = InstallProgress()
+    for ln in sys.stdin:
+        if progress.feed_line(ln):
+            print('{:5.1f}% {}'.format(progress.fraction * 100.0, progress.status_text()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+from __future__ import print_function
+import argparse
+import gzip
+import os
+import os.path
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+
+from pkgstore import package_mtime
+from repodata import file_checksum
+from synthrpm import SyntheticPackage
+
+
+# Compares full and incremental ('--update') createrepo runs on a repo of synthetic
+# packages, then checks that the incremental metadata equals the one of a full run.
+# Besides updated packages, some are rebuilt under the same file name and size, and all
+# get the checksum-derived mtime the package store gives them, as in create-yumdata.sh.
+
+CREATEREPO_ARGS = ['createrepo', '--simple-md-filenames', '--quiet']
+METADATA_FILES = ['primary.xml.gz', 'filelists.xml.gz', 'other.xml.gz']
+
+
+def generate_packages(packages_dir, count, release='1'):
+    for i in range(count):
+        name = 'synth{:05d}'.format(i)
+        requires = ['synth{:05d}'.format(i - 1)] if i else []
+        files = ['/usr/bin/{}'.format(name), '/usr/share/{0}/{0}.conf'.format(name), '/usr/share/doc/{}/README'.format(name)]
+        SyntheticPackage(name, release=release, requires=requires, files=files).write(packages_dir)
+
+
+def bump_packages(packages_dir, count):
+    for i in range(count):
+        name = 'synth{:05d}'.format(i)
+        os.remove(os.path.join(packages_dir, SyntheticPackage(name).filename()))
+        SyntheticPackage(name, release='2', files=['/usr/bin/{}'.format(name)]).write(packages_dir)
+
+
+def rebuild_packages(packages_dir, first, count):
+    # same name, release and size, only the build time and so the checksum differ
+    for i in range(first, first + count):
+        name = 'synth{:05d}'.format(i)
+        path = os.path.join(packages_dir, SyntheticPackage(name).filename())
+        size = os.path.getsize(path)
+        os.remove(path)
+        requires = ['synth{:05d}'.format(i - 1)] if i else []
+        files = ['/usr/bin/{}'.format(name), '/usr/share/{0}/{0}.conf'.format(name), '/usr/share/doc/{}/README'.format(name)]
+        SyntheticPackage(name, requires=requires, files=files, buildtime=1500086400).write(packages_dir)
+        if os.path.getsize(path) != size:
+            raise Exception("Rebuilt '{}' changed its size".format(path))
+
+
+def set_store_mtimes(packages_dir):
+    for fname in os.listdir(packages_dir):
+        if fname.endswith('.rpm'):
+            path = os.path.join(packages_dir, fname)
+            mtime = package_mtime(file_checksum(path, 'sha256'))
+            os.utime(path, (mtime, mtime))
+
+
+def run_createrepo(packages_dir, extra_args):
+    started = time.time()
+    subprocess.check_call(CREATEREPO_ARGS + extra_args + [packages_dir])
+    return time.time() - started
+
+
+def load_packages_xml(path):
+    # packages are compared by pkgid, so the order createrepo writes them in does not matter
+    result = {}
+    with gzip.open(path) as fh:
+        for _, elem in ET.iterparse(fh):
+            tag = elem.tag.split('}')[-1]
+            if tag != 'package':
+                continue
+            pkgid = elem.get('pkgid')
+            if pkgid is None:
+                for child in elem:
+                    if child.tag.split('}')[-1] == 'checksum':
+                        pkgid = child.text
+            result[pkgid] = ET.tostring(elem)
+            elem.clear()
+    return result
+
+
+def compare_metadata(repodata_a, repodata_b):
+    mismatches = []
+    for fname in METADATA_FILES:
+        if load_packages_xml(os.path.join(repodata_a, fname)) != load_packages_xml(os.path.join(repodata_b, fname)):
+            mismatches.append(fname)
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--packages', type=int, default=3000)
+    parser.add_argument('--changed', type=int, default=30)
+    parser.add_argument('--rebuilt', type=int, default=10, help='packages rebuilt under the same file name and size')
+    parser.add_argument('--workdir')
+    args = parser.parse_args()
+
+    workdir = args.workdir if args.workdir else tempfile.mkdtemp(prefix='bench-createrepo-')
+    packages_dir = os.path.join(workdir, 'packages')
+    previous_dir = os.path.join(workdir, 'previous')
+    reference_dir = os.path.join(workdir, 'reference')
+    for path in [packages_dir, previous_dir, reference_dir]:
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.makedirs(path)
+
+    print("Generating {} synthetic packages in '{}' ...".format(args.packages, packages_dir))
+    generate_packages(packages_dir, args.packages)
+    set_store_mtimes(packages_dir)
+
+    full_time = run_createrepo(packages_dir, [])
+    shutil.copytree(os.path.join(packages_dir, 'repodata'), os.path.join(previous_dir, 'repodata'))
+
+    print("Changing {} packages ...".format(args.changed))
+    bump_packages(packages_dir, args.changed)
+    print("Rebuilding {} packages ...".format(args.rebuilt))
+    rebuild_packages(packages_dir, args.changed, args.rebuilt)
+    set_store_mtimes(packages_dir)
+
+    incremental_time = run_createrepo(packages_dir, ['--update', '--update-md-path', previous_dir])
+    reference_time = run_createrepo(packages_dir, ['--outputdir', reference_dir])
+
+    mismatches = compare_metadata(os.path.join(packages_dir, 'repodata'), os.path.join(reference_dir, 'repodata'))
+
+    print('')
+    print('{:<32}{:>10}'.format('run', 'seconds'))
+    print('{:<32}{:>10.2f}'.format('full ({} packages)'.format(args.packages), full_time))
+    print('{:<32}{:>10.2f}'.format('full after change', reference_time))
+    print('{:<32}{:>10.2f}'.format('incremental ({}+{} changed)'.format(args.changed, args.rebuilt), incremental_time))
+    if incremental_time > 0:
+        print('{:<32}{:>10.1f}x'.format('speedup', reference_time / incremental_time))
+    if mismatches:
+        print("ERROR: incremental metadata differs from a full run: {}".format(', '.join(mismatches)))
+        return 1
+    print('Incremental metadata is identical to a full run.')
+    if not args.workdir:
+        shutil.rmtree(workdir)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+from __future__ import print_function
+import argparse
+import glob
+import os
+import os.path
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from pkgclosure import parse_primary
+from pkgfetch import fetch_packages
+from pkgstore import PackageStore
+from repodata import parse_repomd
+from synthrpm import SyntheticPackage
+
+
+# Fetches an update of a local file:// mirror into a package store that holds the previous
+# version, once with full packages and once with the delta RPMs createrepo generated for
+# it, and reports the bytes each run downloaded. The mirror is made of synthetic packages,
+# or of the packages in --old-packages and --new-packages (e.g. two CentOS point releases)
+# for figures that mean something; synthetic packages have no payload, their deltas only
+# carry the header. Needs createrepo with --deltas support and applydeltarpm, as in the
+# build container.
+#
+#   python bench-deltarpm.py --packages 200 --changed 50
+#   python bench-deltarpm.py --old-packages /srv/centos-7.8/Packages --new-packages /srv/centos-7.9/Packages
+
+REPO_ID = 'mirror'
+
+
+def generate_packages(packages_dir, count, release='1'):
+    for i in range(count):
+        name = 'synth{:05d}'.format(i)
+        files = ['/usr/bin/{}'.format(name), '/usr/share/{0}/{0}.conf'.format(name)]
+        SyntheticPackage(name, release=release, files=files).write(packages_dir)
+
+
+def bump_packages(packages_dir, count):
+    for i in range(count):
+        name = 'synth{:05d}'.format(i)
+        os.remove(os.path.join(packages_dir, SyntheticPackage(name).filename()))
+        files = ['/usr/bin/{}'.format(name), '/usr/share/{0}/{0}.conf'.format(name)]
+        SyntheticPackage(name, release='2', files=files, buildtime=1500086400).write(packages_dir)
+
+
+def copy_packages(src_dir, dest_dir):
+    for path in glob.glob(os.path.join(src_dir, '*.rpm')):
+        shutil.copy2(path, dest_dir)
+
+
+def run_createrepo(packages_dir, extra_args):
+    subprocess.check_call(['createrepo', '--simple-md-filenames', '--quiet'] + extra_args + [packages_dir])
+
+
+def load_mirror_manifest(packages_dir):
+    repomd = parse_repomd(os.path.join(packages_dir, 'repodata', 'repomd.xml'))
+    primary = os.path.join(packages_dir, repomd.get('primary').location)
+    return {
+        'repos': {REPO_ID: 'file://' + os.path.abspath(packages_dir)},
+        'packages': [ pkg.manifest_entry() for pkg in parse_primary(primary, REPO_ID) ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--packages', type=int, default=200, help='synthetic packages in the mirror')
+    parser.add_argument('--changed', type=int, default=50, help='synthetic packages updated')
+    parser.add_argument('--old-packages', help='directory with the RPMs of the previous mirror state')
+    parser.add_argument('--new-packages', help='directory with the RPMs of the updated mirror state')
+    parser.add_argument('--jobs', type=int, default=4)
+    parser.add_argument('--workdir')
+    args = parser.parse_args()
+    if bool(args.old_packages) != bool(args.new_packages):
+        parser.error('--old-packages and --new-packages go together')
+
+    workdir = args.workdir if args.workdir else tempfile.mkdtemp(prefix='bench-deltarpm-')
+    mirror_dir = os.path.join(workdir, 'mirror')
+    old_dir = os.path.join(workdir, 'old')
+    for path in [mirror_dir, old_dir, os.path.join(workdir, 'store-full'), os.path.join(workdir, 'store-deltas')]:
+        if os.path.exists(path):
+            shutil.rmtree(path)
+    os.makedirs(mirror_dir)
+    os.makedirs(old_dir)
+
+    print("Creating the mirror in '{}' ...".format(mirror_dir))
+    if args.old_packages:
+        copy_packages(args.old_packages, mirror_dir)
+    else:
+        generate_packages(mirror_dir, args.packages)
+    run_createrepo(mirror_dir, [])
+    store_full = PackageStore(os.path.join(workdir, 'store-full'))
+    fetch_packages(store_full, load_mirror_manifest(mirror_dir), args.jobs, use_deltas=False)
+    shutil.copytree(store_full.root, os.path.join(workdir, 'store-deltas'), symlinks=True)
+    store_deltas = PackageStore(os.path.join(workdir, 'store-deltas'))
+
+    print("Updating the mirror and generating deltas ...")
+    copy_packages(mirror_dir, old_dir)
+    if args.new_packages:
+        for path in glob.glob(os.path.join(mirror_dir, '*.rpm')):
+            os.remove(path)
+        copy_packages(args.new_packages, mirror_dir)
+    else:
+        bump_packages(mirror_dir, args.changed)
+    run_createrepo(mirror_dir, ['--deltas', '--oldpackagedirs', old_dir, '--num-deltas', '1'])
+    manifest = load_mirror_manifest(mirror_dir)
+
+    print('')
+    print('Full packages:')
+    full = fetch_packages(store_full, manifest, args.jobs, use_deltas=False)
+    print('')
+    print('With deltas:')
+    deltas = fetch_packages(store_deltas, manifest, args.jobs, use_deltas=True)
+
+    missing = [ pkg['nevra'] for pkg in manifest['packages'] if not store_deltas.contains(pkg) ]
+    print('')
+    print('{:<24}{:>10}{:>14}'.format('run', 'packages', 'downloaded'))
+    print('{:<24}{:>10}{:>12.2f}MiB'.format('full', full['done'], full['bytes'] / 1048576.0))
+    print('{:<24}{:>10}{:>12.2f}MiB'.format('deltas ({} rebuilt)'.format(deltas['deltas']), deltas['done'], deltas['bytes'] / 1048576.0))
+    print('{:<24}{:>24.2f}MiB'.format('saved', deltas['saved'] / 1048576.0))
+    if not args.workdir:
+        shutil.rmtree(workdir)
+    if missing:
+        print("ERROR: not in the store after the delta run: {}".format(', '.join(missing)))
+        return 1
+    if deltas['deltas'] == 0:
+        print('ERROR: no package was rebuilt from a delta.')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,172 @@
+from __future__ import print_function
+import argparse
+import json
+import os
+import os.path
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+
+
+# Squashes the live rootfs of a built ISO again with every given compression and block
+# size, and reports the image size, the resulting ISO size, and sequential and random
+# read throughput of the rootfs image (LiveOS/ext3fs.img) read back through squashfs.
+# Reads go through a loop mount with the page cache dropped, so they need root, e.g. in
+# the build container; without root the sequential figure is the unsquashfs time and
+# random reads are skipped.
+#
+#   python bench-squashfs.py --iso ../output/centos7.iso --settings xz:128,xz:1024,gzip:128,lzo:128
+
+CHUNK_SIZE = 1024 * 1024
+ROOTFS_IMAGE = os.path.join('LiveOS', 'ext3fs.img')
+
+
+def is_root():
+    return os.geteuid() == 0
+
+
+def drop_caches():
+    subprocess.check_call(['sync'])
+    with open('/proc/sys/vm/drop_caches', mode='wt') as fh:
+        fh.write('3\n')
+
+
+def extract_squashfs(iso_file, workdir):
+    squashfs_file = os.path.join(workdir, 'squashfs.img')
+    subprocess.check_call(['xorriso', '-osirrox', 'on', '-indev', iso_file, '-extract', '/LiveOS/squashfs.img', squashfs_file])
+    root_dir = os.path.join(workdir, 'root')
+    subprocess.check_call(['unsquashfs', '-no-progress', '-d', root_dir, squashfs_file])
+    return squashfs_file, root_dir
+
+
+def make_squashfs(root_dir, output_file, compression, block_size_kb):
+    started = time.time()
+    subprocess.check_call(['mksquashfs', root_dir, output_file, '-comp', compression,
+        '-b', '{}K'.format(block_size_kb), '-noappend', '-no-progress'], stdout=open(os.devnull, 'wb'))
+    return time.time() - started
+
+
+def cpu_time():
+    times = os.times()
+    return times[0] + times[1]
+
+
+def read_sequential(path, limit_bytes):
+    # decompression runs in the context of the reading process, so its CPU time shows up here
+    total = 0
+    started, cpu_started = time.time(), cpu_time()
+    with open(path, mode='rb') as fh:
+        while limit_bytes is None or total < limit_bytes:
+            chunk = fh.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            total += len(chunk)
+    return total, time.time() - started, cpu_time() - cpu_started
+
+
+def read_random(path, count, read_size, seed):
+    rnd = random.Random(seed)
+    size = os.path.getsize(path)
+    total = 0
+    started, cpu_started = time.time(), cpu_time()
+    with open(path, mode='rb') as fh:
+        for _ in range(count):
+            fh.seek(rnd.randrange(0, max(size - read_size, 1)))
+            total += len(fh.read(read_size))
+    return total, time.time() - started, cpu_time() - cpu_started
+
+
+def bench_reads(squashfs_file, workdir, args):
+    result = {}
+    if not is_root():
+        target = os.path.join(workdir, 'unsquashed')
+        started, cpu_started = time.time(), cpu_time()
+        subprocess.check_call(['unsquashfs', '-no-progress', '-d', target, squashfs_file], stdout=open(os.devnull, 'wb'))
+        elapsed = time.time() - started
+        result['seq_bytes'] = os.path.getsize(os.path.join(target, ROOTFS_IMAGE))
+        result['seq_seconds'] = elapsed
+        result['seq_cpu'] = None
+        shutil.rmtree(target)
+        return result
+
+    mount_dir = os.path.join(workdir, 'mnt')
+    os.makedirs(mount_dir)
+    subprocess.check_call(['mount', '-t', 'squashfs', '-o', 'loop,ro', squashfs_file, mount_dir])
+    try:
+        image = os.path.join(mount_dir, ROOTFS_IMAGE)
+        drop_caches()
+        limit = args.seq_limit_mb * 1024 * 1024 if args.seq_limit_mb else None
+        result['seq_bytes'], result['seq_seconds'], result['seq_cpu'] = read_sequential(image, limit)
+        drop_caches()
+        result['rand_bytes'], result['rand_seconds'], result['rand_cpu'] = read_random(image, args.random_reads, args.read_size, args.seed)
+        result['rand_reads'] = args.random_reads
+    finally:
+        subprocess.check_call(['umount', mount_dir])
+        os.rmdir(mount_dir)
+    return result
+
+
+def mib_per_s(nbytes, seconds):
+    return nbytes / 1048576.0 / max(seconds, 0.001)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iso', required=True)
+    parser.add_argument('--settings', default='xz:128,xz:1024,gzip:128,lzo:128', help='comma-separated compression:block_size_kb')
+    parser.add_argument('--seq-limit-mb', type=int, help='read at most this much of the rootfs image sequentially')
+    parser.add_argument('--random-reads', type=int, default=2000)
+    parser.add_argument('--read-size', type=int, default=16384)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--workdir')
+    parser.add_argument('--json', help='write the results into this file too')
+    args = parser.parse_args()
+
+    workdir = args.workdir if args.workdir else tempfile.mkdtemp(prefix='bench-squashfs-')
+    if not is_root():
+        print("Not running as root: sequential reads are measured with unsquashfs, random reads are skipped.")
+    iso_size = os.path.getsize(args.iso)
+    print("Extracting the rootfs of '{}' ...".format(args.iso))
+    original_squashfs, root_dir = extract_squashfs(args.iso, workdir)
+    original_size = os.path.getsize(original_squashfs)
+    os.remove(original_squashfs)
+
+    results = []
+    for setting in args.settings.split(','):
+        compression, block_size_kb = setting.split(':')
+        print("Squashing with {}, block size {}K ...".format(compression, block_size_kb))
+        squashfs_file = os.path.join(workdir, 'squashfs-{}-{}.img'.format(compression, block_size_kb))
+        build_seconds = make_squashfs(root_dir, squashfs_file, compression, int(block_size_kb))
+        result = {
+            'compression': compression,
+            'block_size_kb': int(block_size_kb),
+            'squashfs_bytes': os.path.getsize(squashfs_file),
+            'iso_bytes': iso_size - original_size + os.path.getsize(squashfs_file),
+            'mksquashfs_seconds': build_seconds,
+        }
+        result.update(bench_reads(squashfs_file, workdir, args))
+        os.remove(squashfs_file)
+        results.append(result)
+
+    print('')
+    print('{:<14}{:>12}{:>10}{:>12}{:>12}{:>10}{:>12}{:>12}'.format('setting', 'squashfs MiB', 'ISO MiB', 'mksquashfs s', 'seq MiB/s', 'seq cpu s', 'rand IOPS', 'rand MiB/s'))
+    for r in results:
+        rand = r.get('rand_seconds')
+        print('{:<14}{:>12.1f}{:>10.1f}{:>12.1f}{:>12.1f}{:>10}{:>12}{:>12}'.format(
+            '{}:{}K'.format(r['compression'], r['block_size_kb']), r['squashfs_bytes'] / 1048576.0, r['iso_bytes'] / 1048576.0,
+            r['mksquashfs_seconds'], mib_per_s(r['seq_bytes'], r['seq_seconds']),
+            '{:.1f}'.format(r['seq_cpu']) if r['seq_cpu'] is not None else '-',
+            '{:.0f}'.format(r['rand_reads'] / max(rand, 0.001)) if rand is not None else '-',
+            '{:.1f}'.format(mib_per_s(r['rand_bytes'], rand)) if rand is not None else '-'))
+
+    if args.json:
+        with open(args.json, mode='wt') as fh:
+            json.dump({'iso': args.iso, 'original_squashfs_bytes': original_size, 'results': results}, fh, indent=2, sort_keys=True)
+    if not args.workdir:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
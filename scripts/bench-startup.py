@@ -0,0 +1,110 @@
+from __future__ import print_function
+import argparse
+import json
+import os
+import os.path
+import pty
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+# Time from autostart to the first frame of the config TUI. Every mode runs on its own copy
+# of install/ under a pseudo terminal:
+#   chain-source      - the former autostart.sh, one interpreter per step, no bytecode
+#   frontend-source   - os-frontend.py, no bytecode (a read-only image without .pyc files)
+#   frontend-bytecode - os-frontend.py with the bytecode create-iso.sh puts on the image
+# Needs the live system's python with urwid; the config TUI quits right after drawing.
+#
+#   python bench-startup.py --install-dir ../install --runs 10
+
+DIR_HERE = os.path.normpath(os.path.abspath(os.path.dirname(__file__)))
+MODES = ('chain-source', 'frontend-source', 'frontend-bytecode')
+
+
+def prepare_install_dir(install_dir, workdir, mode):
+    target = os.path.join(workdir, mode)
+    shutil.copytree(install_dir, target, ignore=shutil.ignore_patterns('*.pyc', '*.pyo', '__pycache__'))
+    if mode.endswith('-bytecode'):
+        subprocess.check_call([sys.executable, '-m', 'compileall', '-q', target])
+    return target
+
+
+def commands(mode, target):
+    if mode.startswith('chain-'):
+        return [
+            [sys.executable, os.path.join(target, 'os-bootstrap.py'), '--install'],
+            [sys.executable, os.path.join(target, 'os-config-tui.py')],
+        ]
+    return [[sys.executable, os.path.join(target, 'os-frontend.py')]]
+
+
+def run_in_pty(argv, env):
+    # the TUI needs a terminal; its output is read and thrown away so it never blocks
+    pid, master_fd = pty.fork()
+    if pid == 0:
+        os.execve(argv[0], argv, env)
+    try:
+        while True:
+            try:
+                if not os.read(master_fd, 65536):
+                    break
+            except OSError:
+                break
+    finally:
+        os.close(master_fd)
+    return os.waitpid(pid, 0)[1]
+
+
+def run_once(mode, target, result_file):
+    if os.path.exists(result_file):
+        os.remove(result_file)
+    env = dict(os.environ)
+    env['OS_STARTUP_BENCHMARK'] = result_file
+    env['TERM'] = env.get('TERM', 'linux')
+    if mode.endswith('-source'):
+        env['PYTHONDONTWRITEBYTECODE'] = '1'
+    env['OS_STARTUP_T0'] = '{:.6f}'.format(time.time())
+    for argv in commands(mode, target):
+        run_in_pty(argv, env)
+    if not os.path.isfile(result_file):
+        raise RuntimeError("'{}' did not report the first frame".format(mode))
+    with open(result_file, mode='rt') as fh:
+        return float(fh.read().split()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--install-dir', default=os.path.join(DIR_HERE, '..', 'install'))
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--modes', default=','.join(MODES), help='comma-separated, out of: {}'.format(', '.join(MODES)))
+    parser.add_argument('--json', help='write the results into this file too')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-startup-')
+    results = {}
+    try:
+        for mode in args.modes.split(','):
+            if mode not in MODES:
+                parser.error("unknown mode '{}'".format(mode))
+            target = prepare_install_dir(args.install_dir, workdir, mode)
+            print("Starting '{}' {} times ...".format(mode, args.runs))
+            results[mode] = [ run_once(mode, target, os.path.join(workdir, 'first-frame.txt')) for _ in range(args.runs) ]
+    finally:
+        shutil.rmtree(workdir)
+
+    print('')
+    print('{:<20}{:>10}{:>10}{:>10}'.format('mode', 'min ms', 'median ms', 'max ms'))
+    for mode in args.modes.split(','):
+        times = sorted(results[mode])
+        print('{:<20}{:>10.0f}{:>10.0f}{:>10.0f}'.format(mode, times[0] * 1000.0, times[len(times) // 2] * 1000.0, times[-1] * 1000.0))
+
+    if args.json:
+        with open(args.json, mode='wt') as fh:
+            json.dump(results, fh, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
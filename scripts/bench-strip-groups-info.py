@@ -0,0 +1,90 @@
+from __future__ import print_function
+import argparse
+import gzip
+import os
+import os.path
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+# Runs strip-groups-info.py over synthetic comps files of growing size and reports
+# the peak RSS of every run; with streaming parsing it should stay flat.
+
+DIR_HERE = os.path.abspath(os.path.dirname(__file__))
+STRIP_SCRIPT = os.path.join(DIR_HERE, 'strip-groups-info.py')
+PACKAGES_PER_GROUP = 200
+
+
+def write_group(fh, group_id):
+    fh.write('  <group>\n    <id>{0}</id>\n    <name>Group {0}</name>\n'.format(group_id).encode('ascii'))
+    fh.write('    <description>Synthetic group {}.</description>\n    <packagelist>\n'.format(group_id).encode('ascii'))
+    for i in range(PACKAGES_PER_GROUP):
+        req_type = ['mandatory', 'default', 'optional', 'conditional'][i % 4]
+        fh.write('      <packagereq type="{}">{}-pkg{:04d}</packagereq>\n'.format(req_type, group_id, i).encode('ascii'))
+    fh.write(b'    </packagelist>\n  </group>\n')
+
+
+def generate_comps(path, size_mb, compress):
+    # the kept groups sit at the very end, so the whole input has to be scanned
+    limit = size_mb * 1024 * 1024
+    with open(path + '.plain', mode='wb') as fh:
+        fh.write(b'<?xml version="1.0" encoding="UTF-8"?>\n<comps>\n')
+        idx = 0
+        while fh.tell() < limit:
+            write_group(fh, 'synth{:06d}'.format(idx))
+            idx += 1
+        write_group(fh, 'core')
+        write_group(fh, 'base')
+        fh.write(b'  <environment>\n    <id>minimal</id>\n    <grouplist>\n      <groupid>core</groupid>\n    </grouplist>\n')
+        fh.write(b'    <optionlist>\n      <groupid>base</groupid>\n    </optionlist>\n  </environment>\n</comps>\n')
+    if compress:
+        with open(path + '.plain', mode='rb') as src:
+            with gzip.open(path, mode='wb') as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.remove(path + '.plain')
+    else:
+        os.rename(path + '.plain', path)
+
+
+def run_strip(input_file, output_file):
+    started = time.time()
+    proc = subprocess.Popen([sys.executable, STRIP_SCRIPT, '--input', input_file, '--output', output_file,
+        '--groups', 'core,base', '--environments', 'minimal'])
+    _, status, rusage = os.wait4(proc.pid, 0)
+    if status != 0:
+        raise Exception("strip-groups-info.py failed on '{}'".format(input_file))
+    # ru_maxrss is in KiB on Linux
+    return time.time() - started, rusage.ru_maxrss / 1024.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='50,150,300', help='comma-separated uncompressed sizes in MiB')
+    parser.add_argument('--gzip', action='store_true', help='compress the inputs like group_gz data')
+    parser.add_argument('--workdir')
+    args = parser.parse_args()
+
+    workdir = args.workdir if args.workdir else tempfile.mkdtemp(prefix='bench-comps-')
+    results = []
+    for size_mb in [ int(v) for v in args.sizes.split(',') ]:
+        input_file = os.path.join(workdir, 'comps-{}.xml{}'.format(size_mb, '.gz' if args.gzip else ''))
+        output_file = os.path.join(workdir, 'comps-{}.out.xml'.format(size_mb))
+        print("Generating '{}' ...".format(input_file))
+        generate_comps(input_file, size_mb, args.gzip)
+        elapsed, peak_rss_mb = run_strip(input_file, output_file)
+        results.append((size_mb, os.path.getsize(input_file) / 1048576.0, elapsed, peak_rss_mb))
+        os.remove(input_file)
+
+    print('')
+    print('{:>12}{:>12}{:>12}{:>14}'.format('xml MiB', 'file MiB', 'seconds', 'peak RSS MiB'))
+    for size_mb, file_mb, elapsed, peak_rss_mb in results:
+        print('{:>12}{:>12.1f}{:>12.2f}{:>14.1f}'.format(size_mb, file_mb, elapsed, peak_rss_mb))
+    if not args.workdir:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
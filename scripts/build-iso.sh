@@ -3,7 +3,52 @@ set -e
 DIR_HERE=$(cd $(dirname $0) && pwd)
 python "${DIR_HERE}/test_build_env.py"
 
-make --directory ${DIR_HERE}
+BUILD_STARTED=$(date +%s)
+
+# SNAPSHOT_MODE=import builds offline from the bundle in SNAPSHOT_DIR,
+# SNAPSHOT_MODE=export builds as usual and then writes the bundle there
+DIR_OUTPUT_ROOT="${DIR_HERE}/../output"
+if [ "$SNAPSHOT_MODE" = "import" ]; then
+    mkdir -p "$DIR_OUTPUT_ROOT"
+    DIR_OUTPUT_ROOT=$(cd "$DIR_OUTPUT_ROOT" && pwd)
+    echo "Import snapshot from '$SNAPSHOT_DIR' ..."
+    python "${DIR_HERE}/snapshot.py" import --bundle "$SNAPSHOT_DIR" --mirror "$DIR_OUTPUT_ROOT/mirror" --store "$DIR_OUTPUT_ROOT/yumdata/store"
+    export REPOS_CONFIG="$DIR_OUTPUT_ROOT/mirror/repos.cfg"
+fi
+
+# YUMDATA_REFRESH_LOCK=1 resolves packages.lock again before the build, the build
+# itself only reads it
+if [ "${YUMDATA_REFRESH_LOCK:-0}" = '1' ]; then
+    make --directory ${DIR_HERE} refresh
+fi
+
+# independent stages (yumdata and the live rootfs) run in parallel,
+# the report shows which chain of stages the build actually waited for
+# and is written out even when the build fails
+BUILD_STATUS=0
+YUMDATA_REFRESH_LOCK=0 make --directory ${DIR_HERE} -j "${BUILD_JOBS:-4}" || BUILD_STATUS=$?
+mkdir -p "${DIR_HERE}/../output"
+python "${DIR_HERE}/stage.py" --records "${DIR_HERE}/../output/stages" report --since "$BUILD_STARTED" --profile "${DIR_HERE}/../output/build-profile.json"
+if [ -f "/.dockerenv" -a -d "${DIR_HERE}/../docker_output" ]; then
+    cp "${DIR_HERE}/../output/build-profile.json" "${DIR_HERE}/../docker_output" || true
+fi
+if [ "$BUILD_STATUS" != "0" ]; then
+    exit $BUILD_STATUS
+fi
+
+if [ "$SNAPSHOT_MODE" = "export" ]; then
+    echo "Export snapshot into '$SNAPSHOT_DIR' ..."
+    make --directory ${DIR_HERE} snapshot SNAPSHOT_DIR="$SNAPSHOT_DIR"
+fi
+
+# yumdata and isodb live in persistent volumes when built by build.py; the least
+# recently used files are evicted once a volume grows over its limit
+if [ -n "$CACHE_YUMDATA_LIMIT_MB" ]; then
+    python "${DIR_HERE}/cachectl.py" trim --dir "${DIR_HERE}/../output/yumdata/store/rpms" --limit-mb "$CACHE_YUMDATA_LIMIT_MB" --protect-since "$BUILD_STARTED"
+fi
+if [ -n "$CACHE_ISODB_LIMIT_MB" ]; then
+    python "${DIR_HERE}/cachectl.py" trim --dir "${DIR_HERE}/../output/isodb" --limit-mb "$CACHE_ISODB_LIMIT_MB" --protect-since "$BUILD_STARTED"
+fi
 
 if [ -f "/.dockerenv" -a -d "${DIR_HERE}/../docker_output" ]; then
     DIR_DOCKER_OUTPUT=$(cd "${DIR_HERE}/../docker_output" && pwd)
@@ -0,0 +1,87 @@
+from __future__ import print_function
+import argparse
+import os
+import os.path
+import sys
+import time
+
+
+# Keeps a cache directory under a size limit by removing the least recently used files.
+# 'Used' is the later of atime and mtime: the package store bumps atime of every package
+# a build links, and livecd-creator's yum cache gets atime updates from the kernel.
+
+
+def scan(root):
+    # hardlinked files are accounted once, under the path seen first
+    entries = []
+    seen = set()
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            try:
+                st = os.lstat(path)
+            except OSError:
+                continue
+            if (st.st_dev, st.st_ino) in seen:
+                continue
+            seen.add((st.st_dev, st.st_ino))
+            entries.append((max(st.st_atime, st.st_mtime), st.st_size, path))
+    return entries
+
+
+def remove_empty_dirs(root):
+    for dirpath, dirnames, filenames in os.walk(root, topdown=False):
+        if dirpath != root and not os.listdir(dirpath):
+            os.rmdir(dirpath)
+
+
+def trim(root, limit_bytes, protect_since=None):
+    entries = scan(root)
+    total = sum([ size for _, size, _ in entries ])
+    evicted, evicted_bytes = 0, 0
+    for last_used, size, path in sorted(entries):
+        if total <= limit_bytes:
+            break
+        if protect_since is not None and last_used >= protect_since:
+            print("[cachectl] '{}': files used by the current build alone exceed the limit".format(root))
+            break
+        os.remove(path)
+        total -= size
+        evicted += 1
+        evicted_bytes += size
+    remove_empty_dirs(root)
+    print("[cachectl] '{}': {:.1f} MiB in use, limit {:.1f} MiB, evicted {} files ({:.1f} MiB)".format(
+        root, total / 1048576.0, limit_bytes / 1048576.0, evicted, evicted_bytes / 1048576.0))
+    return evicted
+
+
+def usage(root):
+    entries = scan(root)
+    total = sum([ size for _, size, _ in entries ])
+    oldest = min([ last_used for last_used, _, _ in entries ]) if entries else time.time()
+    print("[cachectl] '{}': {} files, {:.1f} MiB, least recently used {:.1f} days ago".format(
+        root, len(entries), total / 1048576.0, (time.time() - oldest) / 86400.0))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='action')
+    trim_parser = subparsers.add_parser('trim')
+    trim_parser.add_argument('--dir', required=True)
+    trim_parser.add_argument('--limit-mb', type=int, required=True)
+    trim_parser.add_argument('--protect-since', type=float, help='never evict files used at or after this unix time')
+    usage_parser = subparsers.add_parser('usage')
+    usage_parser.add_argument('--dir', required=True)
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.dir):
+        print("[cachectl] '{}' does not exist, nothing to do".format(args.dir))
+        sys.exit(0)
+    if args.action == 'trim':
+        trim(args.dir, args.limit_mb * 1024 * 1024, args.protect_since)
+    else:
+        usage(args.dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+#!/bin/bash -e
+
+set -e
+
+DIR_HERE=$(cd $(dirname $0) && pwd)
+
+DIR_OUTPUT="$1"
+
+if [ -z "$DIR_OUTPUT" ]; then
+    echo "[create-golden] ERROR: path to output directory is not provided in command-line."
+    exit 1
+fi
+
+set +e
+DIR_OUTPUT=$(cd "$1" && pwd)
+set -e
+
+if [ ! -d "$DIR_OUTPUT/yumdata/packages/repodata" ]; then
+    echo "[create-golden] ERROR: yumdata repo not found in '$DIR_OUTPUT', the repodata stage goes first."
+    exit 1
+fi
+
+# The golden image is the root file system every node would get from the kickstart, built
+# once: the %packages of os-template.cfg are installed from the same yumdata repo anaconda
+# installs from, the kickstart settings and its %post are applied, and what has to differ
+# between nodes (machine-id, ssh host keys, network, host name, root password, fstab, boot
+# loader) is left for os-install-image.sh to write on each node. The file system is as
+# small as its content and is grown on the target disk, so a node writes no empty space.
+#
+#   golden/rootfs.img.<gz|xz>  - compressed xfs image, label 'root'
+#   golden/rootfs.info         - IMAGE_FILE, IMAGE_SIZE (bytes) and IMAGE_FSTYPE, for the installer
+DIR_GOLDEN="$DIR_OUTPUT/golden"
+DIR_GOLDEN_TMP="$DIR_GOLDEN/tmp"
+DIR_GOLDEN_ROOT="$DIR_GOLDEN_TMP/root"
+DIR_GOLDEN_MNT="$DIR_GOLDEN_TMP/mnt"
+GOLDEN_RAW_IMAGE="$DIR_GOLDEN_TMP/rootfs.img"
+GOLDEN_INFO_FILE="$DIR_GOLDEN/rootfs.info"
+YUM_CONFIG_FILE="$DIR_GOLDEN_TMP/yum.conf"
+KICKSTART_FILE="$DIR_HERE/../install/os-template.cfg"
+
+# gzip unpacks several times faster than xz on the node, which keeps the disk the limit
+GOLDEN_COMPRESSION="${GOLDEN_COMPRESSION:-gzip}"
+case "$GOLDEN_COMPRESSION" in
+    gzip) GOLDEN_IMAGE_FILE='rootfs.img.gz' ;;
+    xz)   GOLDEN_IMAGE_FILE='rootfs.img.xz' ;;
+    *)
+        echo "[create-golden] ERROR: unknown compression '$GOLDEN_COMPRESSION'"
+        exit 1
+        ;;
+esac
+
+# anaconda puts the boot loader packages in on its own, they are not in %packages
+GOLDEN_EXTRA_PACKAGES='kernel grub2 grub2-efi-x64 shim-x64 efibootmgr xfsprogs dosfstools'
+# room left in the image on top of its content, the file system grows on the target disk
+GOLDEN_FREE_MB="${GOLDEN_FREE_MB:-256}"
+
+BUILD_EPOCH="${SOURCE_DATE_EPOCH:-$(date +%s)}"
+
+# with stage.py recording the stage, every step is timed on its own as well
+step() {
+    local name="$1"
+    shift
+    if [ -n "$STAGE_RECORDS_DIR" ]; then
+        python "$DIR_HERE/stage.py" run --name "$name" -- "$@"
+    else
+        "$@"
+    fi
+}
+
+# /dev of the build container is bind-mounted into the root, so nothing is removed while
+# anything below the tmp dir is still mounted; a busy mount is detached lazily
+cleanup() {
+    for d in "$DIR_GOLDEN_ROOT/dev" "$DIR_GOLDEN_ROOT/proc" "$DIR_GOLDEN_ROOT/sys" "$DIR_GOLDEN_MNT"; do
+        if mountpoint -q "$d"; then
+            umount -l "$d" || true
+        fi
+    done
+    if grep -qF " $DIR_GOLDEN_TMP/" /proc/self/mounts; then
+        echo "[create-golden] ERROR: '$DIR_GOLDEN_TMP' still has mounts, left in place."
+        return 1
+    fi
+    rm -rf --one-file-system "$DIR_GOLDEN_TMP"
+}
+trap cleanup EXIT
+
+cleanup
+mkdir -p "$DIR_GOLDEN_ROOT" "$DIR_GOLDEN_MNT"
+rm -f "$DIR_GOLDEN"/rootfs.img.* "$GOLDEN_INFO_FILE"
+
+echo "[create-golden][step-1] Installing packages ..."
+
+cat > "$YUM_CONFIG_FILE" << EOF
+[main]
+cachedir=$DIR_GOLDEN_TMP/cache
+keepcache=0
+logfile=$DIR_GOLDEN_TMP/yum.log
+reposdir=/dev/null
+gpgcheck=0
+plugins=0
+tsflags=nodocs
+
+[yumdata]
+name=yumdata
+baseurl=file://$DIR_OUTPUT/yumdata/packages
+enabled=1
+gpgcheck=0
+EOF
+
+# %packages: '@group' and names are installed, '-name' lines are excluded
+GOLDEN_SPECS=$(sed -n '/^%packages/,/^%end/p' "$KICKSTART_FILE" | sed '1d;$d' | grep -v '^\s*#' | grep -v '^\s*-' | xargs)
+GOLDEN_EXCLUDES=$(sed -n '/^%packages/,/^%end/p' "$KICKSTART_FILE" | grep '^\s*-' | sed 's/^\s*-//' | xargs)
+YUM_EXCLUDE_ARGS=''
+for p in $GOLDEN_EXCLUDES; do
+    YUM_EXCLUDE_ARGS="$YUM_EXCLUDE_ARGS --exclude=$p"
+done
+step golden-yum yum --config "$YUM_CONFIG_FILE" --installroot "$DIR_GOLDEN_ROOT" --releasever 7 \
+    --assumeyes $YUM_EXCLUDE_ARGS install $GOLDEN_SPECS $GOLDEN_EXTRA_PACKAGES
+
+echo "[create-golden][step-1] Done."
+
+
+echo "[create-golden][step-2] Applying kickstart settings ..."
+
+mount --bind /dev "$DIR_GOLDEN_ROOT/dev"
+mount -t proc proc "$DIR_GOLDEN_ROOT/proc"
+mount -t sysfs sysfs "$DIR_GOLDEN_ROOT/sys"
+
+# what the kickstart commands of os-template.cfg make anaconda write
+ln -sf ../usr/share/zoneinfo/GMT "$DIR_GOLDEN_ROOT/etc/localtime"
+printf '0.0 0 0.0\n0\nUTC\n' > "$DIR_GOLDEN_ROOT/etc/adjtime"
+echo 'LANG="en_US.UTF-8"' > "$DIR_GOLDEN_ROOT/etc/locale.conf"
+printf 'KEYMAP="us"\nFONT="latarcyrheb-sun16"\n' > "$DIR_GOLDEN_ROOT/etc/vconsole.conf"
+sed -i 's/^SELINUX=.*/SELINUX=disabled/' "$DIR_GOLDEN_ROOT/etc/selinux/config"
+chroot "$DIR_GOLDEN_ROOT" authconfig --enableshadow --passalgo=sha512 --update
+if [ -f "$DIR_GOLDEN_ROOT/usr/lib/systemd/system/firewalld.service" ]; then
+    chroot "$DIR_GOLDEN_ROOT" systemctl disable firewalld.service
+fi
+# the NICs keep their ethN names, as on the live system
+cat > "$DIR_GOLDEN_ROOT/etc/default/grub" << 'EOF'
+GRUB_TIMEOUT=5
+GRUB_DISTRIBUTOR="$(sed 's, release .*$,,g' /etc/system-release)"
+GRUB_DEFAULT=saved
+GRUB_DISABLE_SUBMENU=true
+GRUB_TERMINAL_OUTPUT="console"
+GRUB_CMDLINE_LINUX="crashkernel=auto net.ifnames=0 biosdevname=0 rhgb quiet"
+GRUB_DISABLE_RECOVERY="true"
+EOF
+echo 'NETWORKING=yes' > "$DIR_GOLDEN_ROOT/etc/sysconfig/network"
+
+# the %post of the kickstart as it is; OS_GOLDEN_IMAGE leaves out what needs the target disk
+sed -n '/^%post/,/^%end/p' "$KICKSTART_FILE" | sed '1d;$d' > "$DIR_GOLDEN_ROOT/tmp/ks-post.sh"
+step golden-post chroot "$DIR_GOLDEN_ROOT" /usr/bin/env OS_GOLDEN_IMAGE=1 /bin/bash -e /tmp/ks-post.sh
+rm -f "$DIR_GOLDEN_ROOT/tmp/ks-post.sh"
+
+# the kernel package builds a host-only initramfs for the build container; nodes need
+# one that boots on any hardware
+for KVER in $(ls -1 "$DIR_GOLDEN_ROOT/lib/modules"); do
+    step golden-dracut chroot "$DIR_GOLDEN_ROOT" dracut --force --no-hostonly "/boot/initramfs-$KVER.img" "$KVER"
+done
+
+# per-node identity, written on the node
+truncate -s 0 "$DIR_GOLDEN_ROOT/etc/machine-id"
+rm -f "$DIR_GOLDEN_ROOT"/etc/ssh/ssh_host_*
+rm -f "$DIR_GOLDEN_ROOT/etc/udev/rules.d/70-persistent-net.rules"
+rm -f "$DIR_GOLDEN_ROOT"/etc/sysconfig/network-scripts/ifcfg-eth*
+rm -f "$DIR_GOLDEN_ROOT/etc/hostname" "$DIR_GOLDEN_ROOT/etc/fstab"
+rm -rf "$DIR_GOLDEN_ROOT"/var/cache/yum/* "$DIR_GOLDEN_ROOT"/var/lib/yum/history/*
+find "$DIR_GOLDEN_ROOT/var/log" -type f -exec truncate -s 0 {} +
+
+umount "$DIR_GOLDEN_ROOT/dev" "$DIR_GOLDEN_ROOT/proc" "$DIR_GOLDEN_ROOT/sys"
+
+echo "[create-golden][step-2] Done."
+
+
+echo "[create-golden][step-3] Creating root file system image ..."
+
+# sized to the content plus GOLDEN_FREE_MB, rounded up to 4 MiB, the block size of the writer
+USED_MB=$(du -s -x -m "$DIR_GOLDEN_ROOT" | cut -f1)
+IMAGE_MB=$(( (USED_MB * 110 / 100 + GOLDEN_FREE_MB + 3) / 4 * 4 ))
+IMAGE_SIZE=$(( IMAGE_MB * 1024 * 1024 ))
+echo "[create-golden] content: ${USED_MB} MiB, image: ${IMAGE_MB} MiB"
+
+truncate -s "$IMAGE_SIZE" "$GOLDEN_RAW_IMAGE"
+mkfs.xfs -q -L root "$GOLDEN_RAW_IMAGE"
+mount -o loop "$GOLDEN_RAW_IMAGE" "$DIR_GOLDEN_MNT"
+step golden-copy cp -a "$DIR_GOLDEN_ROOT/." "$DIR_GOLDEN_MNT/"
+umount "$DIR_GOLDEN_MNT"
+rm -rf "$DIR_GOLDEN_ROOT"
+
+case "$GOLDEN_COMPRESSION" in
+    gzip) step golden-compress gzip -n -6 "$GOLDEN_RAW_IMAGE" ;;
+    xz)   step golden-compress xz -T 0 -6 "$GOLDEN_RAW_IMAGE" ;;
+esac
+mv -f "$DIR_GOLDEN_TMP/$GOLDEN_IMAGE_FILE" "$DIR_GOLDEN/$GOLDEN_IMAGE_FILE"
+touch -d "@$BUILD_EPOCH" "$DIR_GOLDEN/$GOLDEN_IMAGE_FILE"
+
+cat > "$GOLDEN_INFO_FILE" << EOF
+IMAGE_FILE=$GOLDEN_IMAGE_FILE
+IMAGE_SIZE=$IMAGE_SIZE
+IMAGE_FSTYPE=xfs
+EOF
+
+stat "$DIR_GOLDEN/$GOLDEN_IMAGE_FILE"
+echo "[create-golden][step-3] Done."
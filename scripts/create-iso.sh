@@ -6,6 +6,10 @@ if [ -z "$ISO_NAME" ]; then
     exit 1
 fi
 
+# rootfs - livecd-creator builds the live image '<name>-live.iso', no yumdata needed
+# repack - the live image plus yumdata packages and install/ files becomes '<name>.iso'
+STAGE="${2:-all}"
+
 DIR_HERE=$(cd $(dirname $0) && pwd)
 DIR_OUTPUT=$(cd $(dirname $1) && pwd)
 ISO_NAME=$(basename "$1")
@@ -23,49 +27,151 @@ fi
 DIR_ISODB="${DIR_OUTPUT}/isodb"
 DIR_ISOTMP="${DIR_OUTPUT}/isotmp"
 LOGFILE="${DIR_OUTPUT}/iso-creation-log.txt"
+LIVE_ISO="${DIR_OUTPUT}/${ISO_NAME}-live.iso"
+
+# squashfs of the live rootfs: compression is passed to livecd-creator, which has no
+# block size option, so a non-default block size makes the repack stage squash it again
+ISO_COMPRESSION="${ISO_COMPRESSION:-xz}"
+ISO_BLOCK_SIZE="${ISO_BLOCK_SIZE:-}"
+
+# Volume dates, the volume UUID (a 16 digit date, GRUB's fs-uuid of the image) and the
+# dates of all files in the repacked image are pinned to SOURCE_DATE_EPOCH when it is set.
+# With the build fingerprint from build.py, up to a day taken from it is added and the
+# hundredths of the UUID come from it too, so input sets built against the same repo
+# revisions do not share a volume UUID.
+BUILD_EPOCH="${SOURCE_DATE_EPOCH:-$(date +%s)}"
+ISO_UUID_CENTIS=0
+if [ -n "$BUILD_FINGERPRINT" ]; then
+    BUILD_EPOCH=$(( BUILD_EPOCH + 0x${BUILD_FINGERPRINT:0:8} % 86400 ))
+    ISO_UUID_CENTIS=$(( 0x${BUILD_FINGERPRINT:8:4} % 100 ))
+fi
+ISO_VOLUME_UUID=$(date -u -d "@$BUILD_EPOCH" +%Y%m%d%H%M%S)$(printf '%02d' "$ISO_UUID_CENTIS")
+
+# with stage.py recording the stage, every step is timed on its own as well
+step() {
+    local name="$1"
+    shift
+    if [ -n "$STAGE_RECORDS_DIR" ]; then
+        python "$DIR_HERE/stage.py" run --name "$name" -- "$@"
+    else
+        "$@"
+    fi
+}
+
+stage_rootfs() {
+    mkdir -p $DIR_ISODB
+    mkdir -p $DIR_ISOTMP
+    rm -f $LOGFILE
+    rm -f "${DIR_OUTPUT}/${ISO_NAME}.iso" "$LIVE_ISO"
 
-mkdir -p $DIR_ISODB
-mkdir -p $DIR_ISOTMP
-rm -f $LOGFILE
-rm -f "${DIR_OUTPUT}/${ISO_NAME}.iso"
-
-echo "[create-iso] started ..."
-
-(
-    cd $DIR_OUTPUT
-
-    livecd-creator --verbose --debug \
-        --config 'iso-ks.cfg' \
-        --cache=$DIR_ISODB \
-        --fslabel=$ISO_NAME \
-        --tmpdir=$DIR_ISOTMP \
-        --skip-minimize \
-        --logfile=$LOGFILE
-
-    rm -rf isopack isomnt
-    mkdir -p isopack isomnt
-    mount -t iso9660 -o loop "${DIR_OUTPUT}/${ISO_NAME}.iso" "${DIR_OUTPUT}/isomnt"
-    (cd "${DIR_OUTPUT}/isomnt" && tar -cvf - . ) | (cd "${DIR_OUTPUT}/isopack" && tar -xf - )
-    umount "${DIR_OUTPUT}/isomnt"
-    rm -rf "${DIR_OUTPUT}/isomnt"
+    echo "[create-iso] building live rootfs ..."
+
+    (
+        cd $DIR_OUTPUT
+
+        step livecd-creator livecd-creator --verbose --debug \
+            --config 'iso-ks.cfg' \
+            --cache=$DIR_ISODB \
+            --fslabel=$ISO_NAME \
+            --tmpdir=$DIR_ISOTMP \
+            --skip-minimize \
+            --compression-type=$ISO_COMPRESSION \
+            --logfile=$LOGFILE
+
+        mv -f "${DIR_OUTPUT}/${ISO_NAME}.iso" "$LIVE_ISO"
+    )
+}
+
+stage_repack() {
+    echo "[create-iso] repacking '$LIVE_ISO' ..."
     rm -f "${DIR_OUTPUT}/${ISO_NAME}.iso"
 
-    # tune connent inside isolinux
-    rm -f "${DIR_OUTPUT}/isopack/isolinux/macboot.img"
+    # Repack: the live image is read by xorriso and written out once more with our files
+    # added, the boot catalog is rebuilt from scratch; nothing is mounted or unpacked.
+    # The install media repo is put in here too, so the rootfs never waits for yumdata.
+    XORRISO_MAP_ARGS="-map ${DIR_OUTPUT}/yumdata/packages /packages"
+    # the order rpm installs them in, what os-prefetch.py reads them ahead in
+    XORRISO_MAP_ARGS="$XORRISO_MAP_ARGS -map ${DIR_OUTPUT}/yumdata/install-order.lst /install-order.lst"
 
-    # Put our custom scripts for installation into ISO
+    DIR_RESQUASH="${DIR_ISOTMP}/resquash"
+    rm -rf "$DIR_RESQUASH"
+    if [ -n "$ISO_BLOCK_SIZE" ]; then
+        echo "[create-iso] squashing rootfs again: $ISO_COMPRESSION, block size ${ISO_BLOCK_SIZE}K"
+        mkdir -p "$DIR_RESQUASH"
+        xorriso -osirrox on -indev "$LIVE_ISO" -extract /LiveOS/squashfs.img "$DIR_RESQUASH/squashfs.img"
+        step unsquashfs unsquashfs -no-progress -d "$DIR_RESQUASH/root" "$DIR_RESQUASH/squashfs.img"
+        rm -f "$DIR_RESQUASH/squashfs.img"
+        step mksquashfs mksquashfs "$DIR_RESQUASH/root" "$DIR_RESQUASH/squashfs.img" \
+            -comp "$ISO_COMPRESSION" -b "${ISO_BLOCK_SIZE}K" -noappend -no-progress
+        rm -rf "$DIR_RESQUASH/root"
+        XORRISO_MAP_ARGS="$XORRISO_MAP_ARGS -map $DIR_RESQUASH/squashfs.img /LiveOS/squashfs.img"
+    fi
+    # the golden image of the image-based install, unless the build leaves it out
+    if [ "${GOLDEN_IMAGE:-1}" = '1' ]; then
+        if [ ! -f "${DIR_OUTPUT}/golden/rootfs.info" ]; then
+            echo "[create-iso] ERROR: golden image not found in '${DIR_OUTPUT}/golden', the golden stage goes first (or GOLDEN_IMAGE=0)."
+            exit 1
+        fi
+        GOLDEN_IMAGE_FILE=$(sed -n 's/^IMAGE_FILE=//p' "${DIR_OUTPUT}/golden/rootfs.info")
+        if [ -z "$GOLDEN_IMAGE_FILE" ] || [ ! -f "${DIR_OUTPUT}/golden/$GOLDEN_IMAGE_FILE" ]; then
+            echo "[create-iso] ERROR: '${DIR_OUTPUT}/golden/rootfs.info' names no golden image that exists."
+            exit 1
+        fi
+        echo "[create-iso] golden image: $GOLDEN_IMAGE_FILE"
+        XORRISO_MAP_ARGS="$XORRISO_MAP_ARGS -map ${DIR_OUTPUT}/golden/rootfs.info /golden/rootfs.info"
+        XORRISO_MAP_ARGS="$XORRISO_MAP_ARGS -map ${DIR_OUTPUT}/golden/$GOLDEN_IMAGE_FILE /golden/$GOLDEN_IMAGE_FILE"
+    fi
+    # install/ goes in with the bytecode of every script beside it: the image is read-only
+    # on the live system, so python would compile each module again on every start. The
+    # copies get the date the image gives them, the .pyc files record it and stay valid.
+    DIR_INSTALL_COPY="${DIR_ISOTMP}/install"
+    rm -rf "$DIR_INSTALL_COPY"
     if [ -d "$DIR_CUSTOM_INSTALL" ]; then
-        install_files=$(cd $DIR_CUSTOM_INSTALL && ls -1)
-        for f in $(cd $DIR_CUSTOM_INSTALL && ls -1)
+        mkdir -p "$DIR_INSTALL_COPY"
+        cp -a "$DIR_CUSTOM_INSTALL/." "$DIR_INSTALL_COPY/"
+        find "$DIR_INSTALL_COPY" \( -name '*.pyc' -o -name '*.pyo' \) -delete
+        find "$DIR_INSTALL_COPY" -exec touch -h -d "@$BUILD_EPOCH" {} +
+        python -m compileall -q "$DIR_INSTALL_COPY"
+        for f in $(cd $DIR_INSTALL_COPY && ls -1)
         do
             echo "[create-iso] processing $f"
-            cp -T "$DIR_CUSTOM_INSTALL/$f" "${DIR_OUTPUT}/isopack/$f"
+            XORRISO_MAP_ARGS="$XORRISO_MAP_ARGS -map $DIR_INSTALL_COPY/$f /$f"
         done
     fi
 
-    (cd ${DIR_OUTPUT}/isopack && genisoimage -U -r -v -T -J -joliet-long -V 'centos7' -b isolinux/isolinux.bin -c isolinux/boot.cat -no-emul-boot -boot-load-size 4 -boot-info-table -eltorito-alt-boot -e isolinux/efiboot.img -no-emul-boot -o "${DIR_OUTPUT}/${ISO_NAME}.iso" . )
+    step xorriso xorriso -indev "$LIVE_ISO" \
+        -outdev "${DIR_OUTPUT}/${ISO_NAME}.iso" \
+        -volid 'centos7' \
+        -joliet on \
+        -compliance joliet_long_names \
+        -boot_image any discard \
+        -rm /isolinux/macboot.img -- \
+        $XORRISO_MAP_ARGS \
+        -find / -exec mkisofs_r -- \
+        -alter_date_r b-c "=$BUILD_EPOCH" / -- \
+        -alter_date_r c "=$BUILD_EPOCH" / -- \
+        -volume_date c "=$BUILD_EPOCH" \
+        -volume_date m "=$BUILD_EPOCH" \
+        -volume_date uuid "$ISO_VOLUME_UUID" \
+        -boot_image isolinux dir=/isolinux \
+        -boot_image any next \
+        -boot_image any efi_path=/isolinux/efiboot.img \
+        -end
+    rm -rf "$DIR_RESQUASH" "$DIR_INSTALL_COPY"
 
-)
+    stat "${DIR_OUTPUT}/${ISO_NAME}.iso"
+    echo "[create-iso] done: '${DIR_OUTPUT}/${ISO_NAME}.iso'"
+}
 
-stat "${DIR_OUTPUT}/${ISO_NAME}.iso"
-echo "[create-iso] done: '${DIR_OUTPUT}/${ISO_NAME}.iso'"
+case "$STAGE" in
+    rootfs) stage_rootfs ;;
+    repack) stage_repack ;;
+    all)
+        stage_rootfs
+        stage_repack
+        ;;
+    *)
+        echo "[create-iso] ERROR: unknown stage '$STAGE'"
+        exit 1
+        ;;
+esac
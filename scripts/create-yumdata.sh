@@ -5,6 +5,7 @@ set -e
 DIR_HERE=$(cd $(dirname $0) && pwd)
 
 DIR_OUTPUT="$1"
+STAGE="${2:-all}"
 
 if [ -z "$DIR_OUTPUT" ]; then
     echo "[create-yumdata] ERROR: path to output directory is not provided in command-line."
@@ -21,20 +22,61 @@ if [ ! -d "$DIR_OUTPUT" ]; then
 fi
 
 DIR_YUM_DATA="$DIR_OUTPUT/yumdata"
+DIR_YUM_STORE="$DIR_YUM_DATA/store"
 
-rm -rf "$DIR_YUM_DATA"
+YUM_CONFIG_FILE="$DIR_YUM_DATA/config/yum.conf"
+YUM_LOG_FILE="$DIR_YUM_DATA/log/yum.log"
+PACKAGES_MANIFEST_FILE="$DIR_YUM_DATA/packages.json"
+# repo metadata is kept in the store, which outlives the wipe of the metadata stage, so an
+# unchanged file is not downloaded again; 'base' is the repo the groups data comes from
+GROUPS_DATA_FILE="$DIR_YUM_STORE/metadata/base/groups.xml"
+PACKAGES_LOCK_FILE="${PACKAGES_LOCK_FILE:-$DIR_HERE/packages.lock}"
+INSTALL_ORDER_FILE="$DIR_YUM_DATA/install-order.lst"
+
+# mirror URLs come from repos.cfg, or from the file REPOS_CONFIG points to
+REPOS_CONFIG="${REPOS_CONFIG:-$DIR_HERE/repos.cfg}"
+REPO_BASE_URL=$(python "$DIR_HERE/repos.py" --config "$REPOS_CONFIG" baseurl base)
+echo "[create-yumdata] repos config: '$REPOS_CONFIG'"
+
+# Timestamps written into the image come from SOURCE_DATE_EPOCH when it is set (build.py
+# derives it from the repo revisions), so the same inputs give the same repodata and stamps.
+BUILD_EPOCH="${SOURCE_DATE_EPOCH:-$(date +%s)}"
+
+COMPS_KEEP_GROUPS='core,base'
+COMPS_KEEP_ENVIRONMENTS='minimal'
+
+# with stage.py recording the stage, every step is timed on its own as well
+step() {
+    local name="$1"
+    shift
+    if [ -n "$STAGE_RECORDS_DIR" ]; then
+        python "$DIR_HERE/stage.py" run --name "$name" -- "$@"
+    else
+        "$@"
+    fi
+}
+
+# The work is split into stages the Makefile runs as separate targets:
+#   metadata   - yum config, groups data and the stripped comps.xml
+#   packages   - locked package set, fetched into the store and linked into yumdata/packages
+#   repodata   - createrepo over yumdata/packages
+#   order      - the order rpm installs the kickstart's packages in, for os-prefetch.py
+#   buildstamp - .buildstamp of the live rootfs, independent of everything else
+# 'all' runs them one after another.
+
+stage_metadata() {
+
+# everything but the persistent package store is regenerated from scratch
+if [ -d "$DIR_YUM_DATA" ]; then
+    find "$DIR_YUM_DATA" -mindepth 1 -maxdepth 1 ! -name 'store' -exec rm -rf {} +
+fi
 
 mkdir -p "$DIR_YUM_DATA/config"
 mkdir -p "$DIR_YUM_DATA/log"
 mkdir -p "$DIR_YUM_DATA/cache"
 mkdir -p "$DIR_YUM_DATA/tmp"
-
-YUM_CONFIG_FILE="$DIR_YUM_DATA/config/yum.conf"
-YUM_LOG_FILE="$DIR_YUM_DATA/log/yum.log"
-
-REPO_BASE_URL='http://mirror.centos.org/centos/7/os/x86_64/'
-REPO_UPDATES_URL='http://mirror.centos.org/centos/7/updates/x86_64/'
-REPO_EXTRAS_URL='http://mirror.centos.org/centos/7/extras/x86_64/'
+mkdir -p "$DIR_YUM_STORE"
+mkdir -p "$(dirname "$GROUPS_DATA_FILE")"
 
 cat > "$YUM_CONFIG_FILE" << EOF
 [main]
@@ -51,108 +93,200 @@ assumeyes=1
 plugins=1
 group_package_types=default,mandatory
 
-[base]
-name=base
-baseurl=$REPO_BASE_URL
-enabled=1
-gpgcheck=0
-
-
-#released updates
-[updates]
-name=updates
-baseurl=$REPO_UPDATES_URL
-enabled=1
-gpgcheck=0
-
-[extras]
-name=extras
-baseurl=$REPO_EXTRAS_URL
-enabled=1
-gpgcheck=0
-
 EOF
+python "$DIR_HERE/repos.py" --config "$REPOS_CONFIG" yum-conf >> "$YUM_CONFIG_FILE"
 
 # step-1
 
-echo "[create-yumdata][step-1] Evaluating url of file with repo groups ..."
-echo "Downloading '$REPO_BASE_URL/repodata/repomd.xml' as '$DIR_YUM_DATA/tmp/repomd.xml' ..."
-curl "$REPO_BASE_URL/repodata/repomd.xml" -o "$DIR_YUM_DATA/tmp/repomd.xml"
-echo "Parsing $DIR_YUM_DATA/tmp/repomd.xml ..."
-
-group_tag=0
-location=''
-ln_stripped=''
-while read ln; do
-    ln_stripped=$(echo "$ln" | sed 's/^\s*\(.*\)$/\1/')
-    if [ "$ln_stripped" = '<data type="group">' ]; then
-        group_tag=1
-    elif [ "$ln_stripped" = '<data type="group_gz">' ]; then
-        group_tag=2
-    elif [ "$ln_stripped" = '</data>' ]; then
-        group_tag=0
-    elif [ "$group_tag" != '0' -a "${ln_stripped:0:9}" = '<location' ]; then
-        location=$(echo "$ln_stripped" | sed 's/<location href="\(.*\)"\/>/\1/')
-        break
-    fi
-done < "$DIR_YUM_DATA/tmp/repomd.xml"
-if [ -z "$location" ]; then
-    echo "ERROR: Can't eval repo group location."
-    exit 1
-fi
-echo "Evaluated url: '$REPO_BASE_URL/$location'"
+echo "[create-yumdata][step-1] Fetching repo groups data ..."
+step repomd-fetch python "$DIR_HERE/pkgfetch.py" metadata \
+    --baseurl "$REPO_BASE_URL" \
+    --types 'group_gz,group' \
+    --output "$GROUPS_DATA_FILE"
 echo "[create-yumdata][step-1] Done."
 
 
 # step-2
 
 echo "[create-yumdata][step-2] Generating stripped groups info ..."
-echo "Downloading '$REPO_BASE_URL/$location' as '$DIR_YUM_DATA/tmp/groups.xml' ..."
-curl "$REPO_BASE_URL/$location" -o "$DIR_YUM_DATA/tmp/groups.xml"
-if [ "$group_tag" = "2" ]; then
-    mv "$DIR_YUM_DATA/tmp/groups.xml" "$DIR_YUM_DATA/tmp/groups.xml.gz"
-    if ! gzip -d "$DIR_YUM_DATA/tmp/groups.xml.gz"; then
-        echo "ERROR: Can't unpack groups XML file."
-        exit 1
-    fi
-fi
 
-echo "Parsing $DIR_YUM_DATA/tmp/groups.xml ..."
-python "$DIR_HERE/strip-groups-info.py" --input "$DIR_YUM_DATA/tmp/groups.xml" --output "$DIR_YUM_DATA/comps.xml"
+# both plain and gzipped groups data are parsed as a stream, no unpacking needed
+echo "Parsing $GROUPS_DATA_FILE ..."
+step comps-strip python "$DIR_HERE/strip-groups-info.py" \
+    --input "$GROUPS_DATA_FILE" \
+    --output "$DIR_YUM_DATA/comps.xml" \
+    --groups "$COMPS_KEEP_GROUPS" \
+    --environments "$COMPS_KEEP_ENVIRONMENTS"
 echo "Generated file '$DIR_YUM_DATA/comps.xml'"
 echo "[create-yumdata][step-2] Done."
 
+}
+
+stage_packages() {
+
 # step-3
 
 echo "[create-yumdata][step-3] Downloading repo packages ..."
 
-cat "$DIR_HERE/packages-live.lst" | xargs yum install \
-    -c "$YUM_CONFIG_FILE" \
-    --downloadonly \
-    --downloaddir="$DIR_YUM_DATA/packages" \
-    --installroot="$DIR_YUM_DATA/tmp" \
-    --releasever=/
+# The package closure is pinned in the lock file, which is committed with the sources.
+# Only 'make refresh' (YUMDATA_REFRESH_LOCK=1) resolves it again from the repos' primary
+# data and prints the diff against the previous lock; a build never rewrites it. Without
+# a lock, on a fresh checkout, the build resolves the first one the same way.
+PKGLOCK_ARGS="--lock $PACKAGES_LOCK_FILE --repos-config $REPOS_CONFIG --packages $DIR_HERE/packages-live.lst --kickstart $DIR_HERE/../install/os-template.cfg"
+PACKAGES_LOCK_BOOTSTRAP=0
+if [ ! -f "$PACKAGES_LOCK_FILE" ]; then
+    echo "[create-yumdata] No lock file '$PACKAGES_LOCK_FILE', resolving it from the current repos ..."
+    PACKAGES_LOCK_BOOTSTRAP=1
+fi
+if [ "${YUMDATA_REFRESH_LOCK:-0}" = '1' ] || [ "$PACKAGES_LOCK_BOOTSTRAP" = '1' ]; then
+    PACKAGES_LOCK_PREV="$DIR_YUM_DATA/tmp/packages.lock.prev"
+    rm -f "$PACKAGES_LOCK_PREV"
+    if [ -f "$PACKAGES_LOCK_FILE" ]; then
+        cp "$PACKAGES_LOCK_FILE" "$PACKAGES_LOCK_PREV"
+    fi
+    step lock-refresh python "$DIR_HERE/pkglock.py" $PKGLOCK_ARGS refresh \
+        --comps "$GROUPS_DATA_FILE" \
+        --metadata-dir "$DIR_YUM_STORE/metadata" \
+        --store "$DIR_YUM_STORE"
+    # yum resolves the same lists again on the node and for the golden image, so the new
+    # closure has to be the one yum picks; otherwise the previous lock is put back
+    if ! step lock-verify python "$DIR_HERE/resolve-packages.py" --config "$YUM_CONFIG_FILE" \
+            --installroot "$DIR_YUM_DATA/tmp/resolve-root" \
+            --packages "$DIR_HERE/packages-live.lst" \
+            --kickstart "$DIR_HERE/../install/os-template.cfg" \
+            --output "$DIR_YUM_DATA/tmp/resolved.json" || \
+       ! python "$DIR_HERE/pkglock.py" $PKGLOCK_ARGS verify --resolved "$DIR_YUM_DATA/tmp/resolved.json"; then
+        if [ -f "$PACKAGES_LOCK_PREV" ]; then
+            mv -f "$PACKAGES_LOCK_PREV" "$PACKAGES_LOCK_FILE"
+        else
+            rm -f "$PACKAGES_LOCK_FILE"
+        fi
+        echo "[create-yumdata] ERROR: the resolved closure differs from yum's, '$PACKAGES_LOCK_FILE' is left as it was."
+        exit 1
+    fi
+    if [ "$PACKAGES_LOCK_BOOTSTRAP" = '1' ]; then
+        echo "[create-yumdata] Wrote '$PACKAGES_LOCK_FILE', commit it to pin the package set."
+    fi
+elif ! python "$DIR_HERE/pkglock.py" $PKGLOCK_ARGS check; then
+    echo "[create-yumdata] ERROR: '$PACKAGES_LOCK_FILE' does not match the package lists, run 'make refresh' (or 'python build.py --refresh-lock') and commit it."
+    exit 1
+fi
+python "$DIR_HERE/pkglock.py" $PKGLOCK_ARGS manifest --output "$PACKAGES_MANIFEST_FILE"
+
+# only packages missing in the store are downloaded, in parallel over keep-alive connections;
+# updated ones are rebuilt from the previous version in the store where the repo has deltas
+PKGFETCH_ARGS=''
+if [ "${YUMDATA_DELTAS:-1}" != '1' ]; then
+    PKGFETCH_ARGS='--no-deltas'
+fi
+step download python "$DIR_HERE/pkgfetch.py" packages --store "$DIR_YUM_STORE" --manifest "$PACKAGES_MANIFEST_FILE" --jobs "${YUMDATA_FETCH_JOBS:-8}" $PKGFETCH_ARGS
+step link python "$DIR_HERE/pkgstore.py" link --store "$DIR_YUM_STORE" --manifest "$PACKAGES_MANIFEST_FILE" --packages "$DIR_YUM_DATA/packages"
 
 echo "[create-yumdata][step-3] Done."
 
+}
+
+stage_repodata() {
+
 echo "[create-yumdata][step-4] Generating repo metadata ..."
-createrepo -g "$DIR_YUM_DATA/comps.xml" "$DIR_YUM_DATA/packages" --verbose --simple-md-filenames
+
+# Metadata of the previous run is kept in the store, so with the incremental mode on
+# createrepo re-reads only packages whose name, size or mtime differ from it. Packages
+# linked from the store get an mtime derived from their checksum, so a package rebuilt
+# under the same file name and size is read again all the same.
+DIR_CREATEREPO_STATE="$DIR_YUM_STORE/createrepo"
+mkdir -p "$DIR_CREATEREPO_STATE/cache"
+CREATEREPO_ARGS="--verbose --simple-md-filenames --revision $BUILD_EPOCH --cachedir $DIR_CREATEREPO_STATE/cache"
+if [ "${YUMDATA_INCREMENTAL:-1}" = '1' -a -f "$DIR_CREATEREPO_STATE/repodata/repomd.xml" ]; then
+    echo "Incremental mode, reusing metadata from '$DIR_CREATEREPO_STATE/repodata'"
+    CREATEREPO_ARGS="$CREATEREPO_ARGS --update --update-md-path $DIR_CREATEREPO_STATE"
+fi
+step createrepo createrepo -g "$DIR_YUM_DATA/comps.xml" $CREATEREPO_ARGS "$DIR_YUM_DATA/packages"
+# createrepo dates the metadata files and their gzip headers from the clock
+step repodata-pin python "$DIR_HERE/pin-repodata.py" --repo "$DIR_YUM_DATA/packages" --epoch "$BUILD_EPOCH"
+rm -rf "$DIR_CREATEREPO_STATE/repodata"
+cp -r "$DIR_YUM_DATA/packages/repodata" "$DIR_CREATEREPO_STATE/repodata"
 
 cat > $DIR_YUM_DATA/packages/.treeinfo << EOF
 [general]
 name = CentOS Linux-7
 family = CentOS Linux
-timestamp = $(date +%s)
+timestamp = $BUILD_EPOCH
 version = 7
 arch = x86_64
 EOF
 
-cat > $DIR_YUM_DATA/.buildstamp << EOF
+echo "[create-yumdata][step-4] Done."
+
+}
+
+stage_order() {
+
+echo "[create-yumdata][step-5] Recording the install order ..."
+
+# yum resolves and orders the transaction anaconda makes of os-template.cfg against the
+# finished repo, as it does before running one, and stops there; the boot loader and
+# kernel packages anaconda adds on its own are part of it
+DIR_ORDER_TMP="$DIR_YUM_DATA/tmp/order"
+rm -rf "$DIR_ORDER_TMP" "$INSTALL_ORDER_FILE"
+mkdir -p "$DIR_ORDER_TMP/root"
+cat > "$DIR_ORDER_TMP/yum.conf" << EOF
+[main]
+cachedir=$DIR_ORDER_TMP/cache
+keepcache=0
+reposdir=/dev/null
+gpgcheck=0
+plugins=0
+
+[yumdata]
+name=yumdata
+baseurl=file://$DIR_YUM_DATA/packages
+enabled=1
+gpgcheck=0
+EOF
+ORDER_EXTRA_ARGS=''
+for p in kernel grub2 grub2-efi-x64 shim-x64 efibootmgr; do
+    ORDER_EXTRA_ARGS="$ORDER_EXTRA_ARGS --extra $p"
+done
+step order-resolve python "$DIR_HERE/resolve-packages.py" --config "$DIR_ORDER_TMP/yum.conf" \
+    --installroot "$DIR_ORDER_TMP/root" \
+    --kickstart "$DIR_HERE/../install/os-template.cfg" --with-excludes $ORDER_EXTRA_ARGS \
+    --output "$DIR_ORDER_TMP/packages.json" \
+    --order "$INSTALL_ORDER_FILE"
+rm -rf "$DIR_ORDER_TMP"
+
+echo "[create-yumdata][step-5] Done."
+
+}
+
+stage_buildstamp() {
+
+cat > $DIR_OUTPUT/.buildstamp << EOF
 [Main]
 Product=CentOS Linux
 Version=7
 IsFinal=True
-UUID=$(date +%Y%m%d%H%M).x86_64
+UUID=$(date -u -d "@$BUILD_EPOCH" +%Y%m%d%H%M).x86_64
 EOF
-
-echo "[create-yumdata][step-4] Done."
+echo "[create-yumdata] Generated file '$DIR_OUTPUT/.buildstamp'"
+
+}
+
+case "$STAGE" in
+    metadata)   stage_metadata ;;
+    packages)   stage_packages ;;
+    repodata)   stage_repodata ;;
+    order)      stage_order ;;
+    buildstamp) stage_buildstamp ;;
+    all)
+        stage_metadata
+        stage_packages
+        stage_repodata
+        stage_order
+        stage_buildstamp
+        ;;
+    *)
+        echo "[create-yumdata] ERROR: unknown stage '$STAGE'"
+        exit 1
+        ;;
+esac
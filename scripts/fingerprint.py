@@ -0,0 +1,207 @@
+from __future__ import print_function
+import argparse
+import hashlib
+import json
+import os
+import os.path
+import sys
+
+
+# Content fingerprints of build inputs. Scripts and configs are hashed normalized: line
+# endings, trailing whitespace, blank lines and comment-only lines do not count, so only a
+# change that can alter what a stage does gives a new digest. Files copied into the image
+# as they are (install/) are hashed raw.
+#
+# Digests are cached by path, inode, size and mtime, so a file is read again only after it
+# was touched; a touch alone still yields the same digest.
+#
+# 'fingerprint.py stamp' writes a stage's digest stamp: the combined digest plus the digest
+# of every input, rewritten only when the combined digest changes. Make targets depend on
+# the stamp instead of the inputs, so a stage reruns exactly when its inputs change.
+
+NORMALIZED_SUFFIXES = ('.py', '.sh', '.cfg', '.conf', '.lst')
+NORMALIZED_NAMES = ('Makefile', 'Dockerfile')
+SKIP_SUFFIXES = ('.pyc', '.pyo', '.tmp')
+SKIP_DIRS = ('__pycache__',)
+MISSING = 'missing'
+CHUNK_SIZE = 1024 * 1024
+
+
+class FingerprintError(Exception):
+    def __init__(self, text):
+        Exception.__init__(self, text)
+
+
+def is_normalized(path):
+    name = os.path.basename(path)
+    return name in NORMALIZED_NAMES or name.endswith(NORMALIZED_SUFFIXES)
+
+
+def normalized_digest(path):
+    state = hashlib.sha256()
+    with open(path, mode='rb') as fh:
+        for ln in fh:
+            payload = ln.rstrip()
+            if payload and not payload.lstrip().startswith(b'#'):
+                state.update(payload + b'\n')
+    return state.hexdigest()
+
+
+def raw_digest(path):
+    state = hashlib.sha256()
+    with open(path, mode='rb') as fh:
+        for chunk in iter(lambda: fh.read(CHUNK_SIZE), b''):
+            state.update(chunk)
+    return state.hexdigest()
+
+
+class HashCache:
+    # '<mode>:<path>' -> [inode, size, mtime, digest]
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        self.dirty = False
+        if path and os.path.isfile(path):
+            try:
+                with open(path, mode='rt') as fh:
+                    self.entries = json.load(fh)
+            except ValueError:
+                self.entries = {}
+
+    def digest(self, path, raw=False):
+        path = os.path.abspath(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return MISSING
+        key = '{}:{}'.format('raw' if raw or not is_normalized(path) else 'normalized', path)
+        entry = self.entries.get(key)
+        if entry and entry[:3] == [st.st_ino, st.st_size, st.st_mtime]:
+            return entry[3]
+        digest = raw_digest(path) if key.startswith('raw:') else normalized_digest(path)
+        self.entries[key] = [st.st_ino, st.st_size, st.st_mtime, digest]
+        self.dirty = True
+        return digest
+
+    def save(self):
+        if not self.path or not self.dirty:
+            return
+        if not os.path.isdir(os.path.dirname(os.path.abspath(self.path))):
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)))
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, mode='wt') as fh:
+            json.dump(self.entries, fh, sort_keys=True)
+        os.rename(tmp_path, self.path)
+        self.dirty = False
+
+
+def expand_input(path):
+    # a directory stands for all files below it, a missing path for itself
+    if not os.path.isdir(path):
+        return [ path ]
+    files = []
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames[:] = [ d for d in dirnames if d not in SKIP_DIRS ]
+        for filename in filenames:
+            if not filename.endswith(SKIP_SUFFIXES):
+                files.append(os.path.join(dirpath, filename))
+    return sorted(files)
+
+
+def input_digests(cache, inputs, raw_inputs=(), root=None):
+    # names are relative to 'root' when given, so the digests do not depend on the checkout path
+    digests = {}
+    for raw, paths in ((False, inputs), (True, raw_inputs)):
+        for path in paths:
+            for filename in expand_input(path):
+                name = os.path.relpath(filename, root) if root else filename
+                digests[name.replace('\\', '/')] = cache.digest(filename, raw)
+    return digests
+
+
+def combine(digests, values=None):
+    state = hashlib.sha256()
+    for name in sorted(digests):
+        state.update('file {} {}\n'.format(name, digests[name]).encode('utf-8'))
+    for name in sorted(values or {}):
+        state.update('value {}={}\n'.format(name, values[name]).encode('utf-8'))
+    return state.hexdigest()
+
+
+def load_stamp(path):
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, mode='rt') as fh:
+            return json.load(fh)
+    except ValueError:
+        return None
+
+
+def changes(old, new):
+    if old is None:
+        return [ 'no previous stamp' ]
+    names = []
+    for key in ('inputs', 'values'):
+        before, after = old.get(key, {}), new[key]
+        names.extend(sorted([ name for name in set(before) | set(after) if before.get(name) != after.get(name) ]))
+    return names
+
+
+def write_stamp(path, digests, values=None):
+    # returns the names of the inputs that changed, nothing when the stamp is up to date
+    stamp = {'digest': combine(digests, values), 'inputs': digests, 'values': values or {}}
+    old = load_stamp(path)
+    if old is not None and old.get('digest') == stamp['digest']:
+        return []
+    if not os.path.isdir(os.path.dirname(os.path.abspath(path))):
+        os.makedirs(os.path.dirname(os.path.abspath(path)))
+    tmp_path = path + '.tmp'
+    with open(tmp_path, mode='wt') as fh:
+        json.dump(stamp, fh, indent=2, sort_keys=True)
+    os.rename(tmp_path, path)
+    return changes(old, stamp)
+
+
+def parse_values(items):
+    values = {}
+    for item in items:
+        if '=' not in item:
+            raise FingerprintError("Invalid value '{}', expected NAME=VALUE".format(item))
+        name, value = item.split('=', 1)
+        values[name] = value
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cache', help='file to keep the digests of unchanged files in')
+    parser.add_argument('--root', help='input names are recorded relative to this directory')
+    subparsers = parser.add_subparsers(dest='action')
+    for action in ('stamp', 'digest'):
+        action_parser = subparsers.add_parser(action)
+        if action == 'stamp':
+            action_parser.add_argument('--output', required=True, help='the stage digest stamp')
+        action_parser.add_argument('--raw', action='append', default=[], metavar='PATH', help='input hashed as is, not normalized')
+        action_parser.add_argument('--value', action='append', default=[], metavar='NAME=VALUE', help='option the stage depends on')
+        action_parser.add_argument('inputs', nargs='*')
+    args = parser.parse_args()
+
+    cache = HashCache(args.cache)
+    try:
+        values = parse_values(args.value)
+    except FingerprintError as exc:
+        parser.error(str(exc))
+    digests = input_digests(cache, args.inputs, args.raw, args.root)
+    cache.save()
+    if args.action == 'digest':
+        print(combine(digests, values))
+        return
+    # stdout of the Makefile's $(shell) call is discarded, progress goes to stderr
+    changed = write_stamp(args.output, digests, values)
+    if changed:
+        print("[fingerprint] '{}' changed: {}".format(os.path.basename(args.output), ', '.join(changed)), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
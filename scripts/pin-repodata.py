@@ -0,0 +1,86 @@
+from __future__ import print_function
+import argparse
+import os
+import os.path
+import re
+import struct
+
+from repodata import RepoDataError, file_checksum, parse_repomd
+
+
+# Pins the dates createrepo takes from the clock to one epoch: the <timestamp> of every
+# metadata file in repomd.xml, the mtime in the header of the .gz files and the mtimes of
+# the files in repodata/. The checksums and sizes of the rewritten files are updated in
+# repomd.xml, files named after their checksum are renamed. The open-checksums do not
+# change, only the gzip header does.
+#
+#   python pin-repodata.py --repo yumdata/packages --epoch 1500000000
+
+GZIP_MAGIC = b'\x1f\x8b'
+GZIP_MTIME_OFFSET = 4
+RE_DATA = re.compile(r'(<data type="([^"]+)">)(.*?)(</data>)', re.DOTALL)
+
+
+def pin_gzip_mtime(path, epoch):
+    # the mtime of the first (and, from createrepo, only) member; True when it changed
+    with open(path, mode='r+b') as fh:
+        header = fh.read(GZIP_MTIME_OFFSET + 4)
+        if header[:2] != GZIP_MAGIC or len(header) < GZIP_MTIME_OFFSET + 4:
+            return False
+        mtime = struct.pack('<I', epoch)
+        if header[GZIP_MTIME_OFFSET:] == mtime:
+            return False
+        fh.seek(GZIP_MTIME_OFFSET)
+        fh.write(mtime)
+    return True
+
+
+def replace_element(text, tag, value):
+    return re.sub(r'(<{0}(?: [^>]*)?>)[^<]*(</{0}>)'.format(tag), lambda m: m.group(1) + value + m.group(2), text, count=1)
+
+
+def pin_repodata(repo_dir, epoch):
+    repomd_path = os.path.join(repo_dir, 'repodata', 'repomd.xml')
+    repomd = parse_repomd(repomd_path)
+    with open(repomd_path, mode='rb') as fh:
+        text = fh.read().decode('utf-8')
+
+    def pin_data(match):
+        record = repomd.get(match.group(2))
+        body = replace_element(match.group(3), 'timestamp', str(epoch))
+        path = os.path.join(repo_dir, record.location)
+        if not os.path.isfile(path):
+            raise RepoDataError("File not found: '{}'".format(path))
+        if path.endswith('.gz') and pin_gzip_mtime(path, epoch):
+            checksum = file_checksum(path, record.checksum_type)
+            body = replace_element(body, 'checksum', checksum)
+            body = replace_element(body, 'size', str(os.path.getsize(path)))
+            name = os.path.basename(record.location)
+            if record.checksum and name.startswith(record.checksum + '-'):
+                location = os.path.join(os.path.dirname(record.location), checksum + name[len(record.checksum):])
+                os.rename(path, os.path.join(repo_dir, location))
+                path = os.path.join(repo_dir, location)
+                body = body.replace('href="{}"'.format(record.location), 'href="{}"'.format(location))
+        os.utime(path, (epoch, epoch))
+        return match.group(1) + body + match.group(4)
+
+    text = RE_DATA.sub(pin_data, text)
+    with open(repomd_path + '.tmp', mode='wb') as fh:
+        fh.write(text.encode('utf-8'))
+    os.rename(repomd_path + '.tmp', repomd_path)
+    os.utime(repomd_path, (epoch, epoch))
+    os.utime(os.path.dirname(repomd_path), (epoch, epoch))
+    return len(repomd.records)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repo', required=True, help='directory with the repodata/ directory')
+    parser.add_argument('--epoch', type=int, required=True)
+    args = parser.parse_args()
+    count = pin_repodata(args.repo, args.epoch)
+    print("[pin-repodata] {} metadata files of '{}' pinned to {}".format(count, args.repo, args.epoch))
+
+
+if __name__ == '__main__':
+    main()
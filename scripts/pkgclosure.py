@@ -0,0 +1,331 @@
+from __future__ import print_function
+import argparse
+import bz2
+import gzip
+import json
+import re
+
+try:
+    import xml.etree.cElementTree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+
+NS_COMMON = '{http://linux.duke.edu/metadata/common}'
+NS_RPM = '{http://linux.duke.edu/metadata/rpm}'
+GZIP_MAGIC = b'\x1f\x8b'
+BZIP2_MAGIC = b'BZh'
+DEFAULT_ARCHES = ['x86_64', 'noarch']
+GROUP_PACKAGEREQ_TYPES = ['mandatory', 'default']
+_VERSION_SEGMENT_RE = re.compile(r'~|[0-9]+|[a-zA-Z]+')
+
+
+class ClosureError(Exception):
+    def __init__(self, text):
+        Exception.__init__(self, text)
+
+
+def rpmvercmp(a, b):
+    # Same ordering as rpm's rpmvercmp(): alphanumeric segments are compared one by one,
+    # numeric segments are newer than alpha ones and '~' sorts before anything, even the end.
+    if a == b:
+        return 0
+    segs_a = _VERSION_SEGMENT_RE.findall(a)
+    segs_b = _VERSION_SEGMENT_RE.findall(b)
+    for idx in range(max(len(segs_a), len(segs_b))):
+        seg_a = segs_a[idx] if idx < len(segs_a) else None
+        seg_b = segs_b[idx] if idx < len(segs_b) else None
+        if seg_a == '~' or seg_b == '~':
+            if seg_a != '~':
+                return 1
+            if seg_b != '~':
+                return -1
+            continue
+        if seg_a is None:
+            return -1
+        if seg_b is None:
+            return 1
+        if seg_a.isdigit():
+            if not seg_b.isdigit():
+                return 1
+            num_a, num_b = int(seg_a), int(seg_b)
+            if num_a != num_b:
+                return 1 if num_a > num_b else -1
+        elif seg_b.isdigit():
+            return -1
+        elif seg_a != seg_b:
+            return 1 if seg_a > seg_b else -1
+    return 0
+
+
+def compare_evr(evr_a, evr_b):
+    # (epoch, version, release) tuples; a missing release matches any release
+    epoch_a, epoch_b = int(evr_a[0] or 0), int(evr_b[0] or 0)
+    if epoch_a != epoch_b:
+        return 1 if epoch_a > epoch_b else -1
+    result = rpmvercmp(evr_a[1] or '', evr_b[1] or '')
+    if result != 0 or not evr_a[2] or not evr_b[2]:
+        return result
+    return rpmvercmp(evr_a[2], evr_b[2])
+
+
+def format_evr(evr):
+    epoch, version, release = evr
+    prefix = '{}:'.format(epoch) if epoch and epoch != '0' else ''
+    return prefix + '-'.join([ v for v in (version, release) if v ])
+
+
+class Package:
+    def __init__(self, repo, name, arch, evr):
+        self.repo = repo
+        self.name = name
+        self.arch = arch
+        self.evr = evr
+        self.location = None
+        self.checksum_type = None
+        self.checksum = None
+        self.size = None
+        self.provides = []
+        self.requires = []
+        self.files = []
+
+    def nevra(self):
+        # the same form as yum's 'ui_nevra', so entries match the ones resolve-packages.py writes
+        return '{}-{}.{}'.format(self.name, format_evr(self.evr), self.arch)
+
+    def manifest_entry(self):
+        return {
+            'nevra': self.nevra(),
+            'name': self.name,
+            'arch': self.arch,
+            'repo': self.repo,
+            'location': self.location,
+            'checksum_type': self.checksum_type,
+            'checksum': self.checksum,
+            'size': self.size,
+        }
+
+
+def open_data_file(path):
+    # primary and comps data come plain, gzipped or bzipped, detected by content
+    with open(path, mode='rb') as fh:
+        magic = fh.read(3)
+    if magic[:2] == GZIP_MAGIC:
+        return gzip.open(path, mode='rb')
+    if magic == BZIP2_MAGIC:
+        return bz2.BZ2File(path, mode='rb')
+    return open(path, mode='rb')
+
+
+def _parse_entries(elem):
+    entries = []
+    if elem is not None:
+        for entry in elem.findall(NS_RPM + 'entry'):
+            name = entry.get('name')
+            if name.startswith('rpmlib('):
+                continue
+            entries.append((name, entry.get('flags'), (entry.get('epoch'), entry.get('ver'), entry.get('rel'))))
+    return entries
+
+
+def parse_primary(path, repo_id, arches=DEFAULT_ARCHES):
+    # primary.xml of a full repo is large, every <package> is released once it's read
+    packages = []
+    with open_data_file(path) as fh:
+        root = None
+        for event, elem in ET.iterparse(fh, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = elem
+                continue
+            if elem.tag != NS_COMMON + 'package':
+                continue
+            arch = elem.findtext(NS_COMMON + 'arch')
+            if arch in arches:
+                version = elem.find(NS_COMMON + 'version')
+                pkg = Package(repo_id, elem.findtext(NS_COMMON + 'name'), arch,
+                    (version.get('epoch'), version.get('ver'), version.get('rel')))
+                checksum = elem.find(NS_COMMON + 'checksum')
+                pkg.checksum_type = checksum.get('type')
+                pkg.checksum = checksum.text.strip()
+                pkg.location = elem.find(NS_COMMON + 'location').get('href')
+                pkg.size = int(elem.find(NS_COMMON + 'size').get('package'))
+                fmt = elem.find(NS_COMMON + 'format')
+                pkg.provides = _parse_entries(fmt.find(NS_RPM + 'provides'))
+                pkg.requires = _parse_entries(fmt.find(NS_RPM + 'requires'))
+                pkg.files = [ f.text for f in fmt.findall(NS_COMMON + 'file') ]
+                packages.append(pkg)
+            root.clear()
+    return packages
+
+
+def load_comps_groups(path):
+    # group id -> names of its mandatory and default packages, like group_package_types in yum.conf
+    groups = {}
+    with open_data_file(path) as fh:
+        root = None
+        for event, elem in ET.iterparse(fh, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = elem
+                continue
+            if elem.tag != 'group':
+                continue
+            names = [ req.text.strip() for req in elem.iter('packagereq') if req.get('type', 'mandatory') in GROUP_PACKAGEREQ_TYPES ]
+            groups[elem.findtext('id')] = names
+            root.clear()
+    return groups
+
+
+def load_package_specs(list_file):
+    with open(list_file, mode='rt') as fh:
+        return [ ln.strip() for ln in fh.readlines() if ln.strip() and not ln.strip().startswith('#') ]
+
+
+def load_kickstart_package_specs(kickstart_file):
+    specs = []
+    in_packages = False
+    with open(kickstart_file, mode='rt') as fh:
+        for ln in [ ln.strip() for ln in fh.readlines() ]:
+            if ln.startswith('%packages'):
+                in_packages = True
+            elif ln.startswith('%end'):
+                in_packages = False
+            elif in_packages and ln and not ln.startswith('#') and not ln.startswith('-'):
+                specs.append(ln)
+    return specs
+
+
+def load_kickstart_package_excludes(kickstart_file):
+    # the '-name' lines of %packages, which anaconda leaves out of the selected groups
+    excludes = []
+    in_packages = False
+    with open(kickstart_file, mode='rt') as fh:
+        for ln in [ ln.strip() for ln in fh.readlines() ]:
+            if ln.startswith('%packages'):
+                in_packages = True
+            elif ln.startswith('%end'):
+                in_packages = False
+            elif in_packages and ln.startswith('-'):
+                excludes.append(ln[1:].strip())
+    return excludes
+
+
+class PackageIndex:
+    def __init__(self):
+        self.by_name = {}
+        self.providers = {}
+
+    def add(self, pkg):
+        self.by_name.setdefault(pkg.name, []).append(pkg)
+        self.providers.setdefault(pkg.name, []).append((pkg, 'EQ', pkg.evr))
+        for name, flags, evr in pkg.provides:
+            if name != pkg.name:
+                self.providers.setdefault(name, []).append((pkg, flags, evr))
+        for path in pkg.files:
+            self.providers.setdefault(path, []).append((pkg, None, (None, None, None)))
+
+    def latest(self, name):
+        # newest version of 'name' over all repos, the native arch wins over noarch
+        best = None
+        for pkg in self.by_name.get(name, []):
+            if best is None or compare_evr(pkg.evr, best.evr) > 0 or \
+                    (compare_evr(pkg.evr, best.evr) == 0 and best.arch == 'noarch' and pkg.arch != 'noarch'):
+                best = pkg
+        return best
+
+    def providers_of(self, name, flags, evr):
+        return [ pkg for pkg, pflags, pevr in self.providers.get(name, []) if provide_matches(pflags, pevr, flags, evr) ]
+
+
+def provide_matches(provide_flags, provide_evr, require_flags, require_evr):
+    if not require_flags or not provide_flags:
+        return True
+    result = compare_evr(provide_evr, require_evr)
+    if require_flags == 'EQ':
+        return result == 0
+    if require_flags == 'LT':
+        return result < 0
+    if require_flags == 'LE':
+        return result <= 0
+    if require_flags == 'GT':
+        return result > 0
+    if require_flags == 'GE':
+        return result >= 0
+    return True
+
+
+def _provider_rank(requirement):
+    # yum-like preference: a package named after the capability, then the shortest name
+    def rank(pkg):
+        return (pkg.name != requirement, len(pkg.name), pkg.name)
+    return rank
+
+
+def resolve_closure(index, groups, specs):
+    # One version of every package name gets in; explicit names and group members take the
+    # newest one, dependencies the newest provider that satisfies the version constraint.
+    selected = {}
+    pending = []
+
+    def select(pkg):
+        current = selected.get(pkg.name)
+        if current is None:
+            selected[pkg.name] = pkg
+            pending.append(pkg)
+        elif current is not pkg:
+            raise ClosureError("Conflicting versions of '{}': {} and {}".format(pkg.name, current.nevra(), pkg.nevra()))
+
+    names = []
+    for spec in specs:
+        if spec.startswith('@'):
+            if spec[1:] not in groups:
+                raise ClosureError("Group '{}' not found in comps".format(spec[1:]))
+            # packages of a group missing in the repos are skipped, as yum does
+            names += [ name for name in groups[spec[1:]] if name in index.by_name ]
+        else:
+            if spec not in index.by_name:
+                raise ClosureError("Package '{}' not found in repos".format(spec))
+            names.append(spec)
+    for name in names:
+        if name not in selected:
+            select(index.latest(name))
+
+    while pending:
+        pkg = pending.pop()
+        for name, flags, evr in pkg.requires:
+            candidates = index.providers_of(name, flags, evr)
+            if not candidates:
+                raise ClosureError("Nothing provides '{}' needed by {}".format(name, pkg.nevra()))
+            if [ c for c in candidates if selected.get(c.name) is c ]:
+                continue
+            candidates = [ c for c in candidates if c.name not in selected ]
+            if not candidates:
+                raise ClosureError("'{}' needed by {} conflicts with the selected packages".format(name, pkg.nevra()))
+            best = {}
+            for candidate in candidates:
+                if candidate.name not in best or compare_evr(candidate.evr, best[candidate.name].evr) > 0:
+                    best[candidate.name] = candidate
+            select(sorted(best.values(), key=_provider_rank(name))[0])
+
+    return sorted(selected.values(), key=lambda pkg: pkg.nevra())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--primary', action='append', required=True, metavar='REPO=PATH')
+    parser.add_argument('--comps', required=True)
+    parser.add_argument('--packages', required=True, help='file with a package or @group per line')
+    args = parser.parse_args()
+
+    index = PackageIndex()
+    for item in args.primary:
+        repo_id, path = item.split('=', 1)
+        for pkg in parse_primary(path, repo_id):
+            index.add(pkg)
+    closure = resolve_closure(index, load_comps_groups(args.comps), load_package_specs(args.packages))
+    print(json.dumps([ pkg.manifest_entry() for pkg in closure ], indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
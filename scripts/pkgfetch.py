@@ -0,0 +1,359 @@
+from __future__ import print_function
+import argparse
+import os
+import os.path
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    import httplib
+    import Queue as queue
+    from urllib import url2pathname
+    from urlparse import urljoin, urlsplit
+except ImportError:
+    import http.client as httplib
+    import queue
+    from urllib.parse import urljoin, urlsplit
+    from urllib.request import url2pathname
+
+from pkgclosure import format_evr, open_data_file
+from pkgstore import PackageStore, PackageStoreError, load_manifest
+from repodata import RepoDataError, file_checksum, is_valid_file, new_checksum_state, parse_repomd, verify_file
+from stage import add_downloaded
+
+try:
+    import xml.etree.cElementTree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+
+CHUNK_SIZE = 256 * 1024
+MAX_REDIRECTS = 5
+USER_AGENT = 'centos7iso-pkgfetch/1.0'
+APPLYDELTARPM = 'applydeltarpm'
+
+
+class FetchError(Exception):
+    def __init__(self, text):
+        Exception.__init__(self, text)
+
+
+class ConnectionPool:
+    # Every worker thread keeps its own keep-alive connection per server, so
+    # consecutive requests of a thread reuse the same TCP connection.
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connections(self):
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = {}
+            self._local.connections = connections
+        return connections
+
+    def get(self, scheme, netloc):
+        connections = self._connections()
+        conn = connections.get((scheme, netloc))
+        if conn is None:
+            conn_class = httplib.HTTPSConnection if scheme == 'https' else httplib.HTTPConnection
+            conn = conn_class(netloc, timeout=self.timeout)
+            connections[(scheme, netloc)] = conn
+        return conn
+
+    def discard(self, scheme, netloc):
+        conn = self._connections().pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+
+    def close(self):
+        for conn in self._connections().values():
+            conn.close()
+        self._local.connections = {}
+
+
+def open_url(pool, url, redirects=MAX_REDIRECTS):
+    parts = urlsplit(url)
+    if parts.scheme == 'file':
+        return open(url2pathname(parts.path), mode='rb')
+    if parts.scheme not in ('http', 'https'):
+        raise FetchError("Unsupported URL '{}'".format(url))
+    path = parts.path + ('?' + parts.query if parts.query else '')
+    conn = pool.get(parts.scheme, parts.netloc)
+    try:
+        conn.request('GET', path, headers={'User-Agent': USER_AGENT, 'Connection': 'keep-alive'})
+        resp = conn.getresponse()
+    except (httplib.HTTPException, socket.error) as exc:
+        pool.discard(parts.scheme, parts.netloc)
+        raise FetchError("Can't fetch '{}': {}".format(url, exc))
+    if resp.status in (301, 302, 303, 307, 308) and redirects > 0:
+        location = resp.getheader('location')
+        resp.read()
+        return open_url(pool, urljoin(url, location), redirects - 1)
+    if resp.status != 200:
+        resp.read()
+        raise FetchError("Can't fetch '{}': HTTP {} {}".format(url, resp.status, resp.reason))
+    return resp
+
+
+def fetch_file(pool, url, dest_path, checksum_type=None, checksum=None):
+    # The payload is hashed while it streams in, the file is left in place only if it matches.
+    state = new_checksum_state(checksum_type) if checksum_type else None
+    nbytes = 0
+    src = open_url(pool, url)
+    try:
+        with open(dest_path, mode='wb') as fh:
+            while True:
+                try:
+                    chunk = src.read(CHUNK_SIZE)
+                except (httplib.HTTPException, socket.error) as exc:
+                    parts = urlsplit(url)
+                    pool.discard(parts.scheme, parts.netloc)
+                    raise FetchError("Can't fetch '{}': {}".format(url, exc))
+                if not chunk:
+                    break
+                if state is not None:
+                    state.update(chunk)
+                fh.write(chunk)
+                nbytes += len(chunk)
+    finally:
+        src.close()
+        # counted for the stage even when the file is thrown away, the bytes came in all the same
+        if urlsplit(url).scheme != 'file':
+            add_downloaded(nbytes)
+    if state is not None and state.hexdigest() != checksum:
+        os.remove(dest_path)
+        raise FetchError("Checksum mismatch for '{}': expected {}, got {}".format(url, checksum, state.hexdigest()))
+    return nbytes
+
+
+def fetch_file_with_retries(pool, url, dest_path, checksum_type=None, checksum=None, retries=5):
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return fetch_file(pool, url, dest_path, checksum_type, checksum)
+        except (FetchError, IOError, OSError) as exc:
+            if attempt > retries:
+                raise FetchError('{} (gave up after {} attempts)'.format(exc, attempt))
+            print("[pkgfetch] attempt {} failed, retrying: {}".format(attempt, exc))
+            time.sleep(min(2 ** attempt, 30))
+
+
+def fetch_repo_metadata(pool, baseurl, data_types, output_file, retries=5):
+    # Fetches repomd.xml next to 'output_file' and the first of 'data_types' the repo has
+    # as 'output_file'; a file left there by a previous run is reused if it still matches.
+    repomd_path = os.path.join(os.path.dirname(os.path.abspath(output_file)), 'repomd.xml')
+    fetch_file_with_retries(pool, baseurl.rstrip('/') + '/repodata/repomd.xml', repomd_path, retries=retries)
+    repomd = parse_repomd(repomd_path)
+    record = repomd.first_of(data_types)
+    if record is None:
+        raise FetchError("None of data types '{}' found in '{}'".format(','.join(data_types), baseurl))
+    print("[pkgfetch] repo revision {}, '{}' data at '{}'".format(repomd.revision, record.type, record.location))
+    if not is_valid_file(output_file, record):
+        fetch_file_with_retries(pool, baseurl.rstrip('/') + '/' + record.location, output_file,
+            record.checksum_type, record.checksum, retries)
+        verify_file(output_file, record)
+    return record
+
+
+def package_url(manifest, pkg):
+    return manifest['repos'][pkg['repo']].rstrip('/') + '/' + pkg['location']
+
+
+# Updated packages are rebuilt from the version already in the store plus a delta RPM,
+# where the repo publishes one (prestodelta data, as the CentOS updates repo does):
+# applydeltarpm puts the new package together from the old one, and the result has to
+# match the checksum of the manifest, otherwise the full package is downloaded after all.
+
+class DeltaRpm:
+    def __init__(self, old_nevra, location, size, checksum_type, checksum):
+        self.old_nevra = old_nevra
+        self.location = location
+        self.size = size
+        self.checksum_type = checksum_type
+        self.checksum = checksum
+
+
+def parse_prestodelta(path):
+    # NEVRA of the new package -> the deltas it can be made from
+    deltas = {}
+    with open_data_file(path) as fh:
+        for _, elem in ET.iterparse(fh):
+            if elem.tag != 'newpackage':
+                continue
+            name, arch = elem.get('name'), elem.get('arch')
+            nevra = '{}-{}.{}'.format(name, format_evr((elem.get('epoch'), elem.get('version'), elem.get('release'))), arch)
+            for delta in elem.findall('delta'):
+                checksum = delta.find('checksum')
+                old_evr = (delta.get('oldepoch'), delta.get('oldversion'), delta.get('oldrelease'))
+                deltas.setdefault(nevra, []).append(DeltaRpm('{}-{}.{}'.format(name, format_evr(old_evr), arch),
+                    delta.findtext('filename'), int(delta.findtext('size')), checksum.get('type'), checksum.text.strip()))
+            elem.clear()
+    return deltas
+
+
+def fetch_deltas_metadata(pool, manifest, metadata_dir, retries=5):
+    # prestodelta data of every repo of the manifest that has it, keyed by repo id
+    deltas = {}
+    for repo_id, baseurl in sorted(manifest['repos'].items()):
+        repo_dir = os.path.join(metadata_dir, repo_id)
+        if not os.path.isdir(repo_dir):
+            os.makedirs(repo_dir)
+        try:
+            output_file = os.path.join(repo_dir, 'prestodelta.xml')
+            fetch_repo_metadata(pool, baseurl, ['prestodelta'], output_file, retries)
+            deltas[repo_id] = parse_prestodelta(output_file)
+        except (FetchError, RepoDataError) as exc:
+            print("[pkgfetch] no deltas for repo '{}': {}".format(repo_id, exc))
+    return deltas
+
+
+def pick_delta(store, deltas, pkg):
+    # the smallest delta from a version the store has, None if there is none
+    candidates = [ (delta, store.find_nevra(delta.old_nevra)) for delta in deltas.get(pkg['repo'], {}).get(pkg['nevra'], []) ]
+    candidates = [ (delta, old_path) for delta, old_path in candidates if old_path is not None and delta.size < pkg['size'] ]
+    if not candidates:
+        return None, None
+    return min(candidates, key=lambda c: c[0].size)
+
+
+def fetch_delta_package(pool, manifest, pkg, delta, old_path, dest_path, retries=5):
+    # downloads the delta and rebuilds the package as 'dest_path'; the bytes downloaded
+    drpm_path = dest_path + '.drpm'
+    try:
+        nbytes = fetch_file_with_retries(pool, manifest['repos'][pkg['repo']].rstrip('/') + '/' + delta.location,
+            drpm_path, delta.checksum_type, delta.checksum, retries)
+        proc = subprocess.Popen([APPLYDELTARPM, '-r', old_path, drpm_path, dest_path], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = proc.communicate()[0]
+        if proc.returncode != 0:
+            raise FetchError("applydeltarpm failed for '{}': {}".format(pkg['nevra'], output.strip()))
+        actual = file_checksum(dest_path, pkg['checksum_type'])
+        if actual != pkg['checksum']:
+            raise FetchError("Checksum mismatch for '{}' rebuilt from a delta: expected {}, got {}".format(pkg['nevra'], pkg['checksum'], actual))
+    except (OSError, IOError) as exc:
+        raise FetchError("Can't rebuild '{}' from a delta: {}".format(pkg['nevra'], exc))
+    finally:
+        if os.path.exists(drpm_path):
+            os.remove(drpm_path)
+    return nbytes
+
+
+def has_applydeltarpm():
+    try:
+        subprocess.Popen([APPLYDELTARPM, '-V'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT).communicate()
+    except OSError:
+        return False
+    return True
+
+
+def fetch_packages(store, manifest, jobs=8, retries=5, timeout=60, use_deltas=True):
+    missing = [ pkg for pkg in manifest['packages'] if not store.contains(pkg) ]
+    total = len(missing)
+    pending = queue.Queue()
+    for pkg in missing:
+        pending.put(pkg)
+    pool = ConnectionPool(timeout)
+    lock = threading.Lock()
+    stats = {'done': 0, 'bytes': 0, 'errors': [], 'deltas': 0, 'delta_bytes': 0, 'saved': 0}
+
+    deltas = {}
+    if use_deltas and missing:
+        if has_applydeltarpm():
+            try:
+                deltas = fetch_deltas_metadata(pool, manifest, os.path.join(store.root, 'metadata'), retries)
+            finally:
+                pool.close()
+        else:
+            print("[pkgfetch] '{}' not found, downloading full packages only".format(APPLYDELTARPM))
+
+    def worker():
+        try:
+            while True:
+                try:
+                    pkg = pending.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    tmp_path = store.tmp_path_of(pkg)
+                    delta, old_path = pick_delta(store, deltas, pkg)
+                    nbytes = None
+                    if delta is not None:
+                        try:
+                            nbytes = fetch_delta_package(pool, manifest, pkg, delta, old_path, tmp_path, retries)
+                        except (FetchError, RepoDataError) as exc:
+                            print("[pkgfetch] {}, downloading the full package".format(exc))
+                            delta = None
+                            tmp_path = store.tmp_path_of(pkg)
+                    if nbytes is None:
+                        nbytes = fetch_file_with_retries(pool, package_url(manifest, pkg), tmp_path,
+                            pkg['checksum_type'], pkg['checksum'], retries)
+                    store.commit(pkg, tmp_path)
+                except (FetchError, PackageStoreError, RepoDataError) as exc:
+                    with lock:
+                        stats['errors'].append(str(exc))
+                    continue
+                with lock:
+                    stats['done'] += 1
+                    stats['bytes'] += nbytes
+                    if delta is not None:
+                        stats['deltas'] += 1
+                        stats['delta_bytes'] += nbytes
+                        stats['saved'] += pkg['size'] - nbytes
+                    print("[pkgfetch] ({}/{}) {}{}".format(stats['done'], total, pkg['nevra'],
+                        ' (delta from {})'.format(delta.old_nevra) if delta is not None else ''))
+        finally:
+            pool.close()
+
+    started = time.time()
+    print("[pkgfetch] {} of {} packages to download, {} in store".format(total, len(manifest['packages']), len(manifest['packages']) - total))
+    workers = [ threading.Thread(target=worker) for _ in range(min(jobs, total)) ]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = max(time.time() - started, 0.001)
+    print("[pkgfetch] downloaded {} packages, {:.1f} MiB in {:.1f}s ({:.1f} MiB/s)".format(
+        stats['done'], stats['bytes'] / 1048576.0, elapsed, stats['bytes'] / 1048576.0 / elapsed))
+    if stats['deltas']:
+        print("[pkgfetch] {} packages rebuilt from {:.1f} MiB of deltas, {:.1f} MiB saved".format(
+            stats['deltas'], stats['delta_bytes'] / 1048576.0, stats['saved'] / 1048576.0))
+    if stats['errors']:
+        raise FetchError('{} packages failed:\n{}'.format(len(stats['errors']), '\n'.join(stats['errors'])))
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--retries', type=int, default=5)
+    parser.add_argument('--timeout', type=int, default=60)
+    subparsers = parser.add_subparsers(dest='action')
+    packages_parser = subparsers.add_parser('packages')
+    packages_parser.add_argument('--store', required=True)
+    packages_parser.add_argument('--manifest', required=True)
+    packages_parser.add_argument('--jobs', type=int, default=8)
+    packages_parser.add_argument('--no-deltas', action='store_true', help='download full packages only, even where a delta RPM is published')
+    metadata_parser = subparsers.add_parser('metadata')
+    metadata_parser.add_argument('--baseurl', required=True)
+    metadata_parser.add_argument('--types', required=True, help='comma-separated data types in order of preference')
+    metadata_parser.add_argument('--output', required=True)
+    args = parser.parse_args()
+    try:
+        if args.action == 'packages':
+            fetch_packages(PackageStore(args.store), load_manifest(args.manifest), args.jobs, args.retries, args.timeout, not args.no_deltas)
+        else:
+            pool = ConnectionPool(args.timeout)
+            try:
+                fetch_repo_metadata(pool, args.baseurl, args.types.split(','), args.output, args.retries)
+            finally:
+                pool.close()
+    except (FetchError, RepoDataError) as exc:
+        print("ERROR: {}".format(exc))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+from __future__ import print_function
+import argparse
+import json
+import os
+import os.path
+import sys
+
+from pkgclosure import ClosureError, PackageIndex, load_comps_groups, load_kickstart_package_specs, load_package_specs, parse_primary, resolve_closure
+from pkgfetch import ConnectionPool, FetchError, fetch_repo_metadata
+from pkgstore import PackageStore
+from repodata import RepoDataError, parse_repomd
+from repos import load_repos, repos_config_path
+
+
+# The lock file pins the whole package closure by NEVRA and checksum. It has the layout of
+# a package manifest plus the inputs it was resolved from and the repo revisions, so it can
+# be fed to pkgfetch.py/pkgstore.py as is once 'repos' is pointed at the current mirrors.
+
+LOCK_FORMAT_VERSION = 1
+
+
+def load_lock(path):
+    if not os.path.isfile(path):
+        return None
+    with open(path, mode='rt') as fh:
+        lock = json.load(fh)
+    if lock.get('version') != LOCK_FORMAT_VERSION:
+        return None
+    return lock
+
+
+def save_lock(path, lock):
+    with open(path + '.tmp', mode='wt') as fh:
+        json.dump(lock, fh, indent=2, sort_keys=True)
+        fh.write('\n')
+    os.rename(path + '.tmp', path)
+
+
+def fetch_primary(pool, repos, metadata_dir):
+    # primary data of every repo is kept in 'metadata_dir' and only re-fetched when it changes
+    primaries = {}
+    for repo in repos:
+        repo_dir = os.path.join(metadata_dir, repo.id)
+        if not os.path.isdir(repo_dir):
+            os.makedirs(repo_dir)
+        output_file = os.path.join(repo_dir, 'primary.xml')
+        fetch_repo_metadata(pool, repo.baseurl, ['primary'], output_file)
+        revision = parse_repomd(os.path.join(repo_dir, 'repomd.xml')).revision
+        primaries[repo.id] = (output_file, revision)
+    return primaries
+
+
+def diff_packages(old_packages, new_packages):
+    old = dict([ (pkg['name'] + '.' + pkg['arch'], pkg) for pkg in old_packages ])
+    new = dict([ (pkg['name'] + '.' + pkg['arch'], pkg) for pkg in new_packages ])
+    added = [ new[key] for key in sorted(new) if key not in old ]
+    removed = [ old[key] for key in sorted(old) if key not in new ]
+    changed = [ (old[key], new[key]) for key in sorted(new) if key in old and old[key]['checksum'] != new[key]['checksum'] ]
+    return added, removed, changed
+
+
+def print_diff(added, removed, changed, unchanged, store):
+    for pkg in added:
+        print("[pkglock] + {} ({})".format(pkg['nevra'], pkg['repo']))
+    for pkg in removed:
+        print("[pkglock] - {} ({})".format(pkg['nevra'], pkg['repo']))
+    for old, new in changed:
+        print("[pkglock] ~ {} -> {} ({})".format(old['nevra'], new['nevra'], new['repo']))
+    summary = "[pkglock] {} added, {} removed, {} changed, {} unchanged".format(len(added), len(removed), len(changed), unchanged)
+    if store is not None:
+        to_fetch = [ pkg for pkg in added + [ new for _, new in changed ] if not store.contains(pkg) ]
+        summary += "; {} packages ({:.1f} MiB) to download".format(len(to_fetch), sum([ pkg['size'] for pkg in to_fetch ]) / 1048576.0)
+    print(summary)
+
+
+def collect_specs(list_files, kickstart_files):
+    specs = []
+    for path in list_files:
+        specs += load_package_specs(path)
+    for path in kickstart_files:
+        specs += load_kickstart_package_specs(path)
+    # the same package may be listed by several inputs
+    return sorted(set(specs))
+
+
+def refresh_lock(lock_file, repos, comps_file, specs, metadata_dir, store=None):
+    pool = ConnectionPool(60)
+    try:
+        primaries = fetch_primary(pool, repos, metadata_dir)
+    finally:
+        pool.close()
+
+    index = PackageIndex()
+    for repo in repos:
+        for pkg in parse_primary(primaries[repo.id][0], repo.id):
+            index.add(pkg)
+    closure = resolve_closure(index, load_comps_groups(comps_file), specs)
+
+    lock = {
+        'version': LOCK_FORMAT_VERSION,
+        'specs': specs,
+        'revisions': dict([ (repo.id, primaries[repo.id][1]) for repo in repos ]),
+        'repos': dict([ (repo.id, repo.baseurl) for repo in repos ]),
+        'packages': [ pkg.manifest_entry() for pkg in closure ],
+    }
+    old_lock = load_lock(lock_file)
+    old_packages = old_lock['packages'] if old_lock else []
+    added, removed, changed = diff_packages(old_packages, lock['packages'])
+    print_diff(added, removed, changed, len(lock['packages']) - len(added) - len(changed), store)
+    if old_lock is None or added or removed or changed or old_lock['specs'] != specs:
+        save_lock(lock_file, lock)
+        print("[pkglock] lock file '{}' updated".format(lock_file))
+    else:
+        print("[pkglock] lock file '{}' is up to date".format(lock_file))
+    return lock
+
+
+def verify_lock(lock, resolved_file):
+    # The closure of pkgclosure.py against yum's own resolution of the same package lists
+    # (resolve-packages.py): yum resolves them once more on the node and in create-golden.sh,
+    # a package it picks that the lock does not have would be missing in the yumdata repo.
+    with open(resolved_file, mode='rt') as fh:
+        resolved = json.load(fh)
+    only_yum, only_lock, changed = diff_packages(lock['packages'], resolved['packages'])
+    for pkg in only_lock:
+        print("[pkglock] only in the lock: {} ({})".format(pkg['nevra'], pkg['repo']))
+    for pkg in only_yum:
+        print("[pkglock] only in yum's resolution: {} ({})".format(pkg['nevra'], pkg['repo']))
+    for locked, pkg in changed:
+        print("[pkglock] lock has {}, yum picks {}".format(locked['nevra'], pkg['nevra']))
+    differences = len(only_yum) + len(only_lock) + len(changed)
+    if differences:
+        raise ClosureError("The lock file differs from yum's resolution in {} packages".format(differences))
+    print("[pkglock] lock file matches yum's resolution of {} packages".format(len(lock['packages'])))
+
+
+def write_manifest(lock, repos, output_file):
+    # baseurls come from the current repos config, e.g. a local mirror of a snapshot
+    baseurls = dict([ (repo.id, repo.baseurl) for repo in repos ])
+    missing = sorted(set([ pkg['repo'] for pkg in lock['packages'] if pkg['repo'] not in baseurls ]))
+    if missing:
+        raise ClosureError("Repos used by the lock file are not configured: {}".format(', '.join(missing)))
+    manifest = {'repos': dict([ (repo_id, baseurls[repo_id]) for repo_id in lock['repos'] if repo_id in baseurls ]), 'packages': lock['packages']}
+    with open(output_file, mode='wt') as fh:
+        json.dump(manifest, fh, indent=2, sort_keys=True)
+    print("[pkglock] {} locked packages written into '{}'".format(len(lock['packages']), output_file))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lock', required=True)
+    parser.add_argument('--repos-config', default=repos_config_path())
+    parser.add_argument('--packages', action='append', default=[], help='file with a package or @group per line')
+    parser.add_argument('--kickstart', action='append', default=[], help='kickstart file to take the %%packages section from')
+    subparsers = parser.add_subparsers(dest='action')
+    refresh_parser = subparsers.add_parser('refresh', help='resolve the closure again and update the lock file')
+    refresh_parser.add_argument('--comps', required=True)
+    refresh_parser.add_argument('--metadata-dir', required=True)
+    refresh_parser.add_argument('--store')
+    subparsers.add_parser('check', help='exit with 1 if the lock file is missing or was resolved from other inputs')
+    verify_parser = subparsers.add_parser('verify', help="fail if the locked closure differs from yum's resolution")
+    verify_parser.add_argument('--resolved', required=True, help='package manifest written by resolve-packages.py')
+    manifest_parser = subparsers.add_parser('manifest', help='write the locked packages as a package manifest')
+    manifest_parser.add_argument('--output', required=True)
+    args = parser.parse_args()
+
+    specs = collect_specs(args.packages, args.kickstart)
+    try:
+        if args.action == 'refresh':
+            store = PackageStore(args.store) if args.store else None
+            refresh_lock(args.lock, load_repos(args.repos_config), args.comps, specs, args.metadata_dir, store)
+        elif args.action == 'check':
+            lock = load_lock(args.lock)
+            if lock is None or lock['specs'] != specs:
+                print("[pkglock] lock file '{}' is missing or out of date".format(args.lock))
+                sys.exit(1)
+            print("[pkglock] lock file '{}' is up to date with its inputs".format(args.lock))
+        elif args.action == 'verify':
+            lock = load_lock(args.lock)
+            if lock is None:
+                raise ClosureError("No lock file '{}', run 'make refresh' to resolve it".format(args.lock))
+            verify_lock(lock, args.resolved)
+        else:
+            lock = load_lock(args.lock)
+            if lock is None:
+                raise ClosureError("No lock file '{}', run 'make refresh' to resolve it".format(args.lock))
+            write_manifest(lock, load_repos(args.repos_config), args.output)
+    except (ClosureError, FetchError, RepoDataError) as exc:
+        print("ERROR: {}".format(exc))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
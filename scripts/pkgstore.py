@@ -0,0 +1,153 @@
+from __future__ import print_function
+import argparse
+import errno
+import fcntl
+import json
+import os
+import os.path
+import shutil
+import time
+
+from repodata import file_checksum
+
+
+FICLONE = 0x40049409
+
+
+class PackageStoreError(Exception):
+    def __init__(self, text):
+        Exception.__init__(self, text)
+
+
+def reflink(src, dst):
+    # FICLONE shares the extents of 'src' on btrfs/xfs instead of copying the data
+    with open(src, mode='rb') as src_fh:
+        with open(dst, mode='wb') as dst_fh:
+            try:
+                fcntl.ioctl(dst_fh.fileno(), FICLONE, src_fh.fileno())
+            except (IOError, OSError):
+                return False
+    shutil.copystat(src, dst)
+    return True
+
+
+def link_or_copy(src, dst):
+    # hardlink, otherwise reflink, and a plain copy as the last resort
+    try:
+        os.link(src, dst)
+    except OSError as exc:
+        if exc.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            raise
+        if not reflink(src, dst):
+            shutil.copy2(src, dst)
+
+
+def package_mtime(checksum):
+    # createrepo writes the file mtime of every package into primary.xml, and '--update'
+    # reads a package again only when its path, size or mtime changed. Taken from the
+    # checksum, the mtime does not depend on when the package was downloaded, and a rebuild
+    # under the same NEVRA and size still gets a new one. 28 bits keep it before 1979, well
+    # behind the atime cachectl.py goes by.
+    return int(checksum[:7], 16)
+
+
+def load_manifest(path):
+    with open(path, mode='rt') as fh:
+        return json.load(fh)
+
+
+class PackageStore:
+    # Packages are kept as '<root>/rpms/<nevra>/<checksum_type>-<checksum>.rpm', so a changed
+    # rebuild of the same NEVRA never shadows the previous one and a lookup is a single stat().
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def path_of(self, pkg):
+        return os.path.join(self.root, 'rpms', pkg['nevra'], '{}-{}.rpm'.format(pkg['checksum_type'], pkg['checksum']))
+
+    def contains(self, pkg):
+        path = self.path_of(pkg)
+        return os.path.isfile(path) and os.path.getsize(path) == pkg['size']
+
+    def find_nevra(self, nevra):
+        # any stored build of 'nevra', None without one; the base of a delta RPM
+        nevra_dir = os.path.join(self.root, 'rpms', nevra)
+        if not os.path.isdir(nevra_dir):
+            return None
+        for name in sorted(os.listdir(nevra_dir)):
+            if name.endswith('.rpm'):
+                return os.path.join(nevra_dir, name)
+        return None
+
+    def touch(self, pkg):
+        # marks the package as used for cachectl.py's LRU eviction; mtime stays the one of
+        # its checksum, createrepo --update compares it
+        os.utime(self.path_of(pkg), (time.time(), package_mtime(pkg['checksum'])))
+
+    def add(self, pkg, src_path):
+        actual = file_checksum(src_path, pkg['checksum_type'])
+        if actual != pkg['checksum']:
+            raise PackageStoreError("Checksum mismatch for '{}': expected {}, got {}".format(src_path, pkg['checksum'], actual))
+        tmp_path = self.tmp_path_of(pkg)
+        link_or_copy(src_path, tmp_path)
+        return self.commit(pkg, tmp_path)
+
+    def tmp_path_of(self, pkg):
+        # a fresh location inside the store to put a package into before commit()
+        path = self.path_of(pkg) + '.tmp'
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        if os.path.exists(path):
+            os.remove(path)
+        return path
+
+    def commit(self, pkg, tmp_path):
+        path = self.path_of(pkg)
+        os.rename(tmp_path, path)
+        return path
+
+
+def link_packages(store, manifest, dest_dir):
+    if not os.path.isdir(dest_dir):
+        os.makedirs(dest_dir)
+    for pkg in manifest['packages']:
+        if not store.contains(pkg):
+            raise PackageStoreError("Package '{}' is missing in store '{}'".format(pkg['nevra'], store.root))
+        dst = os.path.join(dest_dir, os.path.basename(pkg['location']))
+        if os.path.exists(dst):
+            os.remove(dst)
+        store.touch(pkg)
+        link_or_copy(store.path_of(pkg), dst)
+    print("[pkgstore] linked {} packages from store into '{}'".format(len(manifest['packages']), dest_dir))
+
+
+def import_packages(store, manifest, src_dir):
+    imported = 0
+    for pkg in manifest['packages']:
+        if store.contains(pkg):
+            continue
+        src = os.path.join(src_dir, os.path.basename(pkg['location']))
+        if not os.path.isfile(src):
+            raise PackageStoreError("Package '{}' not found in '{}'".format(pkg['nevra'], src_dir))
+        store.add(pkg, src)
+        imported += 1
+    print("[pkgstore] imported {} new packages into store '{}'".format(imported, store.root))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('action', choices=['link', 'import'])
+    parser.add_argument('--store', required=True)
+    parser.add_argument('--manifest', required=True)
+    parser.add_argument('--packages', required=True)
+    args = parser.parse_args()
+    store = PackageStore(args.store)
+    manifest = load_manifest(args.manifest)
+    if args.action == 'link':
+        link_packages(store, manifest, args.packages)
+    else:
+        import_packages(store, manifest, args.packages)
+
+
+if __name__ == '__main__':
+    main()
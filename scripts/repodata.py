@@ -0,0 +1,128 @@
+from __future__ import print_function
+import argparse
+import hashlib
+import os.path
+
+try:
+    import xml.etree.cElementTree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+
+NS_REPO = '{http://linux.duke.edu/metadata/repo}'
+CHECKSUM_ALGORITHMS = {'sha': 'sha1', 'sha1': 'sha1', 'sha256': 'sha256', 'sha512': 'sha512', 'md5': 'md5'}
+
+
+class RepoDataError(Exception):
+    def __init__(self, text):
+        Exception.__init__(self, text)
+
+
+def new_checksum_state(checksum_type):
+    algorithm = CHECKSUM_ALGORITHMS.get(checksum_type)
+    if algorithm is None:
+        raise RepoDataError("Unsupported checksum type '{}'".format(checksum_type))
+    return hashlib.new(algorithm)
+
+
+def file_checksum(path, checksum_type):
+    state = new_checksum_state(checksum_type)
+    with open(path, mode='rb') as fh:
+        while True:
+            chunk = fh.read(1024 * 1024)
+            if not chunk:
+                break
+            state.update(chunk)
+    return state.hexdigest()
+
+
+class RepoDataRecord:
+    def __init__(self, data_type):
+        self.type = data_type
+        self.location = None
+        self.checksum_type = None
+        self.checksum = None
+        self.open_checksum_type = None
+        self.open_checksum = None
+        self.size = None
+        self.open_size = None
+        self.timestamp = None
+
+
+class RepoMetadata:
+    def __init__(self):
+        self.revision = None
+        self.records = {}
+
+    def get(self, data_type):
+        return self.records.get(data_type)
+
+    def first_of(self, data_types):
+        for data_type in data_types:
+            if data_type in self.records:
+                return self.records[data_type]
+        return None
+
+
+def _int_or_none(value):
+    return int(value) if value is not None else None
+
+
+def parse_repomd(source):
+    # 'source' is a path or a file object; everything is picked up in a single pass
+    repomd = RepoMetadata()
+    root = ET.parse(source).getroot()
+    repomd.revision = root.findtext(NS_REPO + 'revision')
+    for data in root.findall(NS_REPO + 'data'):
+        record = RepoDataRecord(data.get('type'))
+        location = data.find(NS_REPO + 'location')
+        if location is None or not location.get('href'):
+            raise RepoDataError("No location for data type '{}'".format(record.type))
+        record.location = location.get('href')
+        checksum = data.find(NS_REPO + 'checksum')
+        if checksum is not None:
+            record.checksum_type = checksum.get('type')
+            record.checksum = checksum.text.strip()
+        open_checksum = data.find(NS_REPO + 'open-checksum')
+        if open_checksum is not None:
+            record.open_checksum_type = open_checksum.get('type')
+            record.open_checksum = open_checksum.text.strip()
+        record.size = _int_or_none(data.findtext(NS_REPO + 'size'))
+        record.open_size = _int_or_none(data.findtext(NS_REPO + 'open-size'))
+        record.timestamp = _int_or_none(data.findtext(NS_REPO + 'timestamp'))
+        repomd.records[record.type] = record
+    return repomd
+
+
+def verify_file(path, record):
+    if not os.path.isfile(path):
+        raise RepoDataError("File not found: '{}'".format(path))
+    if record.size is not None and os.path.getsize(path) != record.size:
+        raise RepoDataError("Size mismatch for '{}': expected {}, got {}".format(path, record.size, os.path.getsize(path)))
+    if record.checksum is not None:
+        actual = file_checksum(path, record.checksum_type)
+        if actual != record.checksum:
+            raise RepoDataError("Checksum mismatch for '{}': expected {}, got {}".format(path, record.checksum, actual))
+
+
+def is_valid_file(path, record):
+    try:
+        verify_file(path, record)
+    except RepoDataError:
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('repomd')
+    args = parser.parse_args()
+    repomd = parse_repomd(args.repomd)
+    print('revision: {}'.format(repomd.revision))
+    for data_type in sorted(repomd.records):
+        record = repomd.records[data_type]
+        print('{:<24}{:<72}{}:{} {}'.format(data_type, record.location, record.checksum_type, record.checksum, record.size))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+from __future__ import print_function
+import argparse
+import os.path
+import sys
+
+try:
+    import ConfigParser as configparser
+except ImportError:
+    import configparser
+
+
+DIR_HERE = os.path.abspath(os.path.dirname(__file__))
+DEFAULT_REPOS_CONFIG = os.path.join(DIR_HERE, 'repos.cfg')
+KICKSTART_REPOS_PLACEHOLDER = '@REPOS@'
+
+
+class Repo:
+    def __init__(self, repo_id, baseurl, live):
+        self.id = repo_id
+        self.baseurl = baseurl
+        self.live = live
+
+
+def repos_config_path():
+    return os.environ.get('REPOS_CONFIG') or DEFAULT_REPOS_CONFIG
+
+
+def load_repos(path):
+    with open(path, mode='rb') as _:
+        pass
+    config = configparser.RawConfigParser()
+    config.read(path)
+    repos = []
+    for section in config.sections():
+        baseurl = config.get(section, 'baseurl').strip()
+        live = config.has_option(section, 'live') and config.getboolean(section, 'live')
+        repos.append(Repo(section, baseurl, live))
+    return repos
+
+
+def save_repos(path, repos):
+    config = configparser.RawConfigParser()
+    for repo in repos:
+        config.add_section(repo.id)
+        config.set(repo.id, 'baseurl', repo.baseurl)
+        config.set(repo.id, 'live', 'yes' if repo.live else 'no')
+    with open(path, mode='wt') as fh:
+        config.write(fh)
+
+
+def format_yum_repos(repos):
+    lines = []
+    for repo in repos:
+        lines += ['[{}]'.format(repo.id), 'name={}'.format(repo.id), 'baseurl={}'.format(repo.baseurl), 'enabled=1', 'gpgcheck=0', '']
+    return '\n'.join(lines)
+
+
+def format_kickstart_repos(repos):
+    return '\n'.join([ 'repo --name={} --baseurl={}'.format(repo.id, repo.baseurl) for repo in repos if repo.live ])
+
+
+def render_kickstart(template_file, output_file, repos):
+    with open(template_file, mode='rt') as fh:
+        content = fh.read()
+    if KICKSTART_REPOS_PLACEHOLDER not in content:
+        raise Exception("No '{}' placeholder in '{}'".format(KICKSTART_REPOS_PLACEHOLDER, template_file))
+    with open(output_file, mode='wt') as fh:
+        fh.write(content.replace(KICKSTART_REPOS_PLACEHOLDER, format_kickstart_repos(repos)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config', default=repos_config_path())
+    subparsers = parser.add_subparsers(dest='action')
+    subparsers.add_parser('yum-conf')
+    baseurl_parser = subparsers.add_parser('baseurl')
+    baseurl_parser.add_argument('repo')
+    render_parser = subparsers.add_parser('render-kickstart')
+    render_parser.add_argument('--template', required=True)
+    render_parser.add_argument('--output', required=True)
+    args = parser.parse_args()
+
+    repos = load_repos(args.config)
+    if args.action == 'yum-conf':
+        print(format_yum_repos(repos))
+    elif args.action == 'baseurl':
+        matched = [ repo.baseurl for repo in repos if repo.id == args.repo ]
+        if not matched:
+            print("ERROR: repo '{}' not found in '{}'".format(args.repo, args.config), file=sys.stderr)
+            sys.exit(1)
+        print(matched[0])
+    else:
+        render_kickstart(args.template, args.output, repos)
+
+
+if __name__ == '__main__':
+    main()
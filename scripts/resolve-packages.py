@@ -0,0 +1,122 @@
+from __future__ import print_function
+import argparse
+import json
+import os.path
+import yum
+from yum.constants import TS_INSTALL_STATES
+
+from pkgclosure import load_kickstart_package_excludes, load_kickstart_package_specs, load_package_specs
+from repos import load_repos, repos_config_path
+
+
+class ResolveError(Exception):
+    def __init__(self, text):
+        Exception.__init__(self, text)
+
+
+def transaction_order(yb, members):
+    # File names of the transaction's packages in the order rpm installs them: the
+    # transaction set is populated and ordered the way yum does it before running it,
+    # without running it. Nothing is installed into the installroot.
+    pos = [ txmbr.po for txmbr in members ]
+    problems = yb.downloadPkgs(pos)
+    if problems:
+        raise ResolveError("Can't read packages: {}".format('; '.join([ str(p) for p in problems.values() ])))
+    yb.populateTs(keepold=0)
+    yb.ts.check()
+    if yb.ts.order() != 0:
+        raise ResolveError("Can't order the transaction")
+    by_nvra = dict([ ((po.name, po.version, po.release, po.arch), po) for po in pos ])
+    order = []
+    for te in yb.ts.ts:
+        po = by_nvra.get((te.N(), te.V(), te.R(), te.A()))
+        if po is not None:
+            order.append(os.path.basename(po.relativepath))
+    return order
+
+
+def resolve_packages(config_file, installroot, specs, enabled_repos=None, excludes=(), with_order=False):
+    yb = yum.YumBase()
+    yb.preconf.fn = config_file
+    yb.preconf.root = installroot
+    yb.preconf.releasever = '/'
+    yb.preconf.debuglevel = 0
+    yb.preconf.errorlevel = 0
+    try:
+        if enabled_repos is not None:
+            for repo in yb.repos.listEnabled():
+                if repo.id not in enabled_repos:
+                    yb.repos.disableRepo(repo.id)
+        for spec in specs:
+            if spec.startswith('@'):
+                yb.selectGroup(spec[1:])
+            else:
+                yb.install(pattern=spec)
+        for name in excludes:
+            yb.tsInfo.deselect(name)
+        rescode, restring = yb.buildTransaction()
+        if rescode != 2:
+            raise ResolveError("Can't resolve package set: {}".format('; '.join(restring)))
+
+        repos = {}
+        packages = []
+        for txmbr in yb.tsInfo.getMembersWithState(output_states=TS_INSTALL_STATES):
+            po = txmbr.po
+            checksum_type, checksum = po.returnIdSum()
+            repos[po.repoid] = po.repo.urls[0]
+            packages.append({
+                'nevra': po.ui_nevra,
+                'name': po.name,
+                'arch': po.arch,
+                'repo': po.repoid,
+                'location': po.relativepath,
+                'checksum_type': checksum_type,
+                'checksum': checksum,
+                'size': int(po.packagesize),
+            })
+        packages.sort(key=lambda pkg: pkg['nevra'])
+        manifest = {'repos': repos, 'packages': packages}
+        if with_order:
+            manifest['order'] = transaction_order(yb, yb.tsInfo.getMembersWithState(output_states=TS_INSTALL_STATES))
+        return manifest
+    finally:
+        yb.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config', required=True)
+    parser.add_argument('--installroot', required=True)
+    parser.add_argument('--packages', help='file with a package or @group per line')
+    parser.add_argument('--kickstart', help='kickstart file to take the %%packages section from')
+    parser.add_argument('--extra', action='append', default=[], help='additional package to resolve')
+    parser.add_argument('--with-excludes', action='store_true', help="leave out the '-name' lines of the kickstart's %%packages, as anaconda does")
+    parser.add_argument('--order', help='file to write the package file names into, in the order rpm installs them')
+    parser.add_argument('--live-only', action='store_true', help="resolve against the repos marked 'live' in the repos config only")
+    parser.add_argument('--output', required=True)
+    args = parser.parse_args()
+    specs = list(args.extra)
+    if args.packages:
+        specs += load_package_specs(args.packages)
+    excludes = []
+    if args.kickstart:
+        specs += load_kickstart_package_specs(args.kickstart)
+        if args.with_excludes:
+            excludes = load_kickstart_package_excludes(args.kickstart)
+    enabled_repos = None
+    if args.live_only:
+        enabled_repos = [ repo.id for repo in load_repos(repos_config_path()) if repo.live ]
+    manifest = resolve_packages(os.path.abspath(args.config), os.path.abspath(args.installroot), specs, enabled_repos, excludes, args.order is not None)
+    if args.order:
+        order = manifest.pop('order')
+        with open(args.order, mode='wt') as fh:
+            for name in order:
+                fh.write(name + '\n')
+        print("Install order of {} packages written into '{}'".format(len(order), args.order))
+    with open(args.output, mode='wt') as fh:
+        json.dump(manifest, fh, indent=2, sort_keys=True)
+    print("Resolved {} packages into '{}'".format(len(manifest['packages']), args.output))
+
+
+if __name__ == '__main__':
+    main()
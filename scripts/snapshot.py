@@ -0,0 +1,199 @@
+from __future__ import print_function
+import argparse
+import json
+import os
+import os.path
+import sys
+import time
+
+from pkgfetch import ConnectionPool, FetchError, fetch_file_with_retries, package_url
+from pkgstore import PackageStore, PackageStoreError, link_or_copy, load_manifest
+from repodata import RepoDataError, file_checksum, parse_repomd, verify_file
+from repos import Repo, load_repos, repos_config_path, save_repos
+
+
+# A snapshot bundle is a directory with 'index.json' and content-addressed 'objects/'.
+# The index lists, per repo, its repomd.xml and every metadata file it references, and
+# the resolved packages with their NEVRA and checksum. Import rebuilds a local mirror
+# from the objects with hardlinks (or reflinks), so no data is copied where avoidable.
+
+BUNDLE_FORMAT_VERSION = 1
+INDEX_FILE = 'index.json'
+
+
+class SnapshotError(Exception):
+    def __init__(self, text):
+        Exception.__init__(self, text)
+
+
+class ObjectStore:
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def relpath_of(self, checksum_type, checksum):
+        return os.path.join('objects', checksum_type, checksum[:2], checksum)
+
+    def path_of(self, checksum_type, checksum):
+        return os.path.join(self.root, self.relpath_of(checksum_type, checksum))
+
+    def _prepare(self, checksum_type, checksum):
+        path = self.path_of(checksum_type, checksum)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        return path
+
+    def add_file(self, src_path, checksum_type, checksum):
+        path = self._prepare(checksum_type, checksum)
+        if not os.path.exists(path):
+            link_or_copy(src_path, path + '.tmp')
+            os.rename(path + '.tmp', path)
+        return self.relpath_of(checksum_type, checksum)
+
+    def fetch(self, pool, url, checksum_type, checksum):
+        path = self._prepare(checksum_type, checksum)
+        if not os.path.exists(path):
+            fetch_file_with_retries(pool, url, path + '.tmp', checksum_type, checksum)
+            os.rename(path + '.tmp', path)
+        return self.relpath_of(checksum_type, checksum)
+
+
+def export_repo_metadata(pool, objects, repo, tmp_dir):
+    repomd_path = os.path.join(tmp_dir, '{}-repomd.xml'.format(repo.id))
+    fetch_file_with_retries(pool, repo.baseurl.rstrip('/') + '/repodata/repomd.xml', repomd_path)
+    repomd = parse_repomd(repomd_path)
+    repomd_checksum = file_checksum(repomd_path, 'sha256')
+    entry = {
+        'live': repo.live,
+        'baseurl': repo.baseurl,
+        'revision': repomd.revision,
+        'repomd': objects.add_file(repomd_path, 'sha256', repomd_checksum),
+        'metadata': [],
+    }
+    os.remove(repomd_path)
+    for data_type in sorted(repomd.records):
+        record = repomd.records[data_type]
+        url = repo.baseurl.rstrip('/') + '/' + record.location
+        entry['metadata'].append({
+            'type': data_type,
+            'location': record.location,
+            'object': objects.fetch(pool, url, record.checksum_type, record.checksum),
+        })
+    print("[snapshot] repo '{}' revision {}: {} metadata files".format(repo.id, repomd.revision, len(entry['metadata'])))
+    return entry
+
+
+def export_snapshot(repos, manifests, store, bundle_dir):
+    objects = ObjectStore(bundle_dir)
+    tmp_dir = os.path.join(bundle_dir, 'tmp')
+    if not os.path.isdir(tmp_dir):
+        os.makedirs(tmp_dir)
+    pool = ConnectionPool(60)
+    try:
+        index = {'version': BUNDLE_FORMAT_VERSION, 'created': int(time.time()), 'repos': {}, 'packages': []}
+        for repo in repos:
+            index['repos'][repo.id] = export_repo_metadata(pool, objects, repo, tmp_dir)
+
+        seen = set()
+        linked, fetched = 0, 0
+        for manifest in manifests:
+            for pkg in manifest['packages']:
+                key = (pkg['nevra'], pkg['checksum'])
+                if key in seen:
+                    continue
+                seen.add(key)
+                if pkg['repo'] not in index['repos']:
+                    raise SnapshotError("Package '{}' comes from unknown repo '{}'".format(pkg['nevra'], pkg['repo']))
+                entry = dict(pkg)
+                if store is not None and store.contains(pkg):
+                    entry['object'] = objects.add_file(store.path_of(pkg), pkg['checksum_type'], pkg['checksum'])
+                    linked += 1
+                else:
+                    entry['object'] = objects.fetch(pool, package_url(manifest, pkg), pkg['checksum_type'], pkg['checksum'])
+                    fetched += 1
+                index['packages'].append(entry)
+        index['packages'].sort(key=lambda pkg: pkg['nevra'])
+    finally:
+        pool.close()
+    os.rmdir(tmp_dir)
+
+    with open(os.path.join(bundle_dir, INDEX_FILE + '.tmp'), mode='wt') as fh:
+        json.dump(index, fh, indent=2, sort_keys=True)
+    os.rename(os.path.join(bundle_dir, INDEX_FILE + '.tmp'), os.path.join(bundle_dir, INDEX_FILE))
+    print("[snapshot] exported {} packages ({} from store, {} downloaded) into '{}'".format(len(index['packages']), linked, fetched, bundle_dir))
+
+
+def load_index(bundle_dir):
+    with open(os.path.join(bundle_dir, INDEX_FILE), mode='rt') as fh:
+        index = json.load(fh)
+    if index.get('version') != BUNDLE_FORMAT_VERSION:
+        raise SnapshotError("Unsupported snapshot format version: {}".format(index.get('version')))
+    return index
+
+
+def place_object(bundle_dir, relpath, dst):
+    if not os.path.isdir(os.path.dirname(dst)):
+        os.makedirs(os.path.dirname(dst))
+    if os.path.exists(dst):
+        os.remove(dst)
+    link_or_copy(os.path.join(bundle_dir, relpath), dst)
+
+
+def import_snapshot(bundle_dir, mirror_dir, store):
+    index = load_index(bundle_dir)
+    mirror_dir = os.path.abspath(mirror_dir)
+    repos = []
+    for repo_id in sorted(index['repos']):
+        entry = index['repos'][repo_id]
+        repo_dir = os.path.join(mirror_dir, repo_id)
+        place_object(bundle_dir, entry['repomd'], os.path.join(repo_dir, 'repodata', 'repomd.xml'))
+        for md in entry['metadata']:
+            place_object(bundle_dir, md['object'], os.path.join(repo_dir, md['location']))
+        repomd = parse_repomd(os.path.join(repo_dir, 'repodata', 'repomd.xml'))
+        for record in repomd.records.values():
+            verify_file(os.path.join(repo_dir, record.location), record)
+        repos.append(Repo(repo_id, 'file://' + repo_dir + '/', entry['live']))
+        print("[snapshot] repo '{}' revision {} restored in '{}'".format(repo_id, entry['revision'], repo_dir))
+
+    stored = 0
+    for pkg in index['packages']:
+        place_object(bundle_dir, pkg['object'], os.path.join(mirror_dir, pkg['repo'], pkg['location']))
+        if store is not None and not store.contains(pkg):
+            tmp_path = store.tmp_path_of(pkg)
+            link_or_copy(os.path.join(bundle_dir, pkg['object']), tmp_path)
+            store.commit(pkg, tmp_path)
+            stored += 1
+
+    repos_config = os.path.join(mirror_dir, 'repos.cfg')
+    save_repos(repos_config, repos)
+    print("[snapshot] restored {} packages ({} new in store), repos config: '{}'".format(len(index['packages']), stored, repos_config))
+    return repos_config
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='action')
+    export_parser = subparsers.add_parser('export')
+    export_parser.add_argument('--bundle', required=True)
+    export_parser.add_argument('--manifest', action='append', required=True)
+    export_parser.add_argument('--store')
+    export_parser.add_argument('--repos-config', default=repos_config_path())
+    import_parser = subparsers.add_parser('import')
+    import_parser.add_argument('--bundle', required=True)
+    import_parser.add_argument('--mirror', required=True)
+    import_parser.add_argument('--store')
+    args = parser.parse_args()
+
+    store = PackageStore(args.store) if args.store else None
+    try:
+        if args.action == 'export':
+            manifests = [ load_manifest(path) for path in args.manifest ]
+            export_snapshot(load_repos(args.repos_config), manifests, store, args.bundle)
+        else:
+            import_snapshot(args.bundle, args.mirror, store)
+    except (SnapshotError, FetchError, PackageStoreError, RepoDataError) as exc:
+        print("ERROR: {}".format(exc))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
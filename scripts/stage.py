@@ -0,0 +1,205 @@
+from __future__ import print_function
+import argparse
+import json
+import os
+import os.path
+import resource
+import subprocess
+import sys
+import time
+
+
+# Build stages run through 'stage.py run', which records when each one started and ended,
+# what it waited for and what it cost: CPU time and block I/O of the whole process tree,
+# and the bytes its fetchers downloaded. Steps inside a stage are run the same way and are
+# recorded under their parent stage (STAGE_PARENT is passed down in the environment).
+#
+# Downloads are counted by the fetchers themselves (pkgfetch calls add_downloaded()), into
+# a file of the stage named in STAGE_DOWNLOADS_FILE; the interface counters of the host
+# would charge a stage with what the stages running next to it under 'make -j' download.
+# Downloads yum does on its own are not counted.
+#
+# 'stage.py report' then prints the timeline and the critical path: walking back from the
+# stage that finished last, always through the dependency that finished last, gives the
+# chain of stages that determined the total build time.
+
+RECORDS_DIR_ENV = 'STAGE_RECORDS_DIR'
+PARENT_ENV = 'STAGE_PARENT'
+DOWNLOADS_ENV = 'STAGE_DOWNLOADS_FILE'
+BLOCK_SIZE = 512
+
+
+def record_path(records_dir, name, parent):
+    return os.path.join(records_dir, '{}.json'.format('{}-{}'.format(parent, name) if parent else name))
+
+
+def add_downloaded(nbytes, path=None):
+    # one line per download, appended, so the threads of a fetcher and the steps of a
+    # stage can all add to the same file; a no-op outside of a stage
+    path = path or os.environ.get(DOWNLOADS_ENV)
+    if not path or not nbytes:
+        return
+    with open(path, mode='at') as fh:
+        fh.write('{}\n'.format(nbytes))
+
+
+def read_downloaded(path):
+    if not os.path.isfile(path):
+        return 0
+    with open(path, mode='rt') as fh:
+        return sum([ int(ln) for ln in fh if ln.strip() ])
+
+
+def run_stage(records_dir, name, deps, command):
+    if not os.path.isdir(records_dir):
+        os.makedirs(records_dir)
+    parent = os.environ.get(PARENT_ENV) or None
+    env = dict(os.environ)
+    env[RECORDS_DIR_ENV] = records_dir
+    env[PARENT_ENV] = name
+    downloads_path = record_path(records_dir, name, parent)[:-len('.json')] + '.downloads'
+    if os.path.exists(downloads_path):
+        os.remove(downloads_path)
+    env[DOWNLOADS_ENV] = downloads_path
+    print("[stage] {} started".format(name if not parent else parent + '/' + name))
+    sys.stdout.flush()
+
+    usage_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    started = time.time()
+    status = subprocess.call(command, env=env)
+    ended = time.time()
+    usage_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    downloaded = read_downloaded(downloads_path)
+    if os.path.exists(downloads_path):
+        os.remove(downloads_path)
+    # what a step downloaded counts for the stage it is part of as well
+    add_downloaded(downloaded, os.environ.get(DOWNLOADS_ENV))
+
+    record = {
+        'name': name,
+        'parent': parent,
+        'deps': deps,
+        'start': started,
+        'end': ended,
+        'status': status,
+        'cpu_user': usage_after.ru_utime - usage_before.ru_utime,
+        'cpu_system': usage_after.ru_stime - usage_before.ru_stime,
+        'bytes_read': (usage_after.ru_inblock - usage_before.ru_inblock) * BLOCK_SIZE,
+        'bytes_written': (usage_after.ru_oublock - usage_before.ru_oublock) * BLOCK_SIZE,
+        'downloaded': downloaded,
+    }
+    with open(record_path(records_dir, name, parent), mode='wt') as fh:
+        json.dump(record, fh, indent=2, sort_keys=True)
+    print("[stage] {} {} in {:.1f}s".format(name if not parent else parent + '/' + name,
+        'finished' if status == 0 else 'FAILED', ended - started))
+    return status
+
+
+def load_records(records_dir, since=None):
+    records = []
+    if not os.path.isdir(records_dir):
+        return records
+    for filename in os.listdir(records_dir):
+        if not filename.endswith('.json'):
+            continue
+        with open(os.path.join(records_dir, filename), mode='rt') as fh:
+            record = json.load(fh)
+        if since is None or record['start'] >= since:
+            records.append(record)
+    return records
+
+
+def critical_path(stages):
+    # stages that did not run in this build (up to date) are not part of the path
+    if not stages:
+        return []
+    path = [ max(stages.values(), key=lambda r: r['end']) ]
+    while True:
+        deps = [ stages[dep] for dep in path[-1]['deps'] if dep in stages ]
+        if not deps:
+            break
+        path.append(max(deps, key=lambda r: r['end']))
+    path.reverse()
+    return path
+
+
+def build_profile(records):
+    stages = dict([ (r['name'], r) for r in records if not r.get('parent') ])
+    if not stages:
+        return None
+    origin = min([ r['start'] for r in stages.values() ])
+    # stages account for their steps already, only top-level records are summed up
+    net = [ r['downloaded'] for r in stages.values() if r.get('downloaded') is not None ]
+    return {
+        'origin': origin,
+        'wall': max([ r['end'] for r in stages.values() ]) - origin,
+        'stage_time': sum([ r['end'] - r['start'] for r in stages.values() ]),
+        'cpu': sum([ r['cpu_user'] + r['cpu_system'] for r in stages.values() ]),
+        'bytes_read': sum([ r['bytes_read'] for r in stages.values() ]),
+        'bytes_written': sum([ r['bytes_written'] for r in stages.values() ]),
+        'bytes_downloaded': sum(net) if net else None,
+        'critical_path': [ r['name'] for r in critical_path(stages) ],
+        'stages': sorted(records, key=lambda r: r['start']),
+    }
+
+
+def _mib(value):
+    return '{:.1f}'.format(value / 1048576.0) if value is not None else '-'
+
+
+def report(profile):
+    if profile is None:
+        print("[stage] no stages were run")
+        return
+    origin = profile['origin']
+    on_path = set(profile['critical_path'])
+    by_name = dict([ (r['name'], r) for r in profile['stages'] if not r.get('parent') ])
+
+    print('')
+    print('{:<24}{:>8}{:>9}{:>9}{:>10}{:>10}{:>10}  {}'.format('stage', 'start', 'seconds', 'cpu', 'read MiB', 'write MiB', 'dl MiB', 'critical'))
+    for stage in sorted(by_name.values(), key=lambda r: r['start']):
+        rows = [ stage ] + [ r for r in profile['stages'] if r.get('parent') == stage['name'] ]
+        for r in rows:
+            print('{:<24}{:>8.1f}{:>9.1f}{:>9.1f}{:>10}{:>10}{:>10}  {}'.format(
+                r['name'] if not r.get('parent') else '  ' + r['name'], r['start'] - origin, r['end'] - r['start'],
+                r['cpu_user'] + r['cpu_system'], _mib(r['bytes_read']), _mib(r['bytes_written']), _mib(r.get('downloaded')),
+                '*' if r is stage and r['name'] in on_path else ''))
+    print('')
+    print('critical path: {}'.format(' -> '.join([ '{} ({:.1f}s)'.format(name, by_name[name]['end'] - by_name[name]['start']) for name in profile['critical_path'] ])))
+    print('wall time {:.1f}s, stage time {:.1f}s, parallelism {:.2f}, cpu {:.1f}s, read {} MiB, written {} MiB, downloaded {} MiB'.format(
+        profile['wall'], profile['stage_time'], profile['stage_time'] / max(profile['wall'], 0.001), profile['cpu'],
+        _mib(profile['bytes_read']), _mib(profile['bytes_written']), _mib(profile['bytes_downloaded'])))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--records', default=os.environ.get(RECORDS_DIR_ENV), help='directory for the per-stage records')
+    subparsers = parser.add_subparsers(dest='action')
+    run_parser = subparsers.add_parser('run')
+    run_parser.add_argument('--name', required=True)
+    run_parser.add_argument('--after', default='', help='comma-separated stages this one depends on')
+    run_parser.add_argument('command', nargs=argparse.REMAINDER)
+    report_parser = subparsers.add_parser('report')
+    report_parser.add_argument('--since', type=float, help='only stages started at or after this unix time')
+    report_parser.add_argument('--profile', help='write the report as JSON into this file')
+    args = parser.parse_args()
+    if not args.records:
+        parser.error('no records directory, use --records or {}'.format(RECORDS_DIR_ENV))
+
+    if args.action == 'run':
+        command = args.command[1:] if args.command and args.command[0] == '--' else args.command
+        if not command:
+            parser.error('no command given')
+        deps = [ dep for dep in args.after.split(',') if dep ]
+        sys.exit(run_stage(args.records, args.name, deps, command))
+    else:
+        profile = build_profile(load_records(args.records, args.since))
+        report(profile)
+        if args.profile and profile is not None:
+            with open(args.profile, mode='wt') as fh:
+                json.dump(profile, fh, indent=2, sort_keys=True)
+            print("[stage] profile written into '{}'".format(args.profile))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,84 +1,98 @@
-import argparse
-
-
-def strip_groups_info(input_file, output_file):
-    with open(input_file) as fh:
-        lines = [ ln.rstrip('\r\n') for ln in fh.readlines() ]
-
-    output = []
-    group_tag = False
-    process_group = False
-    seen_groups = False
-    process_env = False
-    env_tag = False
-    env_opt = False
-    for i in range(0, len(lines)):
-        ln = lines[i].strip()
-        if ln != '<group>' and not seen_groups:
-            output.append(lines[i])
-        if ln == '<group>':
-            group_tag = True
-            seen_groups = True
-            continue
-        if ln == '</group>':
-            if process_group:
-                output.append(lines[i])
-                process_group = False
-                continue
-        if ln == '<environment>':
-            env_tag = True
-            continue
-        if ln == '</environment>':
-            if process_env:
-                output.append(lines[i])
-                process_env = False
-                continue
-        if group_tag and ln.startswith('<id>'):
-            gr_id = ln[4:ln.find('<',4)]
-            if gr_id in ['core', 'base']:
-                process_group = True
-                output.append(lines[i-1])
-                output.append(lines[i])
-                continue
-        if env_tag and ln.startswith('<id>'):
-            env_id = ln[4:ln.find('<',4)]
-            if env_id in ['minimal']:
-                process_env = True
-                output.append(lines[i-1])
-                output.append(lines[i])
-                continue
-        if process_group:
-            skip = False
-            if ln.startswith('<packagereq') and 'type="optional"' in ln:
-                skip = True
-            if ln.startswith('<packagereq') and 'type="conditional"' in ln:
-                skip = True
-            if not skip:
-                output.append(lines[i])
-            continue
-        if process_env:
-            if ln == '<optionlist>':
-                env_opt = True
-            elif ln == '</optionlist>':
-                env_opt = True
-            else:
-                if not env_opt:
-                    output.append(lines[i])
-            continue
-    output.append('</comps>')
-
-    with open(output_file, mode='w') as fh:
-        for ln in output:
-            fh.writelines([ln, '\n'])
-
-
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument('--input', required=True)
-    parser.add_argument('--output', required=True)
-    args = parser.parse_args()
-    strip_groups_info(args.input, args.output)
-
-
-if __name__ == '__main__':
-    main()
+import argparse
+import gzip
+
+try:
+    import xml.etree.cElementTree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+
+COMPS_HEADER = b'''<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE comps PUBLIC "-//CentOS//DTD Comps info//EN" "comps.dtd">
+<comps>
+'''
+COMPS_FOOTER = b'</comps>\n'
+GZIP_MAGIC = b'\x1f\x8b'
+SKIPPED_PACKAGEREQ_TYPES = ['optional', 'conditional']
+
+
+def open_comps(path):
+    # 'group' and 'group_gz' data are both accepted, compression is detected by content
+    with open(path, mode='rb') as fh:
+        magic = fh.read(2)
+    if magic == GZIP_MAGIC:
+        return gzip.open(path, mode='rb')
+    return open(path, mode='rb')
+
+
+def remove_child(parent, child):
+    # the tail of the removed element is moved over to keep the indentation intact
+    children = list(parent)
+    idx = children.index(child)
+    if idx > 0:
+        children[idx - 1].tail = child.tail
+    else:
+        parent.text = child.tail
+    parent.remove(child)
+
+
+def strip_group(elem):
+    for packagelist in elem.findall('packagelist'):
+        for req in packagelist.findall('packagereq'):
+            if req.get('type') in SKIPPED_PACKAGEREQ_TYPES:
+                remove_child(packagelist, req)
+
+
+def strip_environment(elem):
+    for optionlist in elem.findall('optionlist'):
+        remove_child(elem, optionlist)
+
+
+def strip_groups_info(input_file, output_file, groups, environments):
+    # Only one top-level element of <comps> is held in memory at a time: each one
+    # is written out (or dropped) as soon as its end tag is parsed.
+    with open_comps(input_file) as fh:
+        with open(output_file, mode='wb') as out:
+            out.write(COMPS_HEADER)
+            root = None
+            depth = 0
+            for event, elem in ET.iterparse(fh, events=('start', 'end')):
+                if event == 'start':
+                    depth += 1
+                    if root is None:
+                        root = elem
+                    continue
+                depth -= 1
+                if depth != 1:
+                    continue
+                keep = False
+                if elem.tag == 'group' and elem.findtext('id') in groups:
+                    strip_group(elem)
+                    keep = True
+                elif elem.tag == 'environment' and elem.findtext('id') in environments:
+                    strip_environment(elem)
+                    keep = True
+                if keep:
+                    elem.tail = '\n'
+                    out.write(b'  ')
+                    out.write(ET.tostring(elem, encoding='utf-8'))
+                root.clear()
+            out.write(COMPS_FOOTER)
+
+
+def split_list(value):
+    return [ v.strip() for v in value.split(',') if v.strip() ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input', required=True)
+    parser.add_argument('--output', required=True)
+    parser.add_argument('--groups', required=True, help='comma-separated ids of groups to keep')
+    parser.add_argument('--environments', default='', help='comma-separated ids of environments to keep')
+    args = parser.parse_args()
+    strip_groups_info(args.input, args.output, split_list(args.groups), split_list(args.environments))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+from __future__ import print_function
+import gzip
+import hashlib
+import io
+import os
+import os.path
+import struct
+
+
+# Minimal writer of synthetic binary RPM packages. The packages carry a valid lead,
+# signature and main header (with immutable regions and digests) plus an empty cpio
+# payload, which is enough for rpm, createrepo and yum to read their metadata.
+
+RPM_INT16 = 3
+RPM_INT32 = 4
+RPM_STRING = 6
+RPM_BIN = 7
+RPM_STRING_ARRAY = 8
+RPM_I18NSTRING = 9
+
+RPMTAG_HEADERSIGNATURES = 62
+RPMTAG_HEADERIMMUTABLE = 63
+RPMTAG_HEADERI18NTABLE = 100
+RPMSIGTAG_SHA1 = 269
+RPMSIGTAG_SIZE = 1000
+RPMSIGTAG_MD5 = 1004
+
+RPMSENSE_ANY = 0
+RPMSENSE_EQUAL = 8
+
+HEADER_MAGIC = b'\x8e\xad\xe8\x01\x00\x00\x00\x00'
+LEAD_MAGIC = b'\xed\xab\xee\xdb'
+ALIGNMENT = {RPM_INT16: 2, RPM_INT32: 4}
+
+
+def _to_bytes(value):
+    if isinstance(value, bytes):
+        return value
+    return value.encode('utf-8')
+
+
+def _encode_value(tag_type, value):
+    if tag_type == RPM_INT16:
+        return struct.pack('>{}H'.format(len(value)), *value), len(value)
+    if tag_type == RPM_INT32:
+        return struct.pack('>{}i'.format(len(value)), *value), len(value)
+    if tag_type == RPM_BIN:
+        return value, len(value)
+    if tag_type in (RPM_STRING, RPM_I18NSTRING):
+        return _to_bytes(value) + b'\x00', 1
+    if tag_type == RPM_STRING_ARRAY:
+        return b''.join([_to_bytes(v) + b'\x00' for v in value]), len(value)
+    raise ValueError('unsupported tag type {}'.format(tag_type))
+
+
+def build_header(tags, region_tag):
+    # 'tags' is a list of (tag, type, value); the region entry is added here
+    entries = []
+    data = b''
+    for tag, tag_type, value in sorted(tags, key=lambda t: t[0]):
+        blob, count = _encode_value(tag_type, value)
+        align = ALIGNMENT.get(tag_type, 1)
+        if len(data) % align:
+            data += b'\x00' * (align - len(data) % align)
+        entries.append(struct.pack('>iiii', tag, tag_type, len(data), count))
+        data += blob
+    index_count = len(entries) + 1
+    trailer = struct.pack('>iiii', region_tag, RPM_BIN, -index_count * 16, 16)
+    region = struct.pack('>iiii', region_tag, RPM_BIN, len(data), 16)
+    data += trailer
+    return HEADER_MAGIC + struct.pack('>ii', index_count, len(data)) + region + b''.join(entries) + data
+
+
+def build_lead(name):
+    return LEAD_MAGIC + struct.pack('>BBhh66shh16s', 3, 0, 0, 1, _to_bytes(name)[:65], 1, 5, b'')
+
+
+def empty_payload():
+    trailer_name = b'TRAILER!!!\x00'
+    cpio = b'070701' + b'00000000' * 11 + '{:08X}'.format(len(trailer_name)).encode('ascii') + b'00000000' + trailer_name
+    cpio += b'\x00' * ((4 - len(cpio) % 4) % 4)
+    out = io.BytesIO()
+    gz = gzip.GzipFile(fileobj=out, mode='wb', mtime=0)
+    gz.write(cpio)
+    gz.close()
+    return out.getvalue()
+
+
+class SyntheticPackage:
+    def __init__(self, name, version='1.0', release='1', arch='x86_64', requires=None, files=None, buildtime=1500000000):
+        self.name = name
+        self.version = version
+        self.release = release
+        self.arch = arch
+        self.requires = requires if requires is not None else []
+        self.files = files if files is not None else ['/usr/share/{}/README'.format(name)]
+        self.buildtime = buildtime
+
+    def filename(self):
+        return '{}-{}-{}.{}.rpm'.format(self.name, self.version, self.release, self.arch)
+
+    def _header_tags(self):
+        evr = '{}-{}'.format(self.version, self.release)
+        dirnames = sorted(set([os.path.dirname(f) + '/' for f in self.files]))
+        tags = [
+            (RPMTAG_HEADERI18NTABLE, RPM_STRING_ARRAY, ['C']),
+            (1000, RPM_STRING, self.name),
+            (1001, RPM_STRING, self.version),
+            (1002, RPM_STRING, self.release),
+            (1004, RPM_I18NSTRING, 'Synthetic package {}'.format(self.name)),
+            (1005, RPM_I18NSTRING, 'Synthetic package {} generated for benchmarks.'.format(self.name)),
+            (1006, RPM_INT32, [self.buildtime]),
+            (1007, RPM_STRING, 'localhost'),
+            (1009, RPM_INT32, [64 * len(self.files)]),
+            (1014, RPM_STRING, 'MIT'),
+            (1016, RPM_I18NSTRING, 'Unspecified'),
+            (1021, RPM_STRING, 'linux'),
+            (1022, RPM_STRING, self.arch),
+            (1028, RPM_INT32, [64] * len(self.files)),
+            (1030, RPM_INT16, [0o100644] * len(self.files)),
+            (1037, RPM_INT32, [0] * len(self.files)),
+            (1044, RPM_STRING, '{}-{}.src.rpm'.format(self.name, evr)),
+            (1047, RPM_STRING_ARRAY, [self.name]),
+            (1112, RPM_INT32, [RPMSENSE_EQUAL]),
+            (1113, RPM_STRING_ARRAY, [evr]),
+            (1116, RPM_INT32, [dirnames.index(os.path.dirname(f) + '/') for f in self.files]),
+            (1117, RPM_STRING_ARRAY, [os.path.basename(f) for f in self.files]),
+            (1118, RPM_STRING_ARRAY, dirnames),
+            (1124, RPM_STRING, 'cpio'),
+            (1125, RPM_STRING, 'gzip'),
+            (1126, RPM_STRING, '9'),
+        ]
+        if self.requires:
+            tags += [
+                (1048, RPM_INT32, [RPMSENSE_ANY] * len(self.requires)),
+                (1049, RPM_STRING_ARRAY, self.requires),
+                (1050, RPM_STRING_ARRAY, [''] * len(self.requires)),
+            ]
+        return tags
+
+    def write(self, dir_name):
+        header = build_header(self._header_tags(), RPMTAG_HEADERIMMUTABLE)
+        payload = empty_payload()
+        signature = build_header([
+            (RPMSIGTAG_SHA1, RPM_STRING, hashlib.sha1(header).hexdigest()),
+            (RPMSIGTAG_SIZE, RPM_INT32, [len(header) + len(payload)]),
+            (RPMSIGTAG_MD5, RPM_BIN, hashlib.md5(header + payload).digest()),
+        ], RPMTAG_HEADERSIGNATURES)
+        signature += b'\x00' * ((8 - len(signature) % 8) % 8)
+        path = os.path.join(dir_name, self.filename())
+        with open(path, mode='wb') as fh:
+            fh.write(build_lead('{}-{}-{}'.format(self.name, self.version, self.release)))
+            fh.write(signature)
+            fh.write(header)
+            fh.write(payload)
+        return path
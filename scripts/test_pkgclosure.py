@@ -0,0 +1,184 @@
+from __future__ import print_function
+import os
+import os.path
+import shutil
+import tempfile
+import unittest
+
+from pkgclosure import ClosureError, PackageIndex, compare_evr, parse_primary, provide_matches, resolve_closure, rpmvercmp
+
+
+# Unit tests of the version ordering and the closure resolver, on a primary.xml written
+# from the package list below.
+#
+#   python -m pytest -q scripts/test_pkgclosure.py
+
+# name, arch, (epoch, version, release), provides, requires, files
+PACKAGES = [
+    ('bash', 'x86_64', ('0', '4.2.46', '34.el7'), [], [('libtinfo.so.5()(64bit)', None, None)], ['/bin/sh', '/usr/bin/bash']),
+    ('ncurses-libs', 'x86_64', ('0', '5.9', '14.el7'), [('libtinfo.so.5()(64bit)', None, None)], [], []),
+    ('libfoo', 'x86_64', ('0', '1.0', '1'), [], [], []),
+    ('libfoo', 'x86_64', ('0', '1.2', '1'), [], [], []),
+    ('libfoo', 'x86_64', ('0', '2.0', '1'), [], [], []),
+    ('app', 'x86_64', ('0', '1.0', '1'), [], [('libfoo', 'LT', ('0', '2.0', None)), ('/bin/sh', None, None), ('mta', None, None)], []),
+    ('postfix', 'x86_64', ('2', '2.10.1', '9.el7'), [('mta', None, None)], [], []),
+    ('sendmail', 'x86_64', ('0', '8.14.7', '5.el7'), [('mta', None, None)], [], []),
+    ('broken', 'noarch', ('0', '1', '1'), [], [('nothing-provides-this', None, None)], []),
+    ('tool', 'noarch', ('0', '1', '1'), [], [], []),
+    ('tool', 'x86_64', ('0', '1', '1'), [], [], []),
+    ('i686-only', 'i686', ('0', '1', '1'), [], [], []),
+]
+
+GROUPS = {
+    'core': ['bash', 'app', 'missing-in-repos'],
+}
+
+
+def entry_xml(name, flags, evr):
+    attrs = 'name="{}"'.format(name)
+    if flags:
+        attrs += ' flags="{}" epoch="{}" ver="{}"'.format(flags, evr[0], evr[1])
+        if evr[2]:
+            attrs += ' rel="{}"'.format(evr[2])
+    return '<rpm:entry {}/>'.format(attrs)
+
+
+def primary_xml(packages):
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<metadata xmlns="http://linux.duke.edu/metadata/common" xmlns:rpm="http://linux.duke.edu/metadata/rpm" packages="{}">'.format(len(packages)),
+    ]
+    for idx, (name, arch, evr, provides, requires, files) in enumerate(packages):
+        lines += [
+            '<package type="rpm">',
+            '<name>{}</name><arch>{}</arch>'.format(name, arch),
+            '<version epoch="{}" ver="{}" rel="{}"/>'.format(*evr),
+            '<checksum type="sha256" pkgid="YES">{:064x}</checksum>'.format(idx),
+            '<size package="{}" installed="0" archive="0"/>'.format(1000 + idx),
+            '<location href="Packages/{}-{}-{}.{}.rpm"/>'.format(name, evr[1], evr[2], arch),
+            '<format>',
+            '<rpm:provides>{}</rpm:provides>'.format(''.join([ entry_xml(*p) for p in [(name, 'EQ', evr)] + provides ])),
+            '<rpm:requires>{}</rpm:requires>'.format(''.join([ entry_xml(*r) for r in requires + [('rpmlib(CompressedFileNames)', 'LE', ('0', '3.0.4', '1'))] ])),
+        ]
+        lines += [ '<file>{}</file>'.format(path) for path in files ]
+        lines += ['</format>', '</package>']
+    lines.append('</metadata>')
+    return '\n'.join(lines) + '\n'
+
+
+class RpmVerCmpTest(unittest.TestCase):
+    def test_equal(self):
+        self.assertEqual(rpmvercmp('1.0', '1.0'), 0)
+        self.assertEqual(rpmvercmp('2_0', '2.0'), 0)
+        self.assertEqual(rpmvercmp('1.01', '1.1'), 0)
+        self.assertEqual(rpmvercmp('fc4', 'fc.4'), 0)
+
+    def test_numeric(self):
+        self.assertEqual(rpmvercmp('1.0', '1.0.1'), -1)
+        self.assertEqual(rpmvercmp('1.10', '1.9'), 1)
+        self.assertEqual(rpmvercmp('5.5p1', '5.5p10'), -1)
+
+    def test_alpha(self):
+        self.assertEqual(rpmvercmp('1.0a', '1.0'), 1)
+        self.assertEqual(rpmvercmp('1.0a', '1.0b'), -1)
+        self.assertEqual(rpmvercmp('10xyz', '10.1xyz'), -1)
+        # a numeric segment is newer than an alpha one
+        self.assertEqual(rpmvercmp('1.1', '1.a'), 1)
+        self.assertEqual(rpmvercmp('a', '1'), -1)
+
+    def test_tilde(self):
+        self.assertEqual(rpmvercmp('1.0~rc1', '1.0'), -1)
+        self.assertEqual(rpmvercmp('1.0~rc1', '1.0~rc2'), -1)
+        self.assertEqual(rpmvercmp('1.0~~', '1.0~'), -1)
+        self.assertEqual(rpmvercmp('1.0', '1.0~rc1'), 1)
+
+
+class CompareEvrTest(unittest.TestCase):
+    def test_epoch_wins(self):
+        self.assertEqual(compare_evr(('1', '1.0', '1'), ('0', '9.9', '9')), 1)
+        self.assertEqual(compare_evr((None, '1.0', '1'), ('0', '1.0', '1')), 0)
+
+    def test_version_then_release(self):
+        self.assertEqual(compare_evr(('0', '1.0', '2.el7'), ('0', '1.0', '10.el7')), -1)
+        self.assertEqual(compare_evr(('0', '1.1', '1'), ('0', '1.0', '10')), 1)
+
+    def test_missing_release_matches_any(self):
+        self.assertEqual(compare_evr(('0', '1.0', '5'), ('0', '1.0', None)), 0)
+        self.assertEqual(compare_evr(('0', '1.0', None), ('0', '1.0', '5')), 0)
+
+
+class ProvideMatchesTest(unittest.TestCase):
+    def test_unversioned(self):
+        self.assertTrue(provide_matches(None, (None, None, None), 'GE', ('0', '1.0', None)))
+        self.assertTrue(provide_matches('EQ', ('0', '1.0', '1'), None, (None, None, None)))
+
+    def test_flags(self):
+        provide = ('0', '1.2', '1')
+        self.assertTrue(provide_matches('EQ', provide, 'EQ', ('0', '1.2', None)))
+        self.assertFalse(provide_matches('EQ', provide, 'EQ', ('0', '1.2', '2')))
+        self.assertTrue(provide_matches('EQ', provide, 'LT', ('0', '2.0', None)))
+        self.assertFalse(provide_matches('EQ', provide, 'LT', ('0', '1.2', None)))
+        self.assertTrue(provide_matches('EQ', provide, 'LE', ('0', '1.2', None)))
+        self.assertTrue(provide_matches('EQ', provide, 'GT', ('0', '1.1', None)))
+        self.assertFalse(provide_matches('EQ', provide, 'GT', ('0', '1.2', None)))
+        self.assertTrue(provide_matches('EQ', provide, 'GE', ('0', '1.2', None)))
+        self.assertFalse(provide_matches('EQ', provide, 'GE', ('1', '0.1', None)))
+
+
+class ResolveClosureTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix='test-pkgclosure-')
+        path = os.path.join(self.tmp_dir, 'primary.xml')
+        with open(path, mode='wt') as fh:
+            fh.write(primary_xml(PACKAGES))
+        self.packages = parse_primary(path, 'base')
+        self.index = PackageIndex()
+        for pkg in self.packages:
+            self.index.add(pkg)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def resolve(self, specs, groups=GROUPS):
+        return [ pkg.nevra() for pkg in resolve_closure(self.index, groups, specs) ]
+
+    def test_parse_primary(self):
+        # i686 is not one of the default arches, rpmlib() requirements are dropped
+        self.assertEqual(len(self.packages), len(PACKAGES) - 1)
+        app = [ pkg for pkg in self.packages if pkg.name == 'app' ][0]
+        self.assertEqual(app.requires[0], ('libfoo', 'LT', ('0', '2.0', None)))
+        self.assertEqual(len(app.requires), 3)
+        self.assertEqual(app.location, 'Packages/app-1.0-1.x86_64.rpm')
+        self.assertEqual(app.size, 1005)
+
+    def test_group_and_dependencies(self):
+        self.assertEqual(self.resolve(['@core']), [
+            'app-1.0-1.x86_64',
+            'bash-4.2.46-34.el7.x86_64',
+            'libfoo-1.2-1.x86_64',
+            'ncurses-libs-5.9-14.el7.x86_64',
+            'postfix-2:2.10.1-9.el7.x86_64',
+        ])
+
+    def test_explicit_name_takes_newest(self):
+        self.assertEqual(self.resolve(['libfoo']), ['libfoo-2.0-1.x86_64'])
+
+    def test_native_arch_over_noarch(self):
+        self.assertEqual(self.resolve(['tool']), ['tool-1-1.x86_64'])
+
+    def test_selected_provider_is_reused(self):
+        self.assertIn('sendmail-8.14.7-5.el7.x86_64', self.resolve(['sendmail', 'app']))
+        self.assertNotIn('postfix-2:2.10.1-9.el7.x86_64', self.resolve(['sendmail', 'app']))
+
+    def test_conflicting_versions(self):
+        # the newest libfoo is selected by name, app needs one older than 2.0
+        self.assertRaises(ClosureError, self.resolve, ['libfoo', 'app'])
+
+    def test_errors(self):
+        self.assertRaises(ClosureError, self.resolve, ['no-such-package'])
+        self.assertRaises(ClosureError, self.resolve, ['@no-such-group'])
+        self.assertRaises(ClosureError, self.resolve, ['broken'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,182 @@
+from __future__ import print_function
+import hashlib
+import os
+import os.path
+import shutil
+import stat
+import tempfile
+import unittest
+
+import pkgfetch
+from pkgfetch import fetch_packages
+from pkgstore import PackageStore
+
+
+# Tests of the delta RPM path of the package download, against a file:// mirror with a
+# hand-written prestodelta.xml and an applydeltarpm stand-in that writes a given file as
+# the rebuilt package: a package rebuilt from a delta, a rebuilt package with the wrong
+# checksum, no applydeltarpm and a repo without deltas, the last three falling back to
+# the full package.
+#
+#   python -m pytest -q scripts/test_pkgfetch.py
+
+REPO_ID = 'base'
+OLD_PAYLOAD = b'foo-1.0-1 ' * 200
+NEW_PAYLOAD = b'foo-2.0-1 ' * 400
+DELTA_PAYLOAD = b'delta from foo-1.0-1 to foo-2.0-1'
+NEW_LOCATION = 'Packages/foo-2.0-1.x86_64.rpm'
+DELTA_LOCATION = 'drpms/foo-1.0-1_2.0-1.x86_64.drpm'
+
+PRESTODELTA_XML = '''<?xml version="1.0" encoding="UTF-8"?>
+<prestodelta>
+  <newpackage name="foo" epoch="0" version="2.0" release="1" arch="x86_64">
+    <delta oldepoch="0" oldversion="1.0" oldrelease="1">
+      <filename>{location}</filename>
+      <sequence>foo-1.0-1-0123456789abcdef</sequence>
+      <size>{size}</size>
+      <checksum type="sha256">{checksum}</checksum>
+    </delta>
+  </newpackage>
+</prestodelta>
+'''
+
+REPOMD_XML = '''<?xml version="1.0" encoding="UTF-8"?>
+<repomd xmlns="http://linux.duke.edu/metadata/repo" xmlns:rpm="http://linux.duke.edu/metadata/rpm">
+  <revision>1500000000</revision>
+{records}</repomd>
+'''
+
+REPOMD_RECORD = '''  <data type="{type}">
+    <checksum type="sha256">{checksum}</checksum>
+    <location href="{location}"/>
+    <timestamp>1500000000</timestamp>
+    <size>{size}</size>
+  </data>
+'''
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def write_file(path, data):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, mode='wb') as fh:
+        fh.write(data)
+
+
+def package_entry(nevra, location, payload):
+    return {
+        'nevra': nevra,
+        'name': 'foo',
+        'arch': 'x86_64',
+        'repo': REPO_ID,
+        'location': location,
+        'checksum_type': 'sha256',
+        'checksum': sha256(payload),
+        'size': len(payload),
+    }
+
+
+class DeltaFetchTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix='test-pkgfetch-')
+        self.mirror_dir = os.path.join(self.tmp_dir, 'mirror')
+        write_file(os.path.join(self.mirror_dir, NEW_LOCATION), NEW_PAYLOAD)
+        write_file(os.path.join(self.mirror_dir, DELTA_LOCATION), DELTA_PAYLOAD)
+        self.store = PackageStore(os.path.join(self.tmp_dir, 'store'))
+        old_path = os.path.join(self.tmp_dir, 'foo-1.0-1.x86_64.rpm')
+        write_file(old_path, OLD_PAYLOAD)
+        self.old_path = self.store.add(package_entry('foo-1.0-1.x86_64', 'Packages/foo-1.0-1.x86_64.rpm', OLD_PAYLOAD), old_path)
+        self.pkg = package_entry('foo-2.0-1.x86_64', NEW_LOCATION, NEW_PAYLOAD)
+        self.manifest = {'repos': {REPO_ID: 'file://' + self.mirror_dir}, 'packages': [self.pkg]}
+        self.calls_file = os.path.join(self.tmp_dir, 'applydeltarpm.calls')
+        self.applydeltarpm = pkgfetch.APPLYDELTARPM
+
+    def tearDown(self):
+        pkgfetch.APPLYDELTARPM = self.applydeltarpm
+        shutil.rmtree(self.tmp_dir)
+
+    def write_repomd(self, with_deltas=True):
+        records = ''
+        if with_deltas:
+            prestodelta = PRESTODELTA_XML.format(location=DELTA_LOCATION, size=len(DELTA_PAYLOAD), checksum=sha256(DELTA_PAYLOAD)).encode('utf-8')
+            write_file(os.path.join(self.mirror_dir, 'repodata', 'prestodelta.xml'), prestodelta)
+            records = REPOMD_RECORD.format(type='prestodelta', checksum=sha256(prestodelta), location='repodata/prestodelta.xml', size=len(prestodelta))
+        write_file(os.path.join(self.mirror_dir, 'repodata', 'repomd.xml'), REPOMD_XML.format(records=records).encode('utf-8'))
+
+    def fake_applydeltarpm(self, payload):
+        # 'applydeltarpm -r <old> <delta> <new>' writes 'payload' as <new> and records its
+        # arguments; '-V' only succeeds
+        output_path = os.path.join(self.tmp_dir, 'applydeltarpm.out')
+        write_file(output_path, payload)
+        path = os.path.join(self.tmp_dir, 'applydeltarpm')
+        write_file(path, '''#!/bin/sh
+[ "$1" = '-V' ] && exit 0
+echo "$@" >> '{}'
+cp '{}' "$4"
+'''.format(self.calls_file, output_path).encode('utf-8'))
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+        pkgfetch.APPLYDELTARPM = path
+
+    def calls(self):
+        if not os.path.isfile(self.calls_file):
+            return []
+        with open(self.calls_file, mode='rt') as fh:
+            return [ ln.split() for ln in fh ]
+
+    def fetch(self):
+        return fetch_packages(self.store, self.manifest, jobs=1, retries=0)
+
+    def test_rebuilt_from_delta(self):
+        self.write_repomd()
+        self.fake_applydeltarpm(NEW_PAYLOAD)
+        stats = self.fetch()
+        self.assertEqual(stats['deltas'], 1)
+        self.assertEqual(stats['bytes'], len(DELTA_PAYLOAD))
+        self.assertEqual(stats['saved'], len(NEW_PAYLOAD) - len(DELTA_PAYLOAD))
+        self.assertEqual(len(self.calls()), 1)
+        self.assertEqual(self.calls()[0][:2], ['-r', self.old_path])
+        self.assertTrue(self.store.contains(self.pkg))
+
+    def test_checksum_mismatch_falls_back(self):
+        self.write_repomd()
+        self.fake_applydeltarpm(b'not the package')
+        stats = self.fetch()
+        self.assertEqual(len(self.calls()), 1)
+        self.assertEqual(stats['deltas'], 0)
+        self.assertEqual(stats['bytes'], len(NEW_PAYLOAD))
+        self.assertEqual(stats['errors'], [])
+        self.assertTrue(self.store.contains(self.pkg))
+        with open(self.store.path_of(self.pkg), mode='rb') as fh:
+            self.assertEqual(fh.read(), NEW_PAYLOAD)
+
+    def test_no_applydeltarpm(self):
+        self.write_repomd()
+        pkgfetch.APPLYDELTARPM = os.path.join(self.tmp_dir, 'no-such-applydeltarpm')
+        stats = self.fetch()
+        self.assertEqual(stats['deltas'], 0)
+        self.assertEqual(stats['bytes'], len(NEW_PAYLOAD))
+        self.assertTrue(self.store.contains(self.pkg))
+
+    def test_repo_without_deltas(self):
+        self.write_repomd(with_deltas=False)
+        self.fake_applydeltarpm(NEW_PAYLOAD)
+        stats = self.fetch()
+        self.assertEqual(self.calls(), [])
+        self.assertEqual(stats['deltas'], 0)
+        self.assertEqual(stats['bytes'], len(NEW_PAYLOAD))
+        self.assertTrue(self.store.contains(self.pkg))
+
+    def test_no_deltas_requested(self):
+        self.write_repomd()
+        self.fake_applydeltarpm(NEW_PAYLOAD)
+        stats = fetch_packages(self.store, self.manifest, jobs=1, retries=0, use_deltas=False)
+        self.assertEqual(self.calls(), [])
+        self.assertEqual(stats['deltas'], 0)
+        self.assertTrue(self.store.contains(self.pkg))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,327 @@
+from __future__ import print_function
+import argparse
+import imp
+import json
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import time
+import types
+
+
+# Replays key sequences through the config TUI without a terminal and reports, for every
+# key, the time spent in dispatch (keypress and the sig.* handlers behind MainApp.on_event)
+# and in rendering, and how many screen cells and rows changed. The keys and the frames go
+# the way urwid.MainLoop sends them: keypress() on the topmost widget, then render() of it;
+# the frames go to a screen that only compares them with the previous one.
+#
+# The setup files of the TUI are kept in a temporary directory, next to a made-up
+# /sys/class/net with --nics network interfaces for install/os_netinfo.py to find. The replay fails when a key
+# raises, when a signal has no handler, when a handler fails (in the status bar or an error
+# dialog), or when a key takes longer than --max-key-ms; that guards dispatch and redraw.
+# The root password is hashed by a fixed stub: stock python 2.7 has no crypt.METHOD_SHA512
+# (the live system's has), and the replay times the TUI, not the hash.
+# Needs python 2.7 with urwid, no terminal.
+#
+#   python tui-replay.py --runs 20 --max-key-ms 50
+#   python tui-replay.py --keys my-keys.txt --size 100x30 --json replay.json
+#
+# Key files hold one urwid key name per line ('down', 'enter', 'esc', 'backspace'),
+# optionally repeated as 'key*N', or 'type <text>' for one key per character. Lines
+# starting with '#' are comments.
+
+DIR_HERE = os.path.normpath(os.path.abspath(os.path.dirname(__file__)))
+DEFAULT_KEYS = '''
+# main menu
+down
+down
+up
+# host name
+enter
+enter
+backspace*20
+type replay-host
+down
+enter
+# root password
+enter
+down
+enter
+type replay-secret
+down
+type replay-secret
+down
+enter
+# static network settings
+enter
+down
+down
+enter
+down
+enter
+type 10.0.0.5
+down
+type 255.255.255.0
+down
+type 10.0.0.1
+down
+type 10.0.0.1
+down
+enter
+# invalid host name, the error dialog reopens the host name dialog
+enter
+enter
+backspace*20
+type bad_host!
+down
+enter
+esc
+esc
+# back to DHCP
+enter
+down
+down
+enter
+up
+enter
+'''
+
+
+class ReplayError(Exception):
+    def __init__(self, text):
+        Exception.__init__(self, text)
+
+
+def parse_keys(text):
+    keys = []
+    for ln in text.splitlines():
+        ln = ln.strip()
+        if not ln or ln.startswith('#'):
+            continue
+        if ln.startswith('type '):
+            keys.extend(list(ln[len('type '):]))
+        elif '*' in ln[1:]:
+            key, count = ln.rsplit('*', 1)
+            keys.extend([key.strip()] * int(count))
+        else:
+            keys.append(ln)
+    return keys
+
+
+def canvas_cells(canvas):
+    # rows of (attribute, character)
+    rows = []
+    for row in canvas.content():
+        cells = []
+        for attr, _, text in row:
+            if isinstance(text, bytes):
+                text = text.decode('utf-8', 'replace')
+            cells.extend([ (attr, ch) for ch in text ])
+        rows.append(cells)
+    return rows
+
+
+class ReplayScreen:
+    # stands in for urwid.raw_display.Screen: keeps the last frame and counts what a new one changes
+    def __init__(self):
+        self.rows = []
+
+    def draw_screen(self, size, canvas):
+        rows = canvas_cells(canvas)
+        changed_cells = 0
+        changed_rows = 0
+        for idx, row in enumerate(rows):
+            old = self.rows[idx] if idx < len(self.rows) else []
+            if row == old:
+                continue
+            changed_rows += 1
+            changed_cells += sum([ 1 for a, b in zip(row, old) if a != b ]) + abs(len(row) - len(old))
+        self.rows = rows
+        return changed_cells, changed_rows
+
+    def text(self):
+        return '\n'.join([ ''.join([ ch for _, ch in row ]) for row in self.rows ])
+
+
+def stub_crypt():
+    # assign_rootpw() imports crypt when it runs, it gets this module instead
+    crypt = types.ModuleType('crypt')
+    crypt.METHOD_SHA512 = '$6$'
+    crypt.crypt = lambda word, salt=None: '$6$replay$' + 'x' * 86
+    sys.modules['crypt'] = crypt
+
+
+def load_module(path, name):
+    return imp.load_source(name, path)
+
+
+def write_file(path, text):
+    with open(path, mode='wt') as fh:
+        fh.write(text + '\n')
+
+
+def make_sysfs(sys_dir, nic_count):
+    # eth0 has a link, the others have none
+    for idx in range(nic_count):
+        if_dir = os.path.join(sys_dir, 'eth{}'.format(idx))
+        os.makedirs(os.path.join(if_dir, 'device'))
+        os.symlink('/sys/bus/pci/drivers/e1000', os.path.join(if_dir, 'device', 'driver'))
+        write_file(os.path.join(if_dir, 'type'), '1')
+        write_file(os.path.join(if_dir, 'address'), '52:54:00:12:34:{:02x}'.format(0x56 + idx))
+        write_file(os.path.join(if_dir, 'operstate'), 'up' if idx == 0 else 'down')
+        write_file(os.path.join(if_dir, 'carrier'), '1' if idx == 0 else '0')
+        if idx == 0:
+            write_file(os.path.join(if_dir, 'speed'), '1000')
+
+
+def setup_files(tui, bootstrap, files_dir):
+    # what os-bootstrap.py and the TUI write to /tmp and /root goes to 'files_dir' instead
+    tui.APP_CONFIG_FILE = os.path.join(files_dir, 'os-config.ini')
+    tui.APP_CONFIG_FILE_TMP = os.path.join(files_dir, 'os-config.tmp')
+    tui.HASHED_ROOT_PASSWORD_FILE = os.path.join(files_dir, 'os-config.shadow')
+    tui.HASHED_ROOT_PASSWORD_FILE_TMP = os.path.join(files_dir, 'os-config.shadow.tmp')
+    tui.APP_NO_TIMER_STAMP_FILE = os.path.join(files_dir, 'os-notimer.hook')
+    bootstrap.APP_CONFIG_FILE = tui.APP_CONFIG_FILE
+    for name in os.listdir(files_dir):
+        os.remove(os.path.join(files_dir, name))
+    bootstrap.generate_app_config()
+
+
+def screen_name(app):
+    # the dialog on top, or the main screen
+    widget = app.original_widget
+    return type(getattr(widget, 'top_w', widget)).__name__
+
+
+def dispatch_error(app):
+    # MainApp.on_event() reports a signal without a handler ('!sig...') or a failing
+    # handler ('line=...') in the status bar of the main screen; a failing apply shows
+    # the traceback in an error dialog, while invalid input shows just a message there
+    text = app.view.status_bar.get_text()[0]
+    if text.startswith('!') or text.startswith('line='):
+        return text
+    dialog = getattr(app.original_widget, 'top_w', None)
+    if dialog is not None and hasattr(dialog, 'err_text_bar'):
+        text = dialog.err_text_bar.get_text()[0]
+        if 'Traceback' in text or 'File "' in text:
+            return text.strip().splitlines()[-1]
+    return None
+
+
+def replay(tui, keys, size):
+    app_config = tui.AppConfig()
+    tui.init_app_config(app_config)
+    app = tui.MainApp(app_config, False)
+    screen = ReplayScreen()
+    started = time.time()
+    canvas = app.render(size, focus=True)
+    render_seconds = time.time() - started
+    cells, rows = screen.draw_screen(size, canvas)
+    steps = [{'key': '<start>', 'screen': screen_name(app), 'dispatch': 0.0, 'render': render_seconds, 'cells': cells, 'rows': rows}]
+    for key in keys:
+        exited = False
+        started = time.time()
+        try:
+            app.keypress(size, key)
+        except tui.urwid.ExitMainLoop:
+            exited = True
+        rendered = time.time()
+        canvas = app.render(size, focus=True)
+        finished = time.time()
+        cells, rows = screen.draw_screen(size, canvas)
+        steps.append({'key': key, 'screen': screen_name(app), 'dispatch': rendered - started, 'render': finished - rendered, 'cells': cells, 'rows': rows})
+        error = dispatch_error(app)
+        if error is not None:
+            raise ReplayError("key {} '{}': {}".format(len(steps) - 1, key, error))
+        if exited:
+            break
+    return steps, screen
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--install-dir', default=os.path.join(DIR_HERE, '..', 'install'))
+    parser.add_argument('--keys', help='file with the keys to replay, a walk through every dialog by default')
+    parser.add_argument('--size', default='80x25', help='screen size, COLSxROWS')
+    parser.add_argument('--nics', type=int, default=1, help='network interfaces the TUI finds')
+    parser.add_argument('--runs', type=int, default=5, help='the replay is repeated, per key times are the median')
+    parser.add_argument('--max-key-ms', type=float, help='fail when a key takes longer than this, dispatch and render')
+    parser.add_argument('--show-screen', action='store_true', help='print the last frame')
+    parser.add_argument('--json', help='write the results into this file too')
+    args = parser.parse_args()
+
+    cols, rows = [ int(v) for v in args.size.lower().split('x') ]
+    size = (cols, rows)
+    if args.keys:
+        with open(args.keys, mode='rt') as fh:
+            keys = parse_keys(fh.read())
+    else:
+        keys = parse_keys(DEFAULT_KEYS)
+
+    install_dir = os.path.abspath(args.install_dir)
+    sys.path.insert(0, install_dir)
+    import os_netinfo
+    tui = load_module(os.path.join(install_dir, 'os-config-tui.py'), 'os_config_tui')
+    bootstrap = load_module(os.path.join(install_dir, 'os-bootstrap.py'), 'os_bootstrap')
+    tui.urwid.set_encoding('utf-8')
+    stub_crypt()
+
+    workdir = tempfile.mkdtemp(prefix='tui-replay-')
+    files_dir = os.path.join(workdir, 'files')
+    os.makedirs(files_dir)
+    os_netinfo.SYS_CLASS_NET = os.path.join(workdir, 'sys', 'class', 'net')
+    make_sysfs(os_netinfo.SYS_CLASS_NET, args.nics)
+    runs = []
+    try:
+        for _ in range(args.runs):
+            setup_files(tui, bootstrap, files_dir)
+            steps, screen = replay(tui, keys, size)
+            runs.append(steps)
+    except ReplayError as exc:
+        print('ERROR: {}'.format(exc))
+        exit(1)
+    finally:
+        shutil.rmtree(workdir)
+
+    results = []
+    for idx, step in enumerate(runs[0]):
+        dispatch = median([ r[idx]['dispatch'] for r in runs ])
+        render = median([ r[idx]['render'] for r in runs ])
+        results.append({'index': idx, 'key': step['key'], 'screen': step['screen'], 'dispatch_ms': dispatch * 1000.0,
+            'render_ms': render * 1000.0, 'cells': step['cells'], 'rows': step['rows']})
+
+    print('{:>4}  {:<12}{:<28}{:>12}{:>10}{:>8}{:>6}'.format('#', 'key', 'screen', 'dispatch ms', 'render ms', 'cells', 'rows'))
+    for r in results:
+        print('{:>4}  {:<12}{:<28}{:>12.3f}{:>10.3f}{:>8}{:>6}'.format(r['index'], repr(r['key'])[1:-1] if len(r['key']) == 1 else r['key'],
+            r['screen'], r['dispatch_ms'], r['render_ms'], r['cells'], r['rows']))
+    keyed = results[1:]
+    slowest = max(keyed, key=lambda r: r['dispatch_ms'] + r['render_ms']) if keyed else results[0]
+    print('')
+    print('{} keys, {} runs: dispatch {:.1f}ms, render {:.1f}ms, {} cells changed; slowest key #{} {:.3f}ms'.format(
+        len(keyed), len(runs), sum([ r['dispatch_ms'] for r in keyed ]), sum([ r['render_ms'] for r in keyed ]),
+        sum([ r['cells'] for r in keyed ]), slowest['index'], slowest['dispatch_ms'] + slowest['render_ms']))
+    if args.show_screen:
+        print('')
+        getattr(sys.stdout, 'buffer', sys.stdout).write((screen.text() + '\n').encode('utf-8'))
+
+    if args.json:
+        with open(args.json, mode='wt') as fh:
+            json.dump({'size': args.size, 'runs': len(runs), 'keys': results}, fh, indent=2, sort_keys=True)
+
+    if args.max_key_ms is not None:
+        slow = [ r for r in keyed if r['dispatch_ms'] + r['render_ms'] > args.max_key_ms ]
+        for r in slow:
+            print("ERROR: key #{} '{}' took {:.3f}ms, more than {}ms".format(r['index'], r['key'], r['dispatch_ms'] + r['render_ms'], args.max_key_ms))
+        if slow:
+            exit(1)
+
+
+if __name__ == '__main__':
+    main()